@@ -0,0 +1,9 @@
+"""Runnable performance benchmarks of the data engineering pipeline.
+
+Run them from the ``src`` directory, e.g.::
+
+    python -m benchmarks.bench_linecount --help
+
+Each benchmark writes its results to a JSON file and can compare them with
+a previous run to catch regressions.
+"""
@@ -0,0 +1,114 @@
+"""Local HTTP server standing in for the B3 historical data site, used by
+the tests and by the ingest benchmark instead of the real site."""
+from contextlib import contextmanager
+from typing import Dict, Iterator
+import hashlib
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class B3StandIn(ThreadingHTTPServer):
+    """Local HTTP server standing in for the B3 historical data site.
+
+    ``files`` maps request paths to the bytes served; any other path is a
+    404. Responses carry an ETag and honour If-None-Match and Range/If-Range;
+    a range starting at or past the end of the file is a 416. ``truncate`` maps paths to the number of bytes sent before the
+    connection is dropped, once, and ``stall`` the number of bytes sent
+    before the server stops answering for a second, once. ``connections`` and ``requests`` count what
+    the clients did.
+    """
+
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), B3StandInHandler)
+        self.files = {}
+        self.truncate = {}
+        self.stall = {}
+        self.connections = 0
+        self.requests = []
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}/"
+
+
+class B3StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        self.server.connections += 1
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self.server.requests.append((self.command, self.path, dict(self.headers)))
+        body = self.server.files.get(self.path)
+        if body is None:
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        etag = '"%s"' % hashlib.sha256(body).hexdigest()
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+
+        start = 0
+        requested = self.headers.get("Range", "")
+        if requested.startswith("bytes=") and self.headers.get("If-Range") == etag:
+            start = int(requested[6:].rstrip("-"))
+            if start >= len(body):
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{len(body)}")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            self.send_response(206)
+            self.send_header(
+                "Content-Range", f"bytes {start}-{len(body) - 1}/{len(body)}"
+            )
+        else:
+            self.send_response(200)
+        self.send_header("ETag", etag)
+        self.send_header("Content-Length", str(len(body) - start))
+        self.end_headers()
+
+        stall = self.server.stall.pop(self.path, None)
+        if stall is not None:
+            self.wfile.write(body[start:stall])
+            self.wfile.flush()
+            time.sleep(1)
+            self.close_connection = True
+            return
+        cut = self.server.truncate.pop(self.path, None)
+        if cut is not None:
+            self.wfile.write(body[start:cut])
+            self.close_connection = True
+            return
+        self.wfile.write(body[start:])
+
+
+@contextmanager
+def serving(files: Dict[str, bytes] = None) -> Iterator[B3StandIn]:
+    """Runs a ``B3StandIn`` in a background thread while the block runs.
+
+    Args:
+        files: Request paths x bytes served, e.g.
+            ``{"/COTAHIST_A2020.ZIP": content}``.
+    """
+    server = B3StandIn()
+    server.files = dict(files or {})
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield server
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,292 @@
+"""End-to-end benchmark of the ingest nodes of the data engineering pipeline.
+
+Synthetic COTAHIST files (see ``parser/sintetico.py``) are generated for the
+given years, zipped like the B3 files and served by a local HTTP stand-in of
+the B3 site. Then every stage of the ingestion is timed on its own, each run
+in a new Python process:
+
+- ``download``: ``fetch_all`` of the ZIP files only.
+- ``get_ibov_data``: the node, download and parsing of every year.
+- ``clean_extract``: the node, from the ZIP files on disk.
+- ``data_to_csv/<engine>``: the node with each parser engine, from the TXT
+  files on disk.
+- ``agg_ibov_csv``: the node, over the CSV partitions of every year, since
+  the first day (``full``) and since the last one, as in a daily update
+  (``latest``).
+
+Wall time, rows/s, MB/s and peak RSS of each stage are printed and written
+to a JSON file with the git commit, which can be given back as
+``--baseline`` to compare two commits.
+
+Example (from the src directory)::
+
+    python -m benchmarks.bench_ingest --num-years 3 --records-per-year 500000
+    python -m benchmarks.bench_ingest --baseline previous.json
+"""
+from contextlib import redirect_stderr, redirect_stdout
+from pathlib import Path
+from typing import Any, Dict, List
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import zipfile
+
+from ml_invest.io import WatermarkedCSVDataSet
+from ml_invest.pipelines.data_engineering.download import fetch_all
+from ml_invest.pipelines.data_engineering.nodes_ibov import (
+    agg_ibov_csv, clean_extract, data_to_csv, get_ibov_data, get_ibov_url,
+    get_todays_date)
+from ml_invest.pipelines.data_engineering.parser.sintetico import gerar_arquivo
+
+from .b3_stand_in import serving
+from .harness import (find_regressions, load_results, measure_isolated,
+                      summarize, write_results)
+
+DEFAULT_OUTPUT = (Path(__file__).resolve().parents[2]
+                  / "data" / "08_reporting" / "benchmark_ingest.json")
+
+# Options of BovesParser.ler_arquivo measured by the data_to_csv stage
+ENGINES = {
+    "posicional": {"motor": "posicional", "num_processos": 1},
+    "regex": {"motor": "regex", "num_processos": 1},
+    "numpy": {"motor": "numpy", "num_processos": 1},
+    "posicional-parallel": {"motor": "posicional", "num_processos": None},
+    "numpy-parallel": {"motor": "numpy", "num_processos": None},
+}
+
+IBOV_LINK = {"file": "COTAHIST_A"}
+
+
+def build_fixtures(directory: Path, years: List[int], records_per_year: int,
+                   num_tickers: int) -> Dict[int, Path]:
+    """Generates the TXT and ZIP files of each year, unless they are already
+    in ``directory``.
+
+    Returns:
+        Year x path of the TXT file; the ZIP file has the same name with the
+        .ZIP suffix.
+    """
+    directory = directory / f"{records_per_year}x{num_tickers}"
+    directory.mkdir(parents=True, exist_ok=True)
+
+    files = {}
+    for year in years:
+        txt = directory / f"COTAHIST_A{year}.TXT"
+        archive = txt.with_suffix(".ZIP")
+        if not archive.is_file():
+            gerar_arquivo(str(txt), records_per_year, ano=year, semente=year,
+                          num_papeis=num_tickers)
+            with zipfile.ZipFile(archive, "w", zipfile.ZIP_DEFLATED) as data:
+                data.write(txt, arcname=f"COTAHIST.A{year}")
+        files[year] = txt
+    return files
+
+
+# Stages, run in a new process by measure_isolated: module-level functions
+# returning the number of rows produced (None when not applicable)
+
+
+def run_download(urls: Dict[str, str], max_connections: int) -> None:
+    for _ in fetch_all(urls, max_connections):
+        pass
+
+
+def run_get_ibov_data(urls: Dict[str, str], ibov_link: Dict[str, str],
+                      ibov_parser: Dict[str, Any], max_connections: int) -> int:
+    data = get_ibov_data(dict(urls), get_todays_date(), ibov_link, ibov_parser,
+                         {"max_connections": max_connections})
+    # The partitions are parsed lazily, batch by batch
+    return sum(len(batch) for parse in data.values() for batch in parse())
+
+
+def setup_clean_extract(archives: List[str], directory: str,
+                        ibov_parser: Dict[str, Any]) -> tuple:
+    # clean_extract deletes its input, so it reads copies
+    Path(directory).mkdir(parents=True, exist_ok=True)
+    names = []
+    for archive in archives:
+        shutil.copy(archive, directory)
+        names.append(Path(archive).name)
+    return names, directory, ibov_parser
+
+
+def run_clean_extract(names: List[str], directory: str,
+                      ibov_parser: Dict[str, Any]) -> int:
+    return sum(len(clean_extract(name, directory, ibov_parser)) for name in names)
+
+
+def run_data_to_csv(files: List[str], ibov_parser: Dict[str, Any]) -> int:
+    return sum(len(data_to_csv(Path(file).name, str(Path(file).parent),
+                               ibov_parser))
+               for file in files)
+
+
+def run_agg_ibov_csv(path: str, last_updated: str) -> int:
+    data, _ = agg_ibov_csv(WatermarkedCSVDataSet(path).load(), last_updated)
+    return len(data)
+
+
+def run(years: List[int], records_per_year: int = 200000,
+        num_tickers: int = 400, engines: List[str] = None,
+        stages: List[str] = None, repeat: int = 1, max_connections: int = 4,
+        directory: str = None) -> List[Dict[str, Any]]:
+    """Runs the benchmark.
+
+    Args:
+        years: Years of the synthetic files.
+        records_per_year: Quote records in the file of each year.
+        num_tickers: Tickers of the synthetic files.
+        engines: Names of ``ENGINES`` measured by data_to_csv, all if None.
+            The other nodes use the first one.
+        stages: Stages measured, all of them if None.
+        repeat: Runs of each stage; the best one is reported.
+        max_connections: Concurrent downloads.
+        directory: Where the synthetic files are kept between runs, a
+            temporary directory if None.
+
+    Returns:
+        One result per stage (and engine).
+    """
+    engines = engines or list(ENGINES)
+    node_parser = ENGINES[engines[0]]
+    stages = stages or ["download", "get_ibov_data", "clean_extract",
+                        "data_to_csv", "agg_ibov_csv"]
+
+    with tempfile.TemporaryDirectory() as temp:
+        files = build_fixtures(Path(directory or temp), years, records_per_year,
+                               num_tickers)
+        archives = {year: txt.with_suffix(".ZIP") for year, txt in files.items()}
+        txt_bytes = sum(txt.stat().st_size for txt in files.values())
+        zip_bytes = sum(archive.stat().st_size for archive in archives.values())
+
+        results = []
+
+        def record(stage, measured, size_bytes):
+            rows = measured["result"]
+            best = min(measured["runs"])
+            results.append(summarize(
+                measured["runs"], size_bytes,
+                benchmark="ingest", case=stage, cache="warm", rows=rows,
+                rows_per_s=rows / best if rows and best > 0 else None,
+                base_rss_mb=measured["base_rss_mb"],
+                peak_rss_mb=measured["peak_rss_mb"],
+                peak_rss_children_mb=measured["peak_rss_children_mb"],
+            ))
+            print(f"{stage}: {best:.3f}s", file=sys.stderr)
+
+        served = {f"/{archive.name}": archive.read_bytes()
+                  for archive in archives.values()}
+        with serving(served) as server:
+            ibov_link = dict(IBOV_LINK, url=server.url)
+            urls = {f"year={year}": get_ibov_url(str(year), ibov_link)
+                    for year in years}
+
+            if "download" in stages:
+                record("download", measure_isolated(
+                    run_download, (urls, max_connections), repeat), zip_bytes)
+            if "get_ibov_data" in stages:
+                record("get_ibov_data", measure_isolated(
+                    run_get_ibov_data,
+                    (urls, ibov_link, node_parser, max_connections),
+                    repeat), zip_bytes)
+
+        if "clean_extract" in stages:
+            record("clean_extract", measure_isolated(
+                run_clean_extract,
+                ([str(a) for a in archives.values()],
+                 str(Path(temp) / "extract"), node_parser),
+                repeat, setup=setup_clean_extract), zip_bytes)
+
+        if "data_to_csv" in stages:
+            for engine in engines:
+                record(f"data_to_csv/{engine}", measure_isolated(
+                    run_data_to_csv,
+                    ([str(txt) for txt in files.values()], ENGINES[engine]),
+                    repeat), txt_bytes)
+
+        if "agg_ibov_csv" in stages:
+            partitions = WatermarkedCSVDataSet(str(Path(temp) / "ibov_csv"))
+            for year, txt in files.items():
+                with open(os.devnull, "w") as devnull, redirect_stdout(devnull), \
+                        redirect_stderr(devnull):
+                    data = data_to_csv(txt.name, str(txt.parent), node_parser)
+                partitions.save({f"year={year}": data})
+            csv_bytes = sum(Path(temp, "ibov_csv", f"year={year}.csv").stat().st_size
+                            for year in years)
+            latest = partitions.watermark(f"year={max(years)}")["last"]
+            for case, since in (("full", f"{min(years)}-01-01"),
+                                ("latest", latest)):
+                record(f"agg_ibov_csv/{case}", measure_isolated(
+                    run_agg_ibov_csv, (str(Path(temp) / "ibov_csv"), since),
+                    repeat), csv_bytes)
+
+    return results
+
+
+def report(results: List[Dict[str, Any]]) -> str:
+    """Formats the results as a table."""
+    def number(value, width, digits):
+        return f"{value:>{width}.{digits}f}" if value is not None else " " * (width - 1) + "-"
+
+    lines = [f"{'stage':<30}{'best, s':>10}{'mean, s':>10}{'rows/s':>12}"
+             f"{'MB/s':>9}{'peak RSS, MB':>14}"]
+    for r in results:
+        lines.append(
+            f"{r['case']:<30}{number(r['best_s'], 10, 3)}"
+            f"{number(r['mean_s'], 10, 3)}{number(r['rows_per_s'], 12, 0)}"
+            f"{number(r['mb_per_s'], 9, 1)}{number(r['peak_rss_mb'], 14, 1)}")
+    return "\n".join(lines)
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--num-years", type=int, default=2,
+                        help="years of data, ending in 2020 (default: 2)")
+    parser.add_argument("--records-per-year", type=int, default=200000,
+                        help="quote records per year (default: 200000)")
+    parser.add_argument("--tickers", type=int, default=400,
+                        help="tickers in the files (default: 400)")
+    parser.add_argument("--engines", nargs="+", choices=list(ENGINES),
+                        help="parser engines; the first one is used by the "
+                             "other nodes (default: all, posicional first)")
+    parser.add_argument("--stages", nargs="+",
+                        choices=["download", "get_ibov_data", "clean_extract",
+                                 "data_to_csv", "agg_ibov_csv"],
+                        help="stages measured (default: all)")
+    parser.add_argument("--repeat", type=int, default=1,
+                        help="runs of each stage (default: 1)")
+    parser.add_argument("--max-connections", type=int, default=4,
+                        help="concurrent downloads (default: 4)")
+    parser.add_argument("--directory",
+                        help="keeps the synthetic files here between runs")
+    parser.add_argument("--output", default=str(DEFAULT_OUTPUT),
+                        help="JSON results file")
+    parser.add_argument("--baseline", help="JSON results of a previous run")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="slowdown allowed against the baseline "
+                             "(default: 0.2)")
+    args = parser.parse_args(argv)
+
+    years = list(range(2021 - args.num_years, 2021))
+    results = run(years, args.records_per_year, args.tickers, args.engines,
+                  args.stages, args.repeat, args.max_connections,
+                  args.directory)
+    print(report(results))
+    write_results(args.output, results, years=years,
+                  records_per_year=args.records_per_year,
+                  tickers=args.tickers, repeat=args.repeat)
+    print(f"\nResults written to {args.output}")
+
+    if args.baseline:
+        regressions = find_regressions(
+            results, load_results(args.baseline), args.tolerance)
+        for regression in regressions:
+            print(f"Regression: {regression}", file=sys.stderr)
+        return int(bool(regressions))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
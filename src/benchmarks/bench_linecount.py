@@ -0,0 +1,161 @@
+"""Benchmark of the line counting strategies of ``linecount.py``.
+
+Every function of the module whose name ends in ``count`` is timed over
+synthetic COTAHIST files of the given sizes, with a cold page cache (pages
+of the file evicted before every run) and with a warm one (file read once
+before every run). The throughput of each strategy is printed and written
+to a JSON file, which can be given back as ``--baseline`` to catch
+regressions.
+
+Example (from the src directory)::
+
+    python -m benchmarks.bench_linecount --sizes-mb 10 200 --repeat 5
+    python -m benchmarks.bench_linecount --baseline previous.json
+"""
+from pathlib import Path
+from typing import Any, Callable, Dict, List
+import argparse
+import sys
+import tempfile
+
+from ml_invest.pipelines.data_engineering.parser import linecount
+from ml_invest.pipelines.data_engineering.parser.sintetico import gerar_arquivo
+
+from .harness import (evict_from_page_cache, find_regressions, load_results,
+                      measure, summarize, warm_page_cache, write_results)
+
+DEFAULT_OUTPUT = (Path(__file__).resolve().parents[2]
+                  / "data" / "08_reporting" / "benchmark_linecount.json")
+
+
+def strategies() -> Dict[str, Callable[[str], int]]:
+    """Returns the counting functions of ``linecount.py`` by name."""
+    return {
+        name: func for name, func in vars(linecount).items()
+        if name.endswith("count") and callable(func)
+    }
+
+
+def synthetic_file(directory: Path, size_mb: float) -> Path:
+    """Returns a synthetic COTAHIST file of about ``size_mb`` MB, generating
+    it only if it is not in ``directory`` yet."""
+    path = directory / f"COTAHIST_{size_mb:g}MB.TXT"
+    if not path.is_file():
+        gerar_arquivo(str(path), tamanho_mb=size_mb)
+    return path
+
+
+def run(sizes_mb: List[float], repeat: int = 3, caches: List[str] = None,
+        names: List[str] = None, directory: str = None) -> List[Dict[str, Any]]:
+    """Runs the benchmark.
+
+    Args:
+        sizes_mb: Sizes of the synthetic files, in MB.
+        repeat: Runs of each strategy; the best one is reported.
+        caches: "cold" and/or "warm".
+        names: Strategies measured, all of them if None.
+        directory: Where the synthetic files are kept, a temporary directory
+            if None.
+
+    Returns:
+        One result per strategy, size and cache state.
+    """
+    caches = caches or ["cold", "warm"]
+    functions = strategies()
+    if names:
+        functions = {name: functions[name] for name in names}
+
+    with tempfile.TemporaryDirectory() as temp:
+        directory = Path(directory or temp)
+        directory.mkdir(parents=True, exist_ok=True)
+
+        results = []
+        for size_mb in sizes_mb:
+            path = synthetic_file(directory, size_mb)
+            size_bytes = path.stat().st_size
+            expected = linecount.rawbigcount(str(path))
+
+            for cache in caches:
+                if cache == "cold":
+                    before = lambda: evict_from_page_cache(str(path))
+                else:
+                    before = lambda: warm_page_cache(str(path))
+
+                for name, func in functions.items():
+                    try:
+                        runs, lines = measure(lambda: func(str(path)), repeat, before)
+                    except (OSError, ValueError) as error:
+                        # e.g. wc missing, or a text mode strategy failing
+                        print(f"{name}: skipped ({error})", file=sys.stderr)
+                        continue
+                    results.append(summarize(
+                        runs, size_bytes,
+                        benchmark="linecount", case=name, cache=cache,
+                        lines=lines, correct=lines == expected,
+                    ))
+    return results
+
+
+def report(results: List[Dict[str, Any]]) -> str:
+    """Formats the results as a table, fastest strategy first in each group,
+    with the time ratio to the fastest one."""
+    lines = []
+    groups = sorted({(r["size_bytes"], r["cache"]) for r in results})
+    for size_bytes, cache in groups:
+        group = sorted(
+            (r for r in results
+             if (r["size_bytes"], r["cache"]) == (size_bytes, cache)),
+            key=lambda r: r["best_s"])
+        fastest = group[0]["best_s"]
+        lines.append(f"\n{size_bytes / 1e6:.1f} MB, {cache} cache")
+        lines.append(f"{'strategy':<13}{'best, s':>10}{'mean, s':>10}"
+                     f"{'MB/s':>10}{'ratio':>8}")
+        for r in group:
+            flag = "" if r["correct"] else "  WRONG COUNT"
+            lines.append(
+                f"{r['case']:<13}{r['best_s']:>10.4f}{r['mean_s']:>10.4f}"
+                f"{r['mb_per_s']:>10.1f}{r['best_s'] / fastest:>8.2f}{flag}")
+    return "\n".join(lines)
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--sizes-mb", type=float, nargs="+", default=[10, 100],
+                        help="sizes of the synthetic files (default: 10 100)")
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="runs of each strategy (default: 3)")
+    parser.add_argument("--cache", choices=["cold", "warm"], nargs="+",
+                        default=["cold", "warm"], help="page cache states")
+    parser.add_argument("--strategies", nargs="+", choices=sorted(strategies()),
+                        help="strategies measured (default: all)")
+    parser.add_argument("--directory",
+                        help="keeps the synthetic files here between runs")
+    parser.add_argument("--output", default=str(DEFAULT_OUTPUT),
+                        help="JSON results file")
+    parser.add_argument("--baseline", help="JSON results of a previous run")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="slowdown allowed against the baseline "
+                             "(default: 0.2)")
+    args = parser.parse_args(argv)
+
+    results = run(args.sizes_mb, args.repeat, args.cache, args.strategies,
+                  args.directory)
+    print(report(results))
+    write_results(args.output, results, repeat=args.repeat)
+    print(f"\nResults written to {args.output}")
+
+    status = 0
+    if not all(r["correct"] for r in results):
+        print("Some strategies returned a wrong line count.", file=sys.stderr)
+        status = 1
+    if args.baseline:
+        regressions = find_regressions(
+            results, load_results(args.baseline), args.tolerance)
+        for regression in regressions:
+            print(f"Regression: {regression}", file=sys.stderr)
+        status = status or int(bool(regressions))
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,228 @@
+"""Helpers shared by the benchmarks: timing, page cache control, results
+files and regression checks."""
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import redirect_stderr, redirect_stdout
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Tuple
+import json
+import multiprocessing
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Fields identifying the same measurement in two results files
+KEY_FIELDS = ("benchmark", "case", "size_bytes", "cache")
+
+
+def evict_from_page_cache(path: str) -> bool:
+    """Asks the kernel to drop the cached pages of a file, so that the next
+    read comes from the disk. No root access is needed.
+
+    Args:
+        path: File to evict.
+
+    Returns:
+        Whether the platform supports the eviction (posix_fadvise).
+    """
+    if not hasattr(os, "posix_fadvise"):
+        return False
+    with open(path, "rb") as file:
+        os.fsync(file.fileno())
+        os.posix_fadvise(file.fileno(), 0, 0, os.POSIX_FADV_DONTNEED)
+    return True
+
+
+def warm_page_cache(path: str) -> None:
+    """Reads a whole file once, so that the next read comes from memory."""
+    with open(path, "rb") as file:
+        while file.read(16 * 1024 * 1024):
+            pass
+
+
+def measure(func: Callable[[], Any], repeat: int,
+            before: Callable[[], Any] = None) -> Tuple[List[float], Any]:
+    """Times ``func`` several times.
+
+    Args:
+        func: Function measured, called without arguments.
+        repeat: Number of runs.
+        before: Called before every run and not timed, e.g. to evict or warm
+            the page cache.
+
+    Returns:
+        The duration of each run in seconds and the result of the last run.
+    """
+    runs = []
+    result = None
+    for _ in range(repeat):
+        if before is not None:
+            before()
+        start = time.perf_counter()
+        result = func()
+        runs.append(time.perf_counter() - start)
+    return runs, result
+
+
+def peak_rss_mb(who: int = None) -> float:
+    """Returns the peak resident set size of this process (or of its
+    finished children, with ``resource.RUSAGE_CHILDREN``) in MB, or None
+    where it is not available."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(
+        resource.RUSAGE_SELF if who is None else who).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak / 1e6 if sys.platform == "darwin" else peak / 1e3
+
+
+def _run_isolated(func: Callable[..., Any], args: Tuple,
+                  setup: Callable[..., Tuple]) -> Dict[str, Any]:
+    # Progress bars and messages of the code measured are discarded
+    with open(os.devnull, "w") as devnull, redirect_stdout(devnull), \
+            redirect_stderr(devnull):
+        if setup is not None:
+            args = setup(*args)
+        base = peak_rss_mb()
+        start = time.perf_counter()
+        result = func(*args)
+        seconds = time.perf_counter() - start
+    return dict(
+        seconds=seconds,
+        result=result,
+        base_rss_mb=base,
+        peak_rss_mb=peak_rss_mb(),
+        peak_rss_children_mb=(peak_rss_mb(resource.RUSAGE_CHILDREN)
+                              if resource is not None else None),
+    )
+
+
+def measure_isolated(func: Callable[..., Any], args: Tuple = (),
+                     repeat: int = 1,
+                     setup: Callable[..., Tuple] = None) -> Dict[str, Any]:
+    """Times ``func(*args)`` in a new Python process per run, so the peak
+    memory of each run is its own and imports or caches of previous runs
+    do not help it.
+
+    Args:
+        func: Module-level function measured; its result must be picklable.
+        args: Arguments of func (or of setup).
+        repeat: Number of runs.
+        setup: Called with args in the new process before the timer starts;
+            returns the arguments of func.
+
+    Returns:
+        The duration of each run in seconds (``runs``), the result of the
+        last run, and the highest peak RSS of the runs in MB: the process
+        itself (``peak_rss_mb``), before func started (``base_rss_mb``), and
+        the processes it started (``peak_rss_children_mb``).
+    """
+    context = multiprocessing.get_context("spawn")
+    runs = []
+    for _ in range(repeat):
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+            runs.append(executor.submit(_run_isolated, func, args, setup).result())
+
+    def highest(key):
+        values = [run[key] for run in runs if run[key] is not None]
+        return max(values) if values else None
+
+    return dict(
+        runs=[run["seconds"] for run in runs],
+        result=runs[-1]["result"],
+        base_rss_mb=highest("base_rss_mb"),
+        peak_rss_mb=highest("peak_rss_mb"),
+        peak_rss_children_mb=highest("peak_rss_children_mb"),
+    )
+
+
+def summarize(runs: List[float], size_bytes: int, **fields: Any) -> Dict[str, Any]:
+    """Builds the result of a measurement, with the throughput of the best
+    run in MB/s (10 ** 6 bytes)."""
+    best = min(runs)
+    return dict(
+        fields,
+        size_bytes=size_bytes,
+        runs=runs,
+        best_s=best,
+        mean_s=statistics.mean(runs),
+        mb_per_s=size_bytes / 1e6 / best if best > 0 else None,
+    )
+
+
+def commit() -> str:
+    """Returns the git commit of the working tree (with a "-dirty" suffix if
+    it has changes), or None outside of a git repository."""
+    try:
+        head = subprocess.run(["git", "rev-parse", "HEAD"], check=True,
+                              capture_output=True, text=True).stdout.strip()
+        changes = subprocess.run(["git", "status", "--porcelain", "-uno"],
+                                 check=True, capture_output=True,
+                                 text=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return head + ("-dirty" if changes else "")
+
+
+def environment() -> Dict[str, Any]:
+    """Describes the code and the machine where the benchmark ran."""
+    return dict(
+        timestamp=datetime.now().isoformat(timespec="seconds"),
+        commit=commit(),
+        python=platform.python_version(),
+        platform=platform.platform(),
+        processor=platform.processor(),
+        cpu_count=os.cpu_count(),
+    )
+
+
+def write_results(path: str, results: List[Dict[str, Any]],
+                  **metadata: Any) -> None:
+    """Writes the results and the environment to a JSON file."""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    document = dict(metadata, environment=environment(), results=results)
+    path.write_text(json.dumps(document, indent=2))
+
+
+def load_results(path: str) -> List[Dict[str, Any]]:
+    """Loads the results of a file written by ``write_results``."""
+    return json.loads(Path(path).read_text())["results"]
+
+
+def find_regressions(results: Iterable[Dict[str, Any]],
+                     baseline: Iterable[Dict[str, Any]],
+                     tolerance: float) -> List[str]:
+    """Compares the best run of each measurement with the same one in a
+    baseline.
+
+    Args:
+        results: Results of the current run.
+        baseline: Results of a previous run.
+        tolerance: Allowed slowdown, e.g. 0.2 for 20%.
+
+    Returns:
+        A description of every measurement slower than allowed.
+    """
+    previous = {tuple(item.get(f) for f in KEY_FIELDS): item for item in baseline}
+    regressions = []
+    for item in results:
+        old = previous.get(tuple(item.get(f) for f in KEY_FIELDS))
+        if old is None or old["best_s"] <= 0:
+            continue
+        slowdown = item["best_s"] / old["best_s"] - 1
+        if slowdown > tolerance:
+            regressions.append(
+                f"{item['benchmark']}/{item['case']} ({item['cache']} cache, "
+                f"{item['size_bytes']} bytes): {old['best_s']:.4f}s -> "
+                f"{item['best_s']:.4f}s (+{slowdown:.0%})"
+            )
+    return regressions
@@ -0,0 +1,332 @@
+"""Instrumentation of the pipeline runs: per node wall time, CPU time, peak
+memory, row counts and sizes of inputs and outputs, and per dataset load and
+save latency.
+
+Every measurement is written to the run journal (``logs/journals``, through
+the ``kedro.journal`` logger) and a summary table is logged at the end of
+the run.
+"""
+from typing import Any, Callable, Dict, List
+import json
+import logging
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from kedro.framework.hooks import hook_impl
+from kedro.io import DataCatalog
+from kedro.pipeline import Pipeline
+from kedro.pipeline.node import Node
+
+try:
+    from kedro.framework.hooks.specs import DatasetSpecs
+except ImportError:  # kedro without the dataset hooks
+    DatasetSpecs = None
+
+try:
+    from kedro.io import AbstractTransformer
+except ImportError:  # kedro >= 0.18, which removed the transformers
+    AbstractTransformer = object
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+try:
+    PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+except (AttributeError, ValueError, OSError):
+    PAGE_SIZE = None
+
+
+def current_rss() -> int:
+    """Returns the resident set size of this process in bytes. Where the
+    current value is not available (outside Linux), returns the peak one."""
+    if PAGE_SIZE is not None:
+        try:
+            with open("/proc/self/statm") as statm:
+                return int(statm.read().split()[1]) * PAGE_SIZE
+        except (OSError, IndexError, ValueError):
+            pass
+    if resource is None:
+        return 0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def cpu_time() -> float:
+    """Returns the CPU time (user and system) of this process and of its
+    finished child processes, in seconds."""
+    times = os.times()
+    return times.user + times.system + times.children_user + times.children_system
+
+
+def count_rows(data: Any) -> int:
+    """Returns the number of rows of a DataFrame, Series or array, summed
+    over dicts, lists and tuples of them, or None if unknown (e.g. the lazy
+    loaders of a PartitionedDataSet)."""
+    if isinstance(data, (pd.DataFrame, pd.Series, np.ndarray)):
+        return len(data)
+    if isinstance(data, dict):
+        data = list(data.values())
+    if isinstance(data, (list, tuple)):
+        counts = [count_rows(item) for item in data]
+        counts = [count for count in counts if count is not None]
+        return sum(counts) if counts else None
+    return None
+
+
+def memory_bytes(data: Any) -> int:
+    """Returns the in-memory size in bytes of a DataFrame, Series, array,
+    str or bytes, summed over dicts, lists and tuples of them, or None if
+    unknown. Strings inside DataFrames are not measured, so their size is a
+    lower bound. This is not the number of bytes read or written by a
+    dataset, which depends on its format and compression."""
+    if isinstance(data, pd.DataFrame):
+        return int(data.memory_usage(index=True).sum())
+    if isinstance(data, pd.Series):
+        return int(data.memory_usage(index=True))
+    if isinstance(data, np.ndarray):
+        return data.nbytes
+    if isinstance(data, (str, bytes)):
+        return len(data)
+    if isinstance(data, dict):
+        data = list(data.values())
+    if isinstance(data, (list, tuple)):
+        sizes = [memory_bytes(item) for item in data]
+        sizes = [size for size in sizes if size is not None]
+        return sum(sizes) if sizes else None
+    return None
+
+
+def _total(values: List[int]) -> int:
+    values = [value for value in values if value is not None]
+    return sum(values) if values else None
+
+
+class _PeakRSS(threading.Thread):
+    """Samples the resident set size of the process until stopped and keeps
+    the highest value."""
+
+    def __init__(self, interval: float) -> None:
+        super().__init__(daemon=True)
+        self._interval = interval
+        self._stopped = threading.Event()
+        self.peak = current_rss()
+
+    def run(self) -> None:
+        while not self._stopped.wait(self._interval):
+            self.peak = max(self.peak, current_rss())
+
+    def stop(self) -> int:
+        self._stopped.set()
+        self.join()
+        self.peak = max(self.peak, current_rss())
+        return self.peak
+
+
+class DatasetLatencyTransformer(AbstractTransformer):
+    """Times every load and save of the catalog and reports them to
+    ``callback(name, operation, seconds, data)``. Used with the versions of
+    kedro without the dataset hooks, which have transformers instead."""
+
+    def __init__(self, callback: Callable[[str, str, float, Any], None]) -> None:
+        self._callback = callback
+
+    def load(self, data_set_name: str, load: Callable[[], Any]) -> Any:
+        start = time.perf_counter()
+        data = load()
+        self._callback(data_set_name, "load", time.perf_counter() - start, data)
+        return data
+
+    def save(self, data_set_name: str, save: Callable[[Any], None],
+             data: Any) -> None:
+        start = time.perf_counter()
+        save(data)
+        self._callback(data_set_name, "save", time.perf_counter() - start, data)
+
+
+class InstrumentationHooks:
+    """Measures every node and dataset operation of a run.
+
+    For each node: wall time, CPU time (including finished child processes,
+    such as the parallel parser workers), peak resident memory of the process
+    while the node ran, and the rows and in-memory size of its inputs and
+    outputs. For each load and save of a dataset: its latency, rows and
+    in-memory size. Parameters are not measured. Datasets are timed by the
+    ``before/after_dataset_loaded/saved`` hooks where kedro has them (0.17
+    and later), and by a catalog transformer otherwise.
+
+    Sizes (``memory_bytes``, ``memory_bytes_in`` and ``memory_bytes_out``)
+    are those of the Python objects (see ``memory_bytes``), not the bytes
+    read from or written to disk: a Parquet file may be many times smaller
+    than the DataFrame it holds.
+
+    Memory is sampled by a background thread every ``interval`` seconds and
+    covers the whole process, so it is exact per node with the sequential
+    runner only. With the parallel runner every worker process reports its
+    own nodes.
+    """
+
+    def __init__(self, interval: float = 0.05) -> None:
+        """Creates new instrumentation hooks.
+
+        Args:
+            interval: Seconds between two samples of the process memory.
+        """
+        self._interval = interval
+        self._lock = threading.Lock()
+        self._journal = logging.getLogger("kedro.journal")
+        self._logger = logging.getLogger(__name__)
+        self._reset(None)
+
+    def _reset(self, run_id: str) -> None:
+        self._run_id = run_id
+        self._running = {}  # type: Dict[str, Dict[str, Any]]
+        # Start of the dataset operations in progress, by thread
+        self._operations = {}  # type: Dict[tuple, float]
+        self.nodes = []  # type: List[Dict[str, Any]]
+        self.datasets = []  # type: List[Dict[str, Any]]
+
+    def _record(self, record_type: str, record: Dict[str, Any]) -> None:
+        # Same format as the records of kedro.versioning.Journal
+        self._journal.info(json.dumps(
+            {"type": record_type, "run_id": self._run_id, **record}))
+
+    @hook_impl
+    def after_catalog_created(self, catalog: DataCatalog) -> None:
+        if DatasetSpecs is None:
+            catalog.add_transformer(DatasetLatencyTransformer(self._dataset_done))
+
+    def _dataset_started(self, name: str, operation: str) -> None:
+        with self._lock:
+            self._operations[name, operation, threading.get_ident()] = (
+                time.perf_counter())
+
+    def _dataset_finished(self, name: str, operation: str, data: Any) -> None:
+        end = time.perf_counter()
+        with self._lock:
+            start = self._operations.pop(
+                (name, operation, threading.get_ident()), None)
+        if start is not None:
+            self._dataset_done(name, operation, end - start, data)
+
+    @hook_impl
+    def before_dataset_loaded(self, dataset_name: str) -> None:
+        self._dataset_started(dataset_name, "load")
+
+    @hook_impl
+    def after_dataset_loaded(self, dataset_name: str, data: Any) -> None:
+        self._dataset_finished(dataset_name, "load", data)
+
+    @hook_impl
+    def before_dataset_saved(self, dataset_name: str) -> None:
+        self._dataset_started(dataset_name, "save")
+
+    @hook_impl
+    def after_dataset_saved(self, dataset_name: str, data: Any) -> None:
+        self._dataset_finished(dataset_name, "save", data)
+
+    def _dataset_done(self, name: str, operation: str, seconds: float,
+                      data: Any) -> None:
+        if name == "parameters" or name.startswith("params:"):
+            return
+        record = dict(dataset=name, operation=operation, seconds=seconds,
+                      rows=count_rows(data), memory_bytes=memory_bytes(data))
+        with self._lock:
+            self.datasets.append(record)
+        self._record("DatasetMetricsRecord", record)
+
+    @hook_impl
+    def before_pipeline_run(self, run_params: Dict[str, Any]) -> None:
+        self._reset(run_params.get("run_id"))
+
+    @hook_impl
+    def before_node_run(self, node: Node, inputs: Dict[str, Any]) -> None:
+        memory = _PeakRSS(self._interval)
+        memory.start()
+        with self._lock:
+            self._running[node.name] = dict(
+                memory=memory,
+                wall=time.perf_counter(),
+                cpu=cpu_time(),
+                inputs=inputs,
+            )
+
+    @hook_impl
+    def after_node_run(self, node: Node, outputs: Dict[str, Any]) -> None:
+        wall, cpu = time.perf_counter(), cpu_time()
+        with self._lock:
+            running = self._running.pop(node.name, None)
+        if running is None:
+            return
+
+        inputs = {name: data for name, data in running["inputs"].items()
+                  if name != "parameters" and not name.startswith("params:")}
+        record = dict(
+            node=node.name,
+            wall_s=wall - running["wall"],
+            cpu_s=cpu - running["cpu"],
+            peak_rss_bytes=running["memory"].stop(),
+            rows_in=_total([count_rows(data) for data in inputs.values()]),
+            rows_out=_total([count_rows(data) for data in outputs.values()]),
+            memory_bytes_in=_total([memory_bytes(data)
+                                    for data in inputs.values()]),
+            memory_bytes_out=_total([memory_bytes(data)
+                                     for data in outputs.values()]),
+        )
+        with self._lock:
+            self.nodes.append(record)
+        self._record("NodeMetricsRecord", record)
+
+    @hook_impl
+    def on_node_error(self, node: Node) -> None:
+        with self._lock:
+            running = self._running.pop(node.name, None)
+        if running is not None:
+            running["memory"].stop()
+
+    @hook_impl
+    def after_pipeline_run(self, pipeline: Pipeline) -> None:
+        self._record("PipelineMetricsRecord",
+                     dict(nodes=self.nodes, datasets=self.datasets))
+        self._logger.info("Run metrics:\n%s", self.summary())
+
+    def summary(self) -> str:
+        """Returns the measurements of the last run as text tables, the
+        slowest nodes and datasets first."""
+        def number(value, width, scale=1, digits=0):
+            if value is None:
+                return f"{'-':>{width}}"
+            return f"{value / scale:>{width}.{digits}f}"
+
+        lines = [f"{'node':<28}{'wall, s':>9}{'cpu, s':>9}{'peak RSS, MB':>14}"
+                 f"{'rows in':>11}{'rows out':>11}{'mem MB in':>11}"
+                 f"{'mem MB out':>12}"]
+        for record in sorted(self.nodes, key=lambda r: -r["wall_s"]):
+            lines.append(
+                f"{record['node'][:27]:<28}{number(record['wall_s'], 9, digits=2)}"
+                f"{number(record['cpu_s'], 9, digits=2)}"
+                f"{number(record['peak_rss_bytes'], 14, 1e6, 1)}"
+                f"{number(record['rows_in'], 11)}{number(record['rows_out'], 11)}"
+                f"{number(record['memory_bytes_in'], 11, 1e6, 1)}"
+                f"{number(record['memory_bytes_out'], 12, 1e6, 1)}")
+
+        totals = {}
+        for record in self.datasets:
+            key = (record["dataset"], record["operation"])
+            count, seconds = totals.get(key, (0, 0.0))
+            totals[key] = (count + 1, seconds + record["seconds"])
+
+        lines.append("")
+        lines.append(f"{'dataset':<28}{'operation':>10}{'count':>7}{'total, s':>10}")
+        for (name, operation), (count, seconds) in sorted(
+                totals.items(), key=lambda item: -item[1][1]):
+            lines.append(f"{name[:27]:<28}{operation:>10}{count:>7}"
+                         f"{seconds:>10.3f}")
+        return "\n".join(lines)
@@ -31,4 +31,10 @@ just for illustrating basic Kedro features.
 PLEASE DELETE THIS FILE ONCE YOU START WORKING ON YOUR OWN PROJECT!
 """
 
-from .appendable_csv_dataset import AppendableCSVDataSet  # NOQA
\ No newline at end of file
+from contextlib import suppress
+
+from .appendable_csv_dataset import AppendableCSVDataSet  # NOQA
+from .watermarked_csv_dataset import WatermarkedCSVDataSet  # NOQA
+
+with suppress(ImportError):
+    from .appendable_parquet_dataset import AppendableParquetDataSet  # NOQA
@@ -1,11 +1,17 @@
 from copy import deepcopy
+from io import StringIO
 from pathlib import Path, PurePosixPath
-from typing import Any, Dict
+from typing import Any, Callable, Dict, Iterable, List, Tuple
+import os
 
+import numpy as np
 import pandas as pd
 
 from kedro.io.core import AbstractDataSet, DataSetError
 
+from .csv_index import CSVIndex, csv_dialect, date_text
+from .key_set import KeySet
+
 
 class AppendableCSVDataSet(AbstractDataSet):
     """``AppendableCSVDataSet`` loads/saves data from/to a local CSV file opened in
@@ -33,6 +39,55 @@ class AppendableCSVDataSet(AbstractDataSet):
         >>> reloaded = appendable_ds.load()
         >>> assert data_2.equals(reloaded)
 
+    Consumers that only need part of the data can use ``query``, which reads
+    the file in chunks and keeps only the selected columns and rows, so the
+    memory used grows with the answer instead of the whole history:
+    ::
+
+        >>> ibov_ds = AppendableCSVDataSet(
+        >>>     filepath="data/01_raw/ibov_agg/ibov_dataset.csv",
+        >>> )
+        >>> petr4 = ibov_ds.query(columns=["data_pregao", "preco_ultimo"],
+        >>>                       start="2010-01-01", tickers=["PETR4"])
+
+    With ``index=True`` every save also updates a ticker/date index kept next
+    to the file (see ``CSVIndex``) and queries by ticker or date read only the
+    matching rows:
+    ::
+
+        >>> ibov_ds = AppendableCSVDataSet(
+        >>>     filepath="data/01_raw/ibov_agg/ibov_dataset.csv", index=True,
+        >>> )
+        >>> last_close = ibov_ds.lookup(tickers=["ITUB4"]).preco_ultimo.iloc[-1]
+
+    With ``keys`` every save drops (or rejects) the rows whose keys are
+    already in the file, checked against a set of key hashes kept next to it
+    (see ``KeySet``), so re-runs appending overlapping rows do not duplicate
+    them and readers do not have to deduplicate:
+    ::
+
+        >>> ibov_ds = AppendableCSVDataSet(
+        >>>     filepath="data/01_raw/ibov_agg/ibov_dataset.csv",
+        >>>     keys=["data_pregao", "cod_papel"],
+        >>> )
+        >>> ibov_ds.save(quotes)
+        >>> ibov_ds.save(quotes)  # appends nothing
+
+    With ``on_duplicate="upsert"`` rows whose keys are already in the file
+    replace them instead: new keys are still appended to the file, and the
+    replacements are written to small delta files next to it, which every
+    read applies. ``compact`` merges the deltas into the file, rewritten
+    sorted by keys; it runs on its own once there are more than
+    ``max_deltas`` of them:
+    ::
+
+        >>> ibov_ds = AppendableCSVDataSet(
+        >>>     filepath="data/01_raw/ibov_agg/ibov_dataset.csv",
+        >>>     keys=["data_pregao", "cod_papel"], on_duplicate="upsert",
+        >>> )
+        >>> ibov_ds.save(corrected_quotes)  # writes a delta file
+        >>> ibov_ds.compact()
+
     """
     DEFAULT_LOAD_ARGS = {}  # type: Dict[str, Any]
     DEFAULT_SAVE_ARGS = {"index": False}
@@ -42,6 +97,14 @@ class AppendableCSVDataSet(AbstractDataSet):
         filepath: str,
         load_args: Dict[str, Any] = None,
         save_args: Dict[str, Any] = None,
+        query_args: Dict[str, Any] = None,
+        date_column: str = "data_pregao",
+        ticker_column: str = "cod_papel",
+        chunksize: int = 100000,
+        index: bool = False,
+        keys: List[str] = None,
+        on_duplicate: str = "ignore",
+        max_deltas: int = 10,
     ) -> None:
         """Creates a new instance of ``AppendableCSVDataSet`` pointing to an existing local
         CSV file to be opened in append mode.
@@ -55,8 +118,41 @@ class AppendableCSVDataSet(AbstractDataSet):
                 Here you can find all available arguments:
                 https://pandas.pydata.org/pandas-docs/stable/generated/pandas.DataFrame.to_csv.html
                 All defaults are preserved, but "index", which is set to False.
+            query_args: Arguments of ``query`` applied on every ``load``
+                (columns, start, end and tickers).
+            date_column: Column compared with the start and end of a query.
+            ticker_column: Column compared with the tickers of a query.
+            chunksize: Number of rows read at a time by a query.
+            index: Whether to keep a ticker/date index of the file, updated
+                on every save and used by the queries.
+            keys: Columns identifying a row. If given, rows whose keys are
+                already in the file, or repeated later in the same save, are
+                not appended.
+            on_duplicate: What to do with those rows: "ignore" drops them,
+                "error" raises a DataSetError and appends nothing, "upsert"
+                replaces the rows of the file with those whose values
+                changed.
+            max_deltas: Delta files kept by "upsert" before they are
+                compacted into the file.
+
+        Raises:
+            DataSetError: When on_duplicate is not "ignore", "error" or
+                "upsert".
         """
+        if on_duplicate not in ("ignore", "error", "upsert"):
+            raise DataSetError(
+                f"`on_duplicate` must be 'ignore', 'error' or 'upsert', "
+                f"not '{on_duplicate}'."
+            )
         self._filepath = PurePosixPath(filepath)
+        self._query_args = query_args or {}
+        self._date_column = date_column
+        self._ticker_column = ticker_column
+        self._chunksize = chunksize
+        self._index = index
+        self._keys = keys
+        self._on_duplicate = on_duplicate
+        self._max_deltas = max_deltas
 
         # Handle default load and save arguments
         self._load_args = deepcopy(self.DEFAULT_LOAD_ARGS)
@@ -75,18 +171,165 @@ class AppendableCSVDataSet(AbstractDataSet):
         return dict(
             filepath=self._filepath,
             load_args=self._load_args,
-            save_args=self._save_args
+            save_args=self._save_args,
+            query_args=self._query_args,
+            index=self._index,
+            keys=self._keys,
+            on_duplicate=self._on_duplicate,
+            max_deltas=self._max_deltas,
         )
 
+    def _csv_index(self) -> CSVIndex:
+        return CSVIndex(str(self._filepath), self._date_column,
+                        self._ticker_column,
+                        csv_dialect(self._load_args, self._save_args))
+
+    def _key_set(self) -> KeySet:
+        return KeySet(str(self._filepath), self._keys,
+                      [key for key in self._keys if key == self._date_column],
+                      csv_dialect(self._load_args, self._save_args))
+
     def _load(self) -> pd.DataFrame:
-        return pd.read_csv(str(self._filepath), **self._load_args)
+        return self.query(**self._query_args)
+
+    def query(
+        self,
+        columns: List[str] = None,
+        start: Any = None,
+        end: Any = None,
+        tickers: Iterable[str] = None,
+    ) -> pd.DataFrame:
+        """Loads only the rows and columns selected. The file is read in
+        chunks of ``chunksize`` rows and each chunk is filtered before the
+        next one is read.
+
+        Args:
+            columns: Columns returned, all of them if None.
+            start: First date returned (inclusive).
+            end: Last date returned (inclusive).
+            tickers: Tickers returned, all of them if None.
+
+        Returns:
+            The rows whose date is between start and end and whose ticker is
+            in tickers, with the upserted values.
+        """
+        return self._with_deltas(self._query, columns, start, end, tickers)
+
+    def _query(self, columns: List[str], start: Any, end: Any,
+               tickers: Iterable[str]) -> pd.DataFrame:
+        if start is None and end is None and tickers is None:
+            load_args = dict(self._load_args)
+            if columns is not None:
+                load_args["usecols"] = columns
+            data = pd.read_csv(str(self._filepath), **load_args)
+            return data if columns is None else data[columns]
+
+        if self._index:
+            return self._lookup(columns, start, end, tickers)
+
+        needed = []
+        if start is not None or end is not None:
+            needed.append(self._date_column)
+        if tickers is not None:
+            needed.append(self._ticker_column)
+            tickers = list(tickers)
+
+        load_args = dict(self._load_args, chunksize=self._chunksize)
+        if columns is not None:
+            load_args["usecols"] = list(dict.fromkeys(list(columns) + needed))
+
+        parts = []
+        for chunk in pd.read_csv(str(self._filepath), **load_args):
+            chunk = chunk[self._mask(chunk, start, end, tickers)]
+            parts.append(chunk if columns is None else chunk[columns])
+
+        if not parts:
+            return pd.DataFrame(columns=columns)
+        return pd.concat(parts, ignore_index=True)
+
+    def lookup(
+        self,
+        columns: List[str] = None,
+        start: Any = None,
+        end: Any = None,
+        tickers: Iterable[str] = None,
+    ) -> pd.DataFrame:
+        """Same as ``query``, but uses the ticker/date index to read only the
+        matching rows. The index is built if it is missing or stale.
+
+        Args:
+            columns: Columns returned, all of them if None.
+            start: First date returned (inclusive).
+            end: Last date returned (inclusive).
+            tickers: Tickers returned, all of them if None.
+
+        Returns:
+            The rows whose date is between start and end and whose ticker is
+            in tickers, with the upserted values.
+        """
+        return self._with_deltas(self._lookup, columns, start, end, tickers)
+
+    def _lookup(self, columns: List[str], start: Any, end: Any,
+                tickers: Iterable[str]) -> pd.DataFrame:
+        index = self._csv_index()
+        load_args = dict(self._load_args)
+        if columns is not None:
+            load_args["usecols"] = columns
+
+        data = index.read(index.rows(tickers, start, end), **load_args)
+        return data if columns is None else data[columns]
+
+    def _with_deltas(self, read: Callable[..., pd.DataFrame],
+                     columns: List[str], start: Any, end: Any,
+                     tickers: Iterable[str]) -> pd.DataFrame:
+        deltas = self._read_deltas(self._load_args)
+        if deltas is None:
+            return read(columns, start, end, tickers)
+
+        # Rows of the file replaced by a delta give way to it
+        tickers = None if tickers is None else list(tickers)
+        wanted = None if columns is None else list(
+            dict.fromkeys(list(columns) + self._keys))
+        data = read(wanted, start, end, tickers)
+        key_set = self._key_set()
+        data = data[~np.isin(key_set.hash(data), key_set.hash(deltas))]
+
+        deltas = deltas[self._mask(deltas, start, end, tickers)]
+        data = pd.concat([data, deltas if wanted is None else deltas[wanted]],
+                         ignore_index=True)
+        return data if columns is None else data[columns]
+
+    def _mask(self, data: pd.DataFrame, start: Any, end: Any,
+              tickers: List[str]) -> pd.Series:
+        mask = pd.Series(True, index=data.index)
+
+        if start is not None or end is not None:
+            dates = data[self._date_column]
+            # Dates are written as %Y-%m-%d, so the strings compare in order
+            as_text = not pd.api.types.is_datetime64_any_dtype(dates)
+            if as_text:
+                dates = date_text(dates)
+            for bound, compare in ((start, dates.ge), (end, dates.le)):
+                if bound is not None:
+                    bound = pd.Timestamp(bound)
+                    mask &= compare(bound.strftime("%Y-%m-%d") if as_text else bound)
+
+        if tickers is not None:
+            mask &= data[self._ticker_column].isin(tickers)
+
+        return mask
 
     def _save(self, data: pd.DataFrame) -> None:
         # pylint: disable=abstract-class-instantiated
         try:
-            if self._exists():
-                self._save_args["header"] = False
-            data.to_csv(str(self._filepath), **self._save_args)
+            key_set = self._key_set() if self._keys else None
+            hashes = None
+            if key_set:
+                data, hashes = self._drop_duplicates(data, key_set)
+            if not (key_set and data.empty and self._exists()):
+                self._append(data, key_set, hashes)
+            if len(self._delta_paths()) > self._max_deltas:
+                self.compact()
         except FileNotFoundError:
             raise DataSetError(
                 f"`{self._filepath}` CSV file not found. "
@@ -94,5 +337,113 @@ class AppendableCSVDataSet(AbstractDataSet):
                 f"append mode."
             )
 
+    def _append(self, data: pd.DataFrame, key_set: KeySet,
+                hashes: np.ndarray) -> None:
+        if self._exists():
+            self._save_args["header"] = False
+        index = self._csv_index() if self._index else None
+        # Size and modification time of the file before the rows are
+        # appended, so the sidecar files only add the new rows
+        sidecar = index or key_set
+        previous = sidecar.stat() if sidecar else None
+        data.to_csv(str(self._filepath), **self._save_args)
+        if index:
+            index.append(previous)
+        if key_set:
+            key_set.add(hashes, previous)
+
+    def _drop_duplicates(self, data: pd.DataFrame,
+                         key_set: KeySet) -> Tuple[pd.DataFrame, np.ndarray]:
+        # Rows repeated in data keep the last one, as the newest
+        hashes = key_set.hash(data)
+        repeated = pd.Series(hashes).duplicated(keep="last").to_numpy()
+        existing = key_set.contains(hashes)
+        duplicated = repeated | existing
+
+        if duplicated.any() and self._on_duplicate == "error":
+            raise DataSetError(
+                f"{duplicated.sum()} rows have keys {self._keys} already in "
+                f"`{self._filepath}` or repeated in the data saved."
+            )
+        if self._on_duplicate == "upsert":
+            upserted = existing & ~repeated
+            if upserted.any():
+                upserted[upserted] = self._changed(data[upserted])
+            if upserted.any():
+                self._write_delta(data[upserted])
+        return data[~duplicated], hashes[~duplicated]
+
+    def _changed(self, data: pd.DataFrame) -> np.ndarray:
+        # Whether each row differs from the current row with its keys, both
+        # formatted as they are written in the file
+        def as_text(frame: pd.DataFrame) -> pd.DataFrame:
+            return pd.read_csv(StringIO(frame.to_csv(index=False)), dtype=str,
+                               keep_default_na=False)
+
+        new = as_text(data)
+        bounds = {}
+        if self._date_column in self._keys:
+            dates = date_text(new[self._date_column])
+            bounds.update(start=dates.min(), end=dates.max())
+        if self._ticker_column in self._keys:
+            bounds.update(tickers=new[self._ticker_column].unique().tolist())
+        read = self.lookup if self._index else self.query
+        current = as_text(read(**bounds).reindex(columns=data.columns))
+
+        rows = pd.util.hash_pandas_object(new, index=False).to_numpy()
+        return ~np.isin(rows, pd.util.hash_pandas_object(
+            current, index=False).to_numpy())
+
+    def _deltas_path(self) -> Path:
+        return Path(f"{self._filepath}.deltas")
+
+    def _delta_paths(self) -> List[Path]:
+        if not self._deltas_path().is_dir():
+            return []
+        return sorted(self._deltas_path().glob("*.csv"))
+
+    def _read_deltas(self, load_args: Dict[str, Any]) -> pd.DataFrame:
+        # Rows upserted since the last compaction, the latest one of each key
+        paths = self._delta_paths()
+        if not paths:
+            return None
+        deltas = pd.concat([pd.read_csv(str(path), **load_args) for path in paths],
+                           ignore_index=True)
+        hashes = self._key_set().hash(deltas)
+        return deltas[~pd.Series(hashes).duplicated(keep="last").to_numpy()]
+
+    def _write_delta(self, data: pd.DataFrame) -> None:
+        paths = self._delta_paths()
+        number = int(paths[-1].stem) + 1 if paths else 1
+        self._deltas_path().mkdir(parents=True, exist_ok=True)
+        data.to_csv(str(self._deltas_path() / f"{number:08d}.csv"),
+                    **dict(self._save_args, mode="w", header=True))
+
+    def compact(self) -> None:
+        """Merges the rows upserted since the last compaction into the file,
+        which is rewritten sorted by keys, and deletes the delta files. Both
+        are read as text, so values are written back as they were read.
+        """
+        paths = self._delta_paths()
+        if not paths:
+            return
+        as_text = dict(dtype=str, keep_default_na=False)
+        deltas = self._read_deltas(as_text)
+        key_set = self._key_set()
+        data = pd.read_csv(str(self._filepath), **as_text)
+        data = data[~np.isin(key_set.hash(data), key_set.hash(deltas))]
+        data = pd.concat([data, deltas[data.columns]], ignore_index=True)
+        data = data.sort_values(self._keys, kind="stable")
+
+        temp = Path(f"{self._filepath}.tmp")
+        data.to_csv(str(temp), **dict(self._save_args, mode="w", header=True))
+        os.replace(temp, self._filepath)
+        key_set.rebuild()
+        if self._index:
+            self._csv_index().rebuild()
+        # Deltas left by an interruption here are applied again harmlessly
+        for path in paths:
+            path.unlink()
+
     def _exists(self) -> bool:
         return Path(self._filepath.as_posix()).is_file()
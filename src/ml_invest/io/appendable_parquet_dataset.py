@@ -0,0 +1,450 @@
+from concurrent.futures import ThreadPoolExecutor
+from copy import deepcopy
+from pathlib import Path, PurePosixPath
+from typing import Any, Dict, Iterable, List
+import json
+import operator
+import os
+import zlib
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from kedro.io.core import AbstractDataSet, DataSetError
+
+# Comparisons of the filters, as written for pyarrow
+OPERATORS = {
+    "=": operator.eq,
+    "==": operator.eq,
+    "!=": operator.ne,
+    "<": operator.lt,
+    "<=": operator.le,
+    ">": operator.gt,
+    ">=": operator.ge,
+}
+
+
+class AppendableParquetDataSet(AbstractDataSet):
+    """``AppendableParquetDataSet`` loads/saves data from/to a local directory
+    of Parquet fragments. Every save appends a new compressed, typed fragment
+    to the directory instead of rewriting the existing data, and loads read
+    only the requested columns and rows. It uses pandas and pyarrow to handle
+    the Parquet files.
+
+    Example:
+    ::
+
+        >>> from ml_invest.io import AppendableParquetDataSet
+        >>> import pandas as pd
+        >>>
+        >>> data_1 = pd.DataFrame({'data_pregao': ['2020-07-14'],
+        >>>                        'cod_papel': ['PETR4'],
+        >>>                        'preco_ultimo': [21.5]})
+        >>>
+        >>> data_2 = pd.DataFrame({'data_pregao': ['2020-07-15'],
+        >>>                        'cod_papel': ['PETR4'],
+        >>>                        'preco_ultimo': [22.1]})
+        >>>
+        >>> data_set = AppendableParquetDataSet(
+        >>>     filepath="/tmp/ibov_dataset",
+        >>>     date_columns=["data_pregao"],
+        >>>     load_args={
+        >>>         "columns": ["data_pregao", "preco_ultimo"],
+        >>>         "filters": [("data_pregao", ">=", pd.Timestamp("2020-07-15"))],
+        >>>     },
+        >>> )
+        >>>
+        >>> data_set.save(data_1)
+        >>> data_set.save(data_2)
+        >>> reloaded = data_set.load()
+        >>> assert reloaded.shape == (1, 2)
+        >>>
+        >>> petr4 = data_set.query(columns=["preco_ultimo"], tickers=["PETR4"])
+
+    The fragments can be laid out in hive-style partitions, by the year of
+    ``date_column`` (``year=2020/``, as the ``ibov_csv`` partitions) and by
+    a hash bucket of ``ticker_column`` (``year=2020/bucket=07/``). Every
+    save writes a fragment only to the partitions of its rows, and queries
+    read only the partitions of their years and tickers, so the history of
+    a ticker is a handful of small files. ``compact`` merges the fragments
+    of each partition into one:
+    ::
+
+        >>> data_set = AppendableParquetDataSet(
+        >>>     filepath="data/01_raw/ibov_agg/ibov_dataset",
+        >>>     date_columns=["data_pregao"],
+        >>>     partition_by_year=True, ticker_buckets=16,
+        >>> )
+        >>> petr4 = data_set.query(tickers=["PETR4"], start="2015-01-01")
+
+    """
+    DEFAULT_LOAD_ARGS = {}  # type: Dict[str, Any]
+    DEFAULT_SAVE_ARGS = {"compression": "snappy", "index": False}
+
+    def __init__(
+        self,
+        filepath: str,
+        date_columns: List[str] = None,
+        load_args: Dict[str, Any] = None,
+        save_args: Dict[str, Any] = None,
+        query_args: Dict[str, Any] = None,
+        date_column: str = "data_pregao",
+        ticker_column: str = "cod_papel",
+        partition_by_year: bool = False,
+        ticker_buckets: int = None,
+    ) -> None:
+        """Creates a new instance of ``AppendableParquetDataSet`` pointing to a
+        local directory of Parquet fragments, created on the first save.
+
+        Args:
+            filepath: Path in POSIX format to the directory of the fragments.
+            date_columns: Columns converted to datetime before saving, so they
+                are stored typed and can be filtered by date on load. Filter
+                values on these columns may be given as strings.
+            load_args: Options for loading Parquet files: ``columns``,
+                ``filters`` in the format of pyarrow (a list of
+                (column, operator, value) tuples, or a list of such lists
+                for a disjunction) and the options of
+                ``pyarrow.parquet.ParquetFile.read_row_group``, such as
+                ``use_threads``.
+            save_args: Pandas options for saving Parquet files, such as
+                ``compression`` and ``row_group_size``.
+                Here you can find all available arguments:
+                https://pandas.pydata.org/pandas-docs/stable/reference/api/pandas.DataFrame.to_parquet.html
+                All defaults are preserved, but "index", which is set to False.
+            query_args: Arguments of ``query`` applied on every ``load``
+                (columns, start, end and tickers).
+            date_column: Column compared with the start and end of a query.
+            ticker_column: Column compared with the tickers of a query.
+            partition_by_year: Whether to partition the fragments by the
+                year of date_column. It cannot change once data is saved.
+            ticker_buckets: Number of hash buckets of ticker_column the
+                fragments are partitioned by, not partitioned by ticker if
+                None. It cannot change once data is saved.
+        """
+        self._filepath = PurePosixPath(filepath)
+        self._date_columns = date_columns or []
+        self._query_args = query_args or {}
+        self._date_column = date_column
+        self._ticker_column = ticker_column
+        self._partition_by_year = partition_by_year
+        self._ticker_buckets = ticker_buckets
+
+        # Handle default load and save arguments
+        self._load_args = deepcopy(self.DEFAULT_LOAD_ARGS)
+        if load_args is not None:
+            self._load_args.update(load_args)
+
+        self._save_args = deepcopy(self.DEFAULT_SAVE_ARGS)
+        if save_args is not None:
+            self._save_args.update(save_args)
+
+    def _describe(self) -> Dict[str, Any]:
+        return dict(
+            filepath=self._filepath,
+            date_columns=self._date_columns,
+            load_args=self._load_args,
+            save_args=self._save_args,
+            query_args=self._query_args,
+            partition_by_year=self._partition_by_year,
+            ticker_buckets=self._ticker_buckets,
+        )
+
+    def _fragments(self) -> List[Path]:
+        return sorted(Path(self._filepath.as_posix()).rglob("part-*.parquet"))
+
+    def _partitioned(self) -> bool:
+        return self._partition_by_year or bool(self._ticker_buckets)
+
+    def _layout_path(self) -> Path:
+        return Path(self._filepath.as_posix()) / "_layout.json"
+
+    def _layout(self) -> Dict[str, Any]:
+        # Partitioning of the data already saved; fragments saved before
+        # the layout was recorded are not partitioned
+        if not self._layout_path().is_file():
+            return {}
+        layout = json.loads(self._layout_path().read_text())
+        return {option: value for option, value in layout.items() if value}
+
+    def _new_layout(self) -> Dict[str, Any]:
+        # Partitioning given to this instance, empty if not partitioned
+        layout = {}
+        if self._partition_by_year:
+            layout["partition_by_year"] = True
+        if self._ticker_buckets:
+            layout["ticker_buckets"] = self._ticker_buckets
+        return layout
+
+    @staticmethod
+    def _bucket(ticker: str, buckets: int) -> int:
+        return zlib.crc32(str(ticker).encode("utf-8")) % buckets
+
+    def _load(self) -> pd.DataFrame:
+        if not self._exists():
+            raise DataSetError(f"`{self._filepath}` has no Parquet fragments.")
+        return self.query(**self._query_args)
+
+    def query(
+        self,
+        columns: List[str] = None,
+        start: Any = None,
+        end: Any = None,
+        tickers: Iterable[str] = None,
+    ) -> pd.DataFrame:
+        """Loads only the rows and columns selected. The predicates are
+        checked together with the ``filters`` of load_args against the
+        min/max statistics of every row group, so fragments and row groups
+        that cannot match are not read. As each save appends a fragment, a
+        date range usually reads only the fragments of the updates inside
+        it.
+
+        Args:
+            columns: Columns returned, the ``columns`` of load_args if None.
+            start: First date returned (inclusive).
+            end: Last date returned (inclusive).
+            tickers: Tickers returned, all of them if None.
+
+        Returns:
+            The rows whose date is between start and end and whose ticker is
+            in tickers.
+        """
+        load_args = dict(self._load_args)
+        tickers = None if tickers is None else list(tickers)
+        predicates = []
+        if start is not None:
+            predicates.append((self._date_column, ">=", start))
+        if end is not None:
+            predicates.append((self._date_column, "<=", end))
+        if tickers is not None:
+            predicates.append((self._ticker_column, "in", tickers))
+
+        # Filters as a disjunction of conjunctions, every one of them with
+        # the predicates
+        filters = load_args.pop("filters", None) or []
+        if filters and isinstance(filters[0][0], (list, tuple)):
+            filters = [list(conjunction) + predicates for conjunction in filters]
+        elif filters or predicates:
+            filters = [list(filters) + predicates]
+        filters = self._typed_filters(filters)
+        load_columns = load_args.pop("columns", None)
+        columns = load_columns if columns is None else columns
+
+        # Fragments are read one by one as plain files, without partition
+        # columns and with the ParquetFile API of pyarrow 0.17: partition
+        # directories are pruned here, row groups by their statistics
+        read = None
+        if columns is not None:
+            read = list(dict.fromkeys(list(columns) + [
+                column for conjunction in filters for column, _, _ in conjunction]))
+        # pyarrow releases the GIL while reading, so fragments are read by
+        # several threads
+        with ThreadPoolExecutor() as executor:
+            tables = [table for tables in executor.map(
+                lambda fragment: self._read_row_groups(fragment, read, filters,
+                                                       load_args),
+                self._prune(start, end, tickers)) for table in tables]
+        empty = not tables
+        if empty:
+            # Only the columns and their types
+            tables = self._read_row_groups(self._fragments()[0], read, [],
+                                           load_args)[:1]
+
+        try:
+            data = pa.concat_tables(tables).to_pandas()
+        except pa.ArrowInvalid:
+            # Fragments saved with different schemas
+            data = pd.concat([table.to_pandas() for table in tables],
+                             ignore_index=True)
+        if empty:
+            data = data.iloc[:0]
+        elif filters:
+            data = data[self._matches(data, filters)].reset_index(drop=True)
+        return data if columns is None else data[list(columns)]
+
+    def _read_row_groups(self, path: Path, columns: List[str], filters: List,
+                         load_args: Dict[str, Any]) -> List[pa.Table]:
+        # Row groups of a fragment whose statistics allow a match
+        parquet_file = pq.ParquetFile(str(path))
+        metadata = parquet_file.metadata
+        return [parquet_file.read_row_group(group, columns=columns, **load_args)
+                for group in range(metadata.num_row_groups)
+                if self._may_match(metadata.row_group(group), filters)]
+
+    @staticmethod
+    def _may_match(row_group: Any, filters: List) -> bool:
+        # Whether the min/max statistics of the row group allow a match
+        if not filters:
+            return True
+        bounds = {}
+        for number in range(row_group.num_columns):
+            column = row_group.column(number)
+            if column.is_stats_set and column.statistics.has_min_max:
+                bounds[column.path_in_schema] = (column.statistics.min,
+                                                 column.statistics.max)
+
+        def possible(column: str, operation: str, value: Any) -> bool:
+            if column not in bounds:
+                return True
+            low, high = bounds[column]
+            try:
+                if operation in ("=", "=="):
+                    return low <= value <= high
+                if operation in ("<", "<="):
+                    return OPERATORS[operation](low, value)
+                if operation in (">", ">="):
+                    return OPERATORS[operation](high, value)
+                if operation == "in":
+                    return any(low <= item <= high for item in value)
+            except TypeError:
+                # Statistics of a type that does not compare with the value
+                pass
+            return True
+
+        return any(all(possible(*predicate) for predicate in conjunction)
+                   for conjunction in filters)
+
+    @staticmethod
+    def _matches(data: pd.DataFrame, filters: List) -> pd.Series:
+        matches = pd.Series(False, index=data.index)
+        for conjunction in filters:
+            conjunction_matches = pd.Series(True, index=data.index)
+            for column, operation, value in conjunction:
+                if operation == "in":
+                    conjunction_matches &= data[column].isin(value)
+                elif operation == "not in":
+                    conjunction_matches &= ~data[column].isin(value)
+                elif operation in OPERATORS:
+                    conjunction_matches &= OPERATORS[operation](data[column], value)
+                else:
+                    raise DataSetError(
+                        f"`{operation}` is not a valid filter operator.")
+            matches |= conjunction_matches
+        return matches
+
+    def _prune(self, start: Any, end: Any, tickers: Iterable[str]) -> List[Path]:
+        # Fragments whose partitions may hold rows of the years and tickers
+        first = pd.Timestamp(start).year if start is not None else None
+        last = pd.Timestamp(end).year if end is not None else None
+        buckets = self._layout().get("ticker_buckets")
+        wanted = None
+        if buckets and tickers is not None:
+            wanted = {self._bucket(ticker, buckets) for ticker in tickers}
+
+        root = Path(self._filepath.as_posix())
+        fragments = []
+        for fragment in self._fragments():
+            partition = dict(part.split("=", 1)
+                             for part in fragment.relative_to(root).parent.parts
+                             if "=" in part)
+            year = int(partition["year"]) if "year" in partition else None
+            if year is not None and ((first is not None and year < first)
+                                     or (last is not None and year > last)):
+                continue
+            if (wanted is not None and "bucket" in partition
+                    and int(partition["bucket"]) not in wanted):
+                continue
+            fragments.append(fragment)
+        return fragments
+
+    def _typed_filters(self, filters: List) -> List:
+        # Filters written in YAML compare the date columns with strings
+        if filters and isinstance(filters[0][0], (list, tuple)):
+            return [self._typed_filters(conjunction) for conjunction in filters]
+
+        typed = []
+        for column, operator, value in filters:
+            if column in self._date_columns:
+                if operator in ("in", "not in"):
+                    value = [pd.Timestamp(item) for item in value]
+                else:
+                    value = pd.Timestamp(value)
+            typed.append((column, operator, value))
+        return typed
+
+    def _save(self, data: pd.DataFrame) -> None:
+        if data.empty:
+            return
+
+        data = data.copy()
+        for column in self._date_columns:
+            data[column] = pd.to_datetime(data[column])
+
+        layout = self._new_layout()
+        if self._exists() and self._layout() != layout:
+            raise DataSetError(
+                f"`{self._filepath}` is partitioned as {self._layout()}, "
+                f"not as {layout}."
+            )
+        path = Path(self._filepath.as_posix())
+        if not self._layout_path().is_file():
+            # Recorded before the first fragment, so reads never see
+            # partition directories without their layout
+            path.mkdir(parents=True, exist_ok=True)
+            temp = self._layout_path().with_suffix(".tmp")
+            temp.write_text(json.dumps(layout))
+            os.replace(temp, self._layout_path())
+
+        if not self._partitioned():
+            self._write_fragment(path, data)
+            return
+
+        keys = {}
+        if self._partition_by_year:
+            keys["year"] = pd.to_datetime(data[self._date_column]).dt.year
+            if keys["year"].isna().any():
+                raise DataSetError(
+                    f"Rows without `{self._date_column}` cannot be "
+                    f"partitioned by year."
+                )
+        if self._ticker_buckets:
+            tickers = data[self._ticker_column]
+            buckets = {ticker: self._bucket(ticker, self._ticker_buckets)
+                       for ticker in tickers.unique()}
+            keys["bucket"] = tickers.map(buckets)
+
+        width = len(str(self._ticker_buckets - 1)) if self._ticker_buckets else 0
+        for values, partition_data in data.groupby(list(keys.values())):
+            values = dict(zip(keys, values))
+            directory = path
+            if "year" in values:
+                directory = directory / f"year={values['year']:04d}"
+            if "bucket" in values:
+                directory = directory / f"bucket={values['bucket']:0{width}d}"
+            self._write_fragment(directory, partition_data)
+
+    def _write_fragment(self, directory: Path, data: pd.DataFrame) -> None:
+        fragments = sorted(directory.glob("part-*.parquet"))
+        number = int(fragments[-1].stem[5:]) + 1 if fragments else 0
+        directory.mkdir(parents=True, exist_ok=True)
+        data.to_parquet(str(directory / f"part-{number:05d}.parquet"),
+                        **self._save_args)
+
+    def compact(self) -> None:
+        """Merges the fragments of each partition (or of the directory, if
+        not partitioned) into a single one, sorted by date and ticker."""
+        directories = {}
+        for fragment in self._fragments():
+            directories.setdefault(fragment.parent, []).append(fragment)
+
+        for directory, fragments in directories.items():
+            if len(fragments) < 2:
+                continue
+            data = pd.concat([pq.read_table(str(f)).to_pandas() for f in fragments],
+                             ignore_index=True)
+            order = [column for column in (self._date_column, self._ticker_column)
+                     if column in data.columns]
+            if order:
+                data = data.sort_values(order, kind="stable")
+
+            # Written aside first, so the fragments are only removed once
+            # their rows are safe in the new one
+            temp = directory / "compacted.tmp"
+            data.to_parquet(str(temp), **self._save_args)
+            for fragment in fragments:
+                fragment.unlink()
+            os.replace(temp, directory / "part-00000.parquet")
+
+    def _exists(self) -> bool:
+        return bool(self._fragments())
@@ -0,0 +1,316 @@
+from io import BytesIO
+from pathlib import Path
+from typing import Any, BinaryIO, Dict, Iterable, Tuple
+import csv
+import os
+
+import numpy as np
+import pandas as pd
+
+from kedro.io.core import DataSetError
+
+CHUNK_SIZE = 64 * 1024 * 1024
+
+# Options of pd.read_csv describing how a CSV file is written; all but
+# "delimiter" are options of DataFrame.to_csv as well
+DIALECT_ARGS = ("sep", "delimiter", "encoding", "quotechar", "quoting",
+                "escapechar", "doublequote")
+
+
+def csv_dialect(load_args: Dict[str, Any],
+                save_args: Dict[str, Any] = None) -> Dict[str, Any]:
+    """Returns the pd.read_csv options describing how a CSV file is written:
+    those of ``save_args``, overridden by those of ``load_args``."""
+    load_args = load_args or {}
+    args = dict(save_args or {})
+    if "delimiter" in load_args:
+        args.pop("sep", None)
+    args.update(load_args)
+    return {name: args[name] for name in DIALECT_ARGS if name in args}
+
+
+def row_offsets(file: BinaryIO, start: int,
+                dialect: Dict[str, Any]) -> np.ndarray:
+    """Returns the byte offsets where the rows of a CSV file start, from
+    ``start`` on, followed by the size of the file. A newline ends a row
+    only when it is not inside a quoted value, as pd.read_csv reads it.
+
+    Args:
+        file: CSV file opened in binary mode.
+        start: Offset of the first row.
+        dialect: pd.read_csv options describing how the file is written,
+            as returned by ``csv_dialect``.
+    """
+    quote = None
+    if dialect.get("quoting", csv.QUOTE_MINIMAL) != csv.QUOTE_NONE:
+        quote = dialect.get("quotechar", '"').encode(
+            dialect.get("encoding") or "utf-8")[0]
+
+    ends = []
+    quotes = 0
+    file.seek(start)
+    position = start
+    chunk = file.read(CHUNK_SIZE)
+    while chunk:
+        array = np.frombuffer(chunk, np.uint8)
+        newlines = np.flatnonzero(array == 10)
+        if quote is not None:
+            # Quotes before each newline, escaped ones ("") counting twice
+            quoted = np.flatnonzero(array == quote)
+            before = quotes + np.searchsorted(quoted, newlines)
+            newlines = newlines[before % 2 == 0]
+            quotes += len(quoted)
+        ends.append(newlines + position + 1)
+        position += len(chunk)
+        chunk = file.read(CHUNK_SIZE)
+
+    ends = np.concatenate(ends) if ends else np.array([], np.int64)
+    if position > start and (not len(ends) or ends[-1] != position):
+        ends = np.append(ends, position)
+    return np.concatenate([[start], ends]).astype(np.int64)
+
+
+def date_text(dates: pd.Series) -> pd.Series:
+    """Returns dates read as text in the %Y-%m-%d format. Files written
+    before the parser kept dates as days hold them as "%Y-%m-%d 00:00:00",
+    so the two formats may be mixed in the same file."""
+    return dates.astype(str).str[:10]
+
+
+class CSVIndex:
+    """Sidecar index of the rows of a CSV file by ticker and by date.
+
+    The index is kept in ``<filepath>.idx.npz`` and holds the byte offset
+    of every row, plus, for each ticker and each date, the rows where it
+    appears. A lookup reads only the byte ranges of the matching rows, so
+    its cost depends on the size of the answer and not on the size of the
+    file. The size and modification time of the CSV file are stored with
+    the index, which is rebuilt when they no longer match.
+
+    Example:
+    ::
+
+        >>> from ml_invest.io.csv_index import CSVIndex
+        >>>
+        >>> index = CSVIndex("data/01_raw/ibov_agg/ibov_dataset.csv")
+        >>> itub4 = index.read(index.rows(tickers=["ITUB4"]))
+        >>> last_close = itub4.preco_ultimo.iloc[-1]
+
+    """
+
+    def __init__(
+        self,
+        filepath: str,
+        date_column: str = "data_pregao",
+        ticker_column: str = "cod_papel",
+        load_args: Dict[str, Any] = None,
+    ) -> None:
+        """Creates a new index of a CSV file.
+
+        Args:
+            filepath: Path to the indexed CSV file.
+            date_column: Column with the dates, written as %Y-%m-%d.
+            ticker_column: Column with the tickers.
+            load_args: Pandas options for loading the CSV file. Only those
+                describing how it is written (separator, encoding, quoting)
+                are used to index it.
+        """
+        self._filepath = Path(filepath)
+        self._path = Path(f"{filepath}.idx.npz")
+        self._date_column = date_column
+        self._ticker_column = ticker_column
+        self._dialect = csv_dialect(load_args)
+        self._arrays = None  # type: Dict[str, np.ndarray]
+
+    def stat(self) -> Tuple[int, int]:
+        """Returns the size and the modification time (ns) of the CSV file,
+        or None if it does not exist."""
+        if not self._filepath.is_file():
+            return None
+        stat = self._filepath.stat()
+        return stat.st_size, stat.st_mtime_ns
+
+    def _load(self) -> Dict[str, np.ndarray]:
+        if self._arrays is None and self._path.is_file():
+            with np.load(str(self._path)) as arrays:
+                self._arrays = dict(arrays)
+        return self._arrays
+
+    def is_fresh(self) -> bool:
+        """Returns whether the index matches the current CSV file."""
+        arrays = self._load()
+        return arrays is not None and tuple(arrays["stat"]) == self.stat()
+
+    def ensure(self) -> None:
+        """Rebuilds the index if it is missing or stale."""
+        if not self.is_fresh():
+            self.rebuild()
+
+    def rebuild(self) -> None:
+        """Indexes the whole CSV file."""
+        with open(self._filepath, "rb") as file:
+            header = file.readline()
+        columns = pd.read_csv(BytesIO(header), **self._dialect).columns
+
+        offsets, dates, tickers = self._index_rows(len(header), columns)
+        date_values, date_codes = np.unique(dates, return_inverse=True)
+        ticker_values, ticker_codes = np.unique(tickers, return_inverse=True)
+
+        self._write(dict(
+            header=np.array([header]),
+            offsets=offsets,
+            date_values=date_values,
+            date_codes=date_codes,
+            ticker_values=ticker_values,
+            ticker_codes=ticker_codes,
+        ))
+
+    def append(self, previous: Tuple[int, int]) -> None:
+        """Updates the index after rows were appended to the CSV file.
+
+        Args:
+            previous: ``stat()`` of the CSV file before the rows were
+                appended. Only the new bytes are indexed if the index matched
+                the file at that point, otherwise the index is rebuilt.
+        """
+        arrays = self._load()
+        if arrays is None or previous is None or tuple(arrays["stat"]) != previous:
+            self.rebuild()
+            return
+
+        columns = pd.read_csv(BytesIO(arrays["header"][0]),
+                              **self._dialect).columns
+        offsets, dates, tickers = self._index_rows(previous[0], columns)
+
+        date_values, date_codes = self._merge_codes(
+            arrays["date_values"], arrays["date_codes"], dates)
+        ticker_values, ticker_codes = self._merge_codes(
+            arrays["ticker_values"], arrays["ticker_codes"], tickers)
+
+        self._write(dict(
+            header=arrays["header"],
+            offsets=np.concatenate([arrays["offsets"][:-1], offsets]),
+            date_values=date_values,
+            date_codes=date_codes,
+            ticker_values=ticker_values,
+            ticker_codes=ticker_codes,
+        ))
+
+    @staticmethod
+    def _merge_codes(values: np.ndarray, codes: np.ndarray,
+                     new: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        merged = np.union1d(values, new)
+        return merged, np.concatenate([
+            np.searchsorted(merged, values)[codes],
+            np.searchsorted(merged, new),
+        ])
+
+    def _index_rows(self, start: int,
+                    columns: pd.Index) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        # Byte offsets of the rows from start until the end of the file
+        with open(self._filepath, "rb") as file:
+            offsets = row_offsets(file, start, self._dialect)
+            position = offsets[-1]
+
+            file.seek(start)
+            values = pd.read_csv(
+                file, header=None, names=columns,
+                usecols=[self._date_column, self._ticker_column],
+                dtype=str, keep_default_na=False, skip_blank_lines=False,
+                **self._dialect,
+            ) if position > start else pd.DataFrame(
+                columns=[self._date_column, self._ticker_column])
+
+        if len(values) != len(offsets) - 1:
+            raise DataSetError(
+                f"`{self._filepath}` has rows spanning several lines "
+                f"and cannot be indexed."
+            )
+        return (offsets,
+                date_text(values[self._date_column]).to_numpy(dtype=str),
+                values[self._ticker_column].to_numpy(dtype=str))
+
+    def _write(self, arrays: Dict[str, np.ndarray]) -> None:
+        # Rows of each ticker and of each date, in the order of the file
+        for name in ("date", "ticker"):
+            codes = arrays[f"{name}_codes"]
+            arrays[f"{name}_order"] = np.argsort(codes, kind="stable")
+            arrays[f"{name}_bounds"] = np.searchsorted(
+                codes[arrays[f"{name}_order"]],
+                np.arange(len(arrays[f"{name}_values"]) + 1))
+        arrays["stat"] = np.array(self.stat(), dtype=np.int64)
+
+        temp = self._path.with_suffix(".tmp")
+        with open(temp, "wb") as file:
+            np.savez(file, **arrays)
+        os.replace(temp, self._path)
+        self._arrays = arrays
+
+    def rows(self, tickers: Iterable[str] = None, start: Any = None,
+             end: Any = None) -> np.ndarray:
+        """Returns the rows matching the tickers and the date range, in the
+        order of the file. The index is rebuilt first if it is stale.
+
+        Args:
+            tickers: Tickers of the rows, all of them if None.
+            start: First date of the rows (inclusive).
+            end: Last date of the rows (inclusive).
+
+        Returns:
+            Numbers of the rows, starting from 0 after the header.
+        """
+        self.ensure()
+        arrays = self._arrays
+
+        dates = arrays["date_values"]
+        low = 0 if start is None else np.searchsorted(
+            dates, pd.Timestamp(start).strftime("%Y-%m-%d"), "left")
+        high = len(dates) if end is None else np.searchsorted(
+            dates, pd.Timestamp(end).strftime("%Y-%m-%d"), "right")
+
+        if tickers is None:
+            bounds = arrays["date_bounds"]
+            rows = arrays["date_order"][bounds[low]:bounds[high]]
+            return np.sort(rows)
+
+        values = arrays["ticker_values"]
+        tickers = np.asarray(list(tickers), dtype=values.dtype)
+        codes = np.searchsorted(values, tickers)
+        codes = codes[(codes < len(values))
+                      & (values[np.minimum(codes, len(values) - 1)] == tickers)]
+
+        bounds = arrays["ticker_bounds"]
+        order = arrays["ticker_order"]
+        rows = np.concatenate(
+            [order[bounds[code]:bounds[code + 1]] for code in codes]
+            or [np.array([], np.int64)])
+
+        if start is not None or end is not None:
+            date_codes = arrays["date_codes"][rows]
+            rows = rows[(date_codes >= low) & (date_codes < high)]
+        return np.sort(rows)
+
+    def read(self, rows: np.ndarray, **load_args: Any) -> pd.DataFrame:
+        """Reads only the given rows of the CSV file.
+
+        Args:
+            rows: Numbers of the rows, as returned by ``rows``.
+            load_args: Pandas options for loading CSV files.
+
+        Returns:
+            The rows, parsed by pd.read_csv.
+        """
+        self.ensure()
+        offsets = self._arrays["offsets"]
+        parts = [self._arrays["header"][0]]
+
+        if len(rows):
+            # Contiguous rows are read at once
+            breaks = np.flatnonzero(np.diff(rows) != 1) + 1
+            with open(self._filepath, "rb") as file:
+                for run in np.split(rows, breaks):
+                    file.seek(offsets[run[0]])
+                    parts.append(file.read(offsets[run[-1] + 1] - offsets[run[0]]))
+
+        return pd.read_csv(BytesIO(b"".join(parts)), **dict(
+            csv_dialect(load_args, self._dialect), **load_args))
@@ -0,0 +1,277 @@
+from copy import deepcopy
+from functools import partial
+from io import BytesIO
+from pathlib import Path, PurePosixPath
+from typing import Any, Callable, Dict, Iterable, List, Union
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from kedro.io.core import AbstractDataSet, DataSetError
+
+from .csv_index import csv_dialect, date_text, row_offsets
+
+MANIFEST = "_manifest.json"
+
+
+class WatermarkedCSVDataSet(AbstractDataSet):
+    """``WatermarkedCSVDataSet`` loads/saves partitions of data from/to local
+    CSV files, like a ``PartitionedDataSet`` of ``pandas.CSVDataSet``, and
+    keeps a watermark of each partition so that the new rows can be read
+    without parsing the whole partition.
+
+    Every partition is saved sorted by ``watermark_column`` (dates written
+    as %Y-%m-%d) and ``_manifest.json``, next to the partitions, holds its
+    first and last date (the watermark) and the byte offset where each date
+    starts. ``load`` returns a loader per partition, like a
+    ``PartitionedDataSet``; called with ``since`` and ``columns`` it skips
+    partitions older than ``since``, seeks straight to the first new row and
+    parses only the columns asked for. Partitions written by other means are
+    added to the manifest the first time they are loaded.
+
+    A partition may also be saved lazily, as a function returning an
+    iterable of DataFrames: the batches are written one after the other as
+    they are produced, each one sorted, so the partition is never held in
+    memory whole. If the batches do not come in date order the partition
+    is still saved, but it is read whole when loaded with ``since``.
+
+    Example:
+    ::
+
+        >>> from ml_invest.io import WatermarkedCSVDataSet
+        >>> import pandas as pd
+        >>>
+        >>> data = pd.DataFrame({"data_pregao": ["2020-07-14", "2020-07-15"],
+        >>>                      "cod_papel": ["PETR4", "PETR4"],
+        >>>                      "preco_ultimo": [21.5, 21.9]})
+        >>>
+        >>> data_set = WatermarkedCSVDataSet(path="data/01_raw/ibov_csv/")
+        >>> data_set.save({"year=2020": data})
+        >>> loaders = data_set.load()
+        >>> new = loaders["year=2020"](since="2020-07-15",
+        >>>                            columns=["cod_papel", "preco_ultimo"])
+
+    """
+    DEFAULT_LOAD_ARGS = {}  # type: Dict[str, Any]
+    DEFAULT_SAVE_ARGS = {"index": False, "date_format": "%Y-%m-%d"}
+
+    def __init__(
+        self,
+        path: str,
+        filename_suffix: str = ".csv",
+        watermark_column: str = "data_pregao",
+        load_args: Dict[str, Any] = None,
+        save_args: Dict[str, Any] = None,
+    ) -> None:
+        """Creates a new instance of ``WatermarkedCSVDataSet`` pointing to a
+        local directory of CSV partitions.
+
+        Args:
+            path: Path in POSIX format to the directory of the partitions.
+            filename_suffix: Suffix of the partition files, removed from
+                their names to get the partition ids.
+            watermark_column: Column with the dates of the rows, written as
+                %Y-%m-%d.
+            load_args: Pandas options for loading CSV files.
+                Here you can find all available arguments:
+                https://pandas.pydata.org/pandas-docs/stable/generated/pandas.read_csv.html
+            save_args: Pandas options for saving CSV files.
+                Here you can find all available arguments:
+                https://pandas.pydata.org/pandas-docs/stable/generated/pandas.DataFrame.to_csv.html
+                All defaults are preserved, but "index", which is set to
+                False, and "date_format", which is set to "%Y-%m-%d" so that
+                datetime64 columns are written as the watermark expects.
+        """
+        self._path = PurePosixPath(path)
+        self._filename_suffix = filename_suffix
+        self._watermark_column = watermark_column
+
+        # Handle default load and save arguments
+        self._load_args = deepcopy(self.DEFAULT_LOAD_ARGS)
+        if load_args is not None:
+            self._load_args.update(load_args)
+
+        self._save_args = deepcopy(self.DEFAULT_SAVE_ARGS)
+        if save_args is not None:
+            self._save_args.update(save_args)
+
+    def _describe(self) -> Dict[str, Any]:
+        return dict(
+            path=self._path,
+            filename_suffix=self._filename_suffix,
+            watermark_column=self._watermark_column,
+            load_args=self._load_args,
+            save_args=self._save_args,
+        )
+
+    def _manifest_path(self) -> Path:
+        return Path(self._path.as_posix()) / MANIFEST
+
+    def _partition_path(self, partition: str) -> Path:
+        return Path(self._path.as_posix()) / f"{partition}{self._filename_suffix}"
+
+    def _list_partitions(self) -> List[str]:
+        root = Path(self._path.as_posix())
+        if not root.is_dir():
+            return []
+        partitions = []
+        for path in root.rglob(f"*{self._filename_suffix}"):
+            if path.is_file() and path.name != MANIFEST:
+                partition = path.relative_to(root).as_posix()
+                partitions.append(partition[:len(partition)
+                                            - len(self._filename_suffix)])
+        return sorted(partitions)
+
+    def read_manifest(self) -> Dict[str, Dict[str, Any]]:
+        """Returns the watermarks of the partitions by partition id: number
+        of rows, first and last date, dates and byte offsets where they
+        start, and the size and modification time (ns) of the file when it
+        was measured."""
+        path = self._manifest_path()
+        if not path.is_file():
+            return {}
+        return json.loads(path.read_text())
+
+    def _write_manifest(self, manifest: Dict[str, Dict[str, Any]]) -> None:
+        path = self._manifest_path()
+        temp = path.with_suffix(".tmp")
+        temp.write_text(json.dumps(manifest, indent=1, sort_keys=True))
+        os.replace(temp, path)
+
+    def _stat(self, partition: str) -> List[int]:
+        stat = self._partition_path(partition).stat()
+        return [stat.st_size, stat.st_mtime_ns]
+
+    def _measure(self, partition: str) -> Dict[str, Any]:
+        # Byte offsets of the rows and their dates
+        filepath = self._partition_path(partition)
+        with open(filepath, "rb") as file:
+            header = file.readline()
+            starts = row_offsets(file, len(header),
+                                 csv_dialect(self._load_args))[:-1]
+
+            file.seek(0)
+            dates = date_text(pd.read_csv(file, **dict(
+                self._load_args, usecols=[self._watermark_column], dtype=str,
+                keep_default_na=False, skip_blank_lines=False,
+            ))[self._watermark_column]).to_numpy(dtype=str)
+
+        watermark = dict(rows=len(dates), stat=self._stat(partition))
+        if not len(dates):
+            return watermark
+        values, rows = np.unique(dates, return_index=True)
+        watermark.update(first=str(values[0]), last=str(values[-1]))
+
+        # Offsets are only of use when the rows are in order and were split
+        # as pd.read_csv split them; otherwise the partition is read whole
+        if len(dates) == len(starts) and (dates[1:] >= dates[:-1]).all():
+            watermark.update(dates=values.tolist(),
+                             offsets=starts[rows].tolist())
+        return watermark
+
+    def watermark(self, partition: str) -> Dict[str, Any]:
+        """Returns the watermark of a partition, measuring the file first if
+        it is not in the manifest or changed since it was measured."""
+        manifest = self.read_manifest()
+        watermark = manifest.get(partition)
+        if watermark is None or watermark["stat"] != self._stat(partition):
+            watermark = self._measure(partition)
+            manifest[partition] = watermark
+            self._write_manifest(manifest)
+        return watermark
+
+    def _load(self) -> Dict[str, Callable[..., pd.DataFrame]]:
+        partitions = self._list_partitions()
+        if not partitions:
+            raise DataSetError(f"No partitions found in `{self._path}`")
+        return {partition: partial(self.load_partition, partition)
+                for partition in partitions}
+
+    def load_partition(self, partition: str, since: Any = None,
+                       columns: List[str] = None) -> pd.DataFrame:
+        """Loads a partition, or only its rows from a date on.
+
+        Args:
+            partition: Partition id.
+            since: First date loaded (inclusive), every row if None.
+            columns: Columns loaded, all of them if None.
+
+        Returns:
+            The rows whose date is since or later.
+        """
+        load_args = dict(self._load_args)
+        if columns is not None:
+            load_args["usecols"] = columns
+        filepath = self._partition_path(partition)
+
+        if since is None:
+            data = pd.read_csv(str(filepath), **load_args)
+            return data if columns is None else data[columns]
+
+        since = pd.Timestamp(since).strftime("%Y-%m-%d")
+        watermark = self.watermark(partition)
+        if not watermark["rows"] or watermark["last"] < since:
+            with open(filepath, "rb") as file:
+                header = file.readline()
+            data = pd.read_csv(BytesIO(header), **load_args)
+            return data if columns is None else data[columns]
+
+        if "offsets" not in watermark:
+            data = pd.read_csv(str(filepath), **dict(
+                load_args, usecols=None if columns is None
+                else list(dict.fromkeys(columns + [self._watermark_column]))))
+            data = data[date_text(data[self._watermark_column]) >= since]
+            return (data if columns is None else data[columns]).reset_index(drop=True)
+
+        # Only the bytes from the first new date on are parsed
+        first = int(np.searchsorted(watermark["dates"], since))
+        with open(filepath, "rb") as file:
+            header = file.readline()
+            file.seek(watermark["offsets"][first])
+            data = pd.read_csv(BytesIO(header + file.read()), **load_args)
+        return data if columns is None else data[columns]
+
+    def _save_batches(self, filepath: Path,
+                      batches: Iterable[pd.DataFrame]) -> bool:
+        # Written to a temporary file first, so that a failure halfway
+        # through does not leave a partial partition behind
+        temp = filepath.with_name(filepath.name + ".tmp")
+        encoding = self._save_args.get("encoding", "utf-8")
+        header = True
+        try:
+            with open(temp, "w", encoding=encoding, newline="") as file:
+                for batch in batches:
+                    batch = batch.sort_values(self._watermark_column,
+                                              kind="stable")
+                    batch.to_csv(file, **dict(self._save_args, header=header))
+                    header = False
+        except BaseException:
+            temp.unlink()
+            raise
+        if header:
+            temp.unlink()
+            return False
+        os.replace(temp, filepath)
+        return True
+
+    def _save(self, data: Dict[str, Union[
+            pd.DataFrame, Callable[[], Iterable[pd.DataFrame]]]]) -> None:
+        manifest = self.read_manifest()
+        for partition, partition_data in sorted(data.items()):
+            filepath = self._partition_path(partition)
+            filepath.parent.mkdir(parents=True, exist_ok=True)
+            if callable(partition_data):
+                # Partitions without any batch are not saved
+                if not self._save_batches(filepath, partition_data()):
+                    continue
+            else:
+                partition_data = partition_data.sort_values(
+                    self._watermark_column, kind="stable")
+                partition_data.to_csv(str(filepath), **self._save_args)
+            manifest[partition] = self._measure(partition)
+        self._write_manifest(manifest)
+
+    def _exists(self) -> bool:
+        return bool(self._list_partitions())
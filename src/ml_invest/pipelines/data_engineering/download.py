@@ -0,0 +1,364 @@
+"""Concurrent download of the B3 historical files
+"""
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Tuple
+from urllib.error import HTTPError
+from urllib.parse import urljoin, urlsplit
+import hashlib
+import http.client
+import json
+import logging
+import os
+import threading
+
+REDIRECTS = (301, 302, 303, 307, 308)
+CHUNK_SIZE = 1024 * 1024
+
+
+class ConnectionPool:
+    """Keeps one keep-alive HTTP connection per host and thread, so the
+    threads of ``fetch_all`` reuse their connections between files
+    """
+
+    def __init__(self, timeout: float = 60.0, max_redirects: int = 5) -> None:
+        """Creates a new connection pool
+
+        Args:
+            timeout (float): socket timeout in seconds
+            max_redirects (int): maximum number of redirects followed
+        """
+        self._timeout = timeout
+        self._max_redirects = max_redirects
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections = []  # type: List[http.client.HTTPConnection]
+
+    def _connection(self, scheme: str, netloc: str,
+                    fresh: bool = False) -> http.client.HTTPConnection:
+        connections = getattr(self._local, "connections", None)
+        if connections is None:
+            connections = self._local.connections = {}
+
+        key = (scheme, netloc)
+        if fresh and key in connections:
+            connections.pop(key).close()
+
+        if key not in connections:
+            if scheme == "https":
+                conn = http.client.HTTPSConnection(netloc, timeout=self._timeout)
+            else:
+                conn = http.client.HTTPConnection(netloc, timeout=self._timeout)
+            connections[key] = conn
+            with self._lock:
+                self._connections.append(conn)
+        return connections[key]
+
+    def request(self, method: str, url: str,
+                headers: Dict[str, str] = None) -> http.client.HTTPResponse:
+        """Sends a request through the pooled connection of the current thread,
+        following redirects. The response body must be read before the next
+        request of the same thread
+
+        Args:
+            method (str): HTTP method
+            url (str): url requested
+            headers (Dict[str, str]): request headers
+
+        Returns:
+            http.client.HTTPResponse: the response
+        """
+        for _ in range(self._max_redirects + 1):
+            parts = urlsplit(url)
+            path = parts.path or "/"
+            if parts.query:
+                path += "?" + parts.query
+
+            conn = self._connection(parts.scheme, parts.netloc)
+            try:
+                conn.request(method, path, headers=headers or {})
+                response = conn.getresponse()
+            except (http.client.HTTPException, ConnectionError):
+                # The server closed the kept-alive connection, try a new one
+                conn = self._connection(parts.scheme, parts.netloc, fresh=True)
+                conn.request(method, path, headers=headers or {})
+                response = conn.getresponse()
+
+            if response.status not in REDIRECTS:
+                return response
+
+            response.read()
+            url = urljoin(url, response.getheader("Location"))
+
+        raise HTTPError(url, response.status, "Too many redirects",
+                        response.headers, None)
+
+    def get(self, url: str) -> bytes:
+        """Downloads the contents of url
+
+        Args:
+            url (str): url to download
+
+        Returns:
+            bytes: the response body
+        """
+        response = self.request("GET", url)
+        body = response.read()
+        if response.status >= 400:
+            raise HTTPError(url, response.status, response.reason,
+                            response.headers, None)
+        return body
+
+    def close(self) -> None:
+        """Closes every connection opened by the pool"""
+        with self._lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections = []
+
+
+class DownloadCache:
+    """Local content-addressed cache of downloaded files.
+
+    The files are kept in ``objects/<sha256>`` and the metadata of each url
+    (ETag, Last-Modified, Content-Length and SHA-256 digest) in
+    ``urls/<sha256 of the url>.json``. Cached urls are requested with
+    conditional headers, so an unchanged file costs a single 304 response.
+    Transfers are written to ``partial/`` first and, when interrupted, are
+    resumed with a Range request.
+    """
+
+    def __init__(self, path: str, retries: int = 3) -> None:
+        """Creates a new download cache
+
+        Args:
+            path (str): directory of the cache
+            retries (int): attempts to resume an interrupted transfer
+        """
+        self._path = Path(path)
+        self._retries = retries
+        # Guards the objects shared by urls while fetch_all threads run
+        self._lock = threading.Lock()
+        for folder in ("objects", "urls", "partial"):
+            (self._path / folder).mkdir(parents=True, exist_ok=True)
+
+    @staticmethod
+    def _url_key(url: str) -> str:
+        return hashlib.sha256(url.encode("utf-8")).hexdigest()
+
+    def _metadata_path(self, url: str) -> Path:
+        return self._path / "urls" / f"{self._url_key(url)}.json"
+
+    def _partial_path(self, url: str) -> Path:
+        return self._path / "partial" / self._url_key(url)
+
+    def _object_path(self, digest: str) -> Path:
+        return self._path / "objects" / digest
+
+    def _read_json(self, path: Path) -> Dict[str, Any]:
+        if not path.is_file():
+            return {}
+        with open(path, "r", encoding="utf-8") as file:
+            return json.load(file)
+
+    def _write_json(self, path: Path, data: Dict[str, Any]) -> None:
+        temp = path.with_suffix(".tmp")
+        with open(temp, "w", encoding="utf-8") as file:
+            json.dump(data, file)
+        os.replace(temp, path)
+
+    def metadata(self, url: str) -> Dict[str, Any]:
+        """Returns the cached metadata of url
+
+        Args:
+            url (str): cached url
+
+        Returns:
+            Dict[str, Any]: etag, last_modified, content_length and sha256 of
+                the cached file, or an empty dict if url is not cached
+        """
+        metadata = self._read_json(self._metadata_path(url))
+        if metadata and not self._object_path(metadata["sha256"]).is_file():
+            return {}
+        return metadata
+
+    def load(self, url: str) -> bytes:
+        """Returns the cached contents of url, without using the network
+
+        Args:
+            url (str): cached url
+
+        Returns:
+            bytes: contents of the file
+        """
+        metadata = self.metadata(url)
+        if not metadata:
+            raise KeyError(f"{url} is not cached")
+        return self._object_path(metadata["sha256"]).read_bytes()
+
+    def fetch(self, pool: ConnectionPool, url: str) -> bytes:
+        """Returns the contents of url, downloading it only if the cached
+        copy is missing or outdated
+
+        Args:
+            pool (ConnectionPool): connections used for the requests
+            url (str): url to download
+
+        Returns:
+            bytes: contents of the file
+        """
+        for attempt in range(self._retries + 1):
+            try:
+                return self._fetch(pool, url)
+            except HTTPError:
+                raise
+            except (http.client.HTTPException, OSError):
+                # Dropped connections and socket timeouts alike
+                if attempt == self._retries:
+                    raise
+                log = logging.getLogger(__name__)
+                log.info(f"Download interrupted, resuming: {url}")
+
+    def _fetch(self, pool: ConnectionPool, url: str) -> bytes:
+        metadata = self.metadata(url)
+        partial_path = self._partial_path(url)
+        partial_meta_path = partial_path.with_suffix(".json")
+        partial_meta = self._read_json(partial_meta_path)
+
+        headers = {}
+        if metadata.get("etag"):
+            headers["If-None-Match"] = metadata["etag"]
+        if metadata.get("last_modified"):
+            headers["If-Modified-Since"] = metadata["last_modified"]
+
+        validator = partial_meta.get("etag") or partial_meta.get("last_modified")
+        offset = partial_path.stat().st_size if partial_path.is_file() else 0
+        if offset and validator:
+            headers["Range"] = f"bytes={offset}-"
+            headers["If-Range"] = validator
+
+        response = pool.request("GET", url, headers)
+
+        if response.status == 304:
+            response.read()
+            return self.load(url)
+
+        if response.status == 416 and "Range" in headers:
+            # Nothing left to send: the partial transfer may already hold
+            # the whole file, e.g. if it was interrupted before being stored
+            response.read()
+            total = response.getheader("Content-Range", "").rpartition("/")[2]
+            if not total.isdigit():
+                total = partial_meta.get("content_length")
+            if total is not None and int(total) == offset:
+                return self._store(url, metadata, partial_meta,
+                                   partial_path.read_bytes())
+            # Otherwise it is of no use, and the file is downloaded again
+            partial_path.unlink()
+            partial_meta_path.unlink()
+            return self._fetch(pool, url)
+
+        if response.status >= 400:
+            response.read()
+            raise HTTPError(url, response.status, response.reason,
+                            response.headers, None)
+
+        if response.status == 206:
+            total = response.getheader("Content-Range", "").rpartition("/")[2]
+            mode = "ab"
+        else:
+            total = response.getheader("Content-Length")
+            mode = "wb"
+            partial_meta = {
+                "etag": response.getheader("ETag"),
+                "last_modified": response.getheader("Last-Modified"),
+                "content_length": int(total) if total else None,
+            }
+            self._write_json(partial_meta_path, partial_meta)
+
+        # read1 returns what already arrived, so the bytes received before a
+        # timeout are kept for the resume
+        with open(partial_path, mode) as file:
+            chunk = response.read1(CHUNK_SIZE)
+            while chunk:
+                file.write(chunk)
+                chunk = response.read1(CHUNK_SIZE)
+
+        content = partial_path.read_bytes()
+        if total and total != "*" and len(content) != int(total):
+            raise http.client.IncompleteRead(content, int(total) - len(content))
+        return self._store(url, metadata, partial_meta, content)
+
+    def _store(self, url: str, metadata: Dict[str, Any],
+               partial_meta: Dict[str, Any], content: bytes) -> bytes:
+        # Promotes the complete partial transfer of url to a cached object
+        partial_path = self._partial_path(url)
+        digest = hashlib.sha256(content).hexdigest()
+        partial_meta.update(content_length=len(content), sha256=digest)
+        with self._lock:
+            os.replace(partial_path, self._object_path(digest))
+            partial_path.with_suffix(".json").unlink()
+
+            previous = metadata.get("sha256")
+            self._write_json(self._metadata_path(url), partial_meta)
+            if previous and previous != digest:
+                self._discard(previous)
+        return content
+
+    def _discard(self, digest: str) -> None:
+        # Called with the lock held, so no other url can start pointing to
+        # the object between the scan and the unlink
+        for path in (self._path / "urls").glob("*.json"):
+            if self._read_json(path).get("sha256") == digest:
+                return
+        self._object_path(digest).unlink()
+
+
+def fetch_all(urls: Dict[str, str],
+              max_connections: int = 4,
+              cache: DownloadCache = None,
+              optional: Iterable[str] = ()) -> Iterator[Tuple[str, bytes]]:
+    """Downloads the urls concurrently and yields each one as soon as it
+    is finished, so the caller can parse a file while the next ones are still
+    being downloaded. At most max_connections files are downloading or
+    waiting to be consumed at any time
+
+    Args:
+        urls (Dict[str, str]): key x url to be downloaded
+        max_connections (int): maximum number of simultaneous downloads
+        cache (DownloadCache): if given, files are fetched through the cache
+        optional (Iterable[str]): keys whose url may not exist; they are
+            yielded with None instead of raising an HTTPError 404
+
+    Yields:
+        Iterator[Tuple[str, bytes]]: key and contents of each url
+    """
+    pool = ConnectionPool()
+    optional = set(optional)
+
+    def fetch(key: str, value: str) -> bytes:
+        try:
+            if cache is None:
+                return pool.get(value)
+            return cache.fetch(pool, value)
+        except HTTPError as error:
+            if error.code == 404 and key in optional:
+                return None
+            raise
+
+    pending = {}
+    try:
+        with ThreadPoolExecutor(max_workers=max_connections) as executor:
+            for key, value in list(urls.items()):
+                if len(pending) >= max_connections:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        yield pending.pop(future), future.result()
+                pending[executor.submit(fetch, key, value)] = key
+
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield pending.pop(future), future.result()
+    finally:
+        pool.close()
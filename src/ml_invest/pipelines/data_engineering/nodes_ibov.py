@@ -1,13 +1,20 @@
-from typing import Dict, Tuple
-import urllib.request as url
+from typing import Any, Dict, Iterator, List, Tuple
+import io
+from .download import DownloadCache, fetch_all
 from .parser.bovesparser import BovesParser
+from ml_invest.io.csv_index import date_text
+from functools import partial
 from pathlib import Path
 import pandas as pd
 from typing import Callable
 import zipfile
-from datetime import datetime
+from datetime import datetime, timedelta
 import os
 import logging
+import re
+
+# Columns of the ibov partitions kept by agg_ibov_csv
+AGG_COLUMNS = ["data_pregao", "cod_papel", "preco_ultimo", "num_negocios"]
 
 def get_todays_date() -> str: 
     """Get todays date in year-month-day string formar
@@ -74,14 +81,63 @@ def get_raw_path() -> str:
     raw_path = proj_path.joinpath("data/01_raw")
     return str(raw_path.resolve())
 
+def get_ibov_daily_url(day: datetime, ibov_link: Dict[str, str]) -> str:
+    """Given a day returns the url to download the daily ibov data
+
+    Args:
+        day (datetime): reference day of the dataset to download
+        ibov_link (Dict[str, str]): Dict of the dataset url and file names
+
+    Returns:
+        str: ibov url to download the file
+    """
+    file = ibov_link["daily_file"] + day.strftime("%d%m%Y") + ".ZIP"
+    req_url = ibov_link["url"] + file
+    return req_url
+
+def get_partition_year(partition: str) -> int:
+    """Returns the year of an ibov partition, either a year partition
+    ("year=2020") or a day partition ("year=2020/day=2020-07-15")
+
+    Args:
+        partition (str): partition id
+
+    Returns:
+        int: year of the partition
+    """
+    return int(re.search(r"year=(\d{4})", partition).group(1))
+
+def get_missing_days(last_updated: str, today: datetime) -> List[datetime]:
+    """Returns the trading days (weekdays) from the day of the last update,
+    which may have been collected incomplete, up to today
+
+    Args:
+        last_updated (str): date of the last update
+        today (datetime): today's date
+
+    Returns:
+        List[datetime]: days that may have new data
+    """
+    day = datetime.strptime(last_updated, "%Y-%m-%d")
+    days = []
+    while day <= today:
+        if day.weekday() < 5:
+            days.append(day)
+        day += timedelta(days=1)
+    return days
+
 def update_if_outdated(last_updated: Dict[str, str], df: pd.DataFrame,
-        ibov_link: Dict[str, str]) -> pd.DataFrame:
-    """Update the data partitions in df if our data is outdated
+        ibov_link: Dict[str, str], max_daily_files: int = 0) -> pd.DataFrame:
+    """Update the data partitions in df if our data is outdated. Small gaps
+    are filled with the daily files (COTAHIST_D), one partition per day, and
+    larger ones with the annual file of the current year
 
     Args:
         last_updated (Dict[str, str]): data of the last update
         df (pd.DataFrame): DataFrame with the dataset partition list
         ibov_link (Dict[str, str]): Dict of the dataset url and file name
+        max_daily_files (int): largest gap, in trading days, updated with
+            the daily files
 
     Returns:
         pd.DataFrame: dataframe with the partitions of data
@@ -91,49 +147,114 @@ def update_if_outdated(last_updated: Dict[str, str], df: pd.DataFrame,
 
     last_date = datetime.strptime(last_updated, "%Y-%m-%d")
     if today > last_date:
-        year = today.strftime("%Y")
-        df[f"year={year}"] = get_ibov_url(year, ibov_link)
+        days = get_missing_days(last_updated, today)
+        if "daily_file" in ibov_link and len(days) <= max_daily_files:
+            for day in days:
+                partition = f"year={day.year}/day={day.strftime('%Y-%m-%d')}"
+                df[partition] = get_ibov_daily_url(day, ibov_link)
+        else:
+            year = today.strftime("%Y")
+            df[f"year={year}"] = get_ibov_url(year, ibov_link)
     return df
 
 def get_ibov_data(ibov_urls: Dict[str, str], last_updated: str,
-        ibov_link: Dict[str, str]) -> Dict[str, str]:
-    """Download the partitions of the dataset if not already downloaded
+        ibov_link: Dict[str, str],
+        ibov_parser: Dict[str, Any] = None,
+        ibov_download: Dict[str, Any] = None
+        ) -> Dict[str, Callable[[], Iterator[pd.DataFrame]]]:
+    """Download the partitions of the dataset if not already downloaded.
+    The files are downloaded concurrently, but only the zip archives are
+    kept: each partition is parsed lazily, batch by batch, while it is
+    saved (see parse_zip and WatermarkedCSVDataSet)
 
     Args:
         ibov_urls (Dict[str, str]): partition x url to be downloaded
         last_updated (str): date of the last update
         ibov_link (Dict[str, str]): Dict of the dataset url and file name
+        ibov_parser (Dict[str, Any]): options passed to parse_zip
+        ibov_download (Dict[str, Any]): download options (max_connections,
+            cache_dir, max_daily_files)
 
     Returns:
-        Dict[str, str]: the downloaded data
+        Dict[str, Callable[[], Iterator[pd.DataFrame]]]: partition x
+            function yielding the parsed data of the partition
     """
     data = ibov_urls
-    path = get_raw_path()
-    ibov_urls = update_if_outdated(last_updated, ibov_urls, ibov_link)
+    ibov_download = ibov_download or {}
+    ibov_urls = update_if_outdated(last_updated, ibov_urls, ibov_link,
+                                   ibov_download.get("max_daily_files", 0))
 
     log = logging.getLogger(__name__)
 
-    for key, value in ibov_urls.items():
+    for value in ibov_urls.values():
         log.info(f"Downloading data from B3: {value}")
-        filename = value.split("/")[-1]
-        save_file = os.path.join(path, filename)
 
-        with url.urlopen(value) as response, open(save_file, "wb") as out_file:
-            year_data = response.read()
-            out_file.write(year_data) 
-        df = clean_extract(filename, path)
-        df = df.drop_duplicates()
-        data[key] = df
+    max_connections = ibov_download.get("max_connections", 4)
+    cache = None
+    if ibov_download.get("cache_dir"):
+        cache = DownloadCache(ibov_download["cache_dir"])
+
+    # There are no daily files for holidays
+    days = [key for key in ibov_urls if "/day=" in key]
+    downloads = fetch_all(ibov_urls, max_connections, cache, optional=days)
+    for key, year_data in downloads:
+        if year_data is None:
+            log.info(f"No data published by B3: {key}")
+            del data[key]
+            continue
+        log.info(f"Downloaded data from B3: {key}")
+        data[key] = partial(parse_zip, year_data, ibov_parser)
 
     return data
 
-def clean_extract(file: str, path: str) -> pd.DataFrame:
+def parse_zip(content: bytes,
+        ibov_parser: Dict[str, Any] = None) -> Iterator[pd.DataFrame]:
+    """Parse the IBOV TXT files inside a zip archive held in memory. Each
+    member is decompressed in chunks straight into BovesParser, so nothing
+    is written to disk. With "tamanho_lote" in ibov_parser the members are
+    read with BovesParser.ler_lotes, and only one batch of that many lines
+    is held in memory at a time
+
+    Args:
+        content (bytes): contents of the zip file
+        ibov_parser (Dict[str, Any]): options passed to BovesParser.ler_lotes
+            if "tamanho_lote" is set, to BovesParser.ler_arquivo otherwise
+
+    Yields:
+        Iterator[pd.DataFrame]: DataFrame with the data of each batch, or of
+            each TXT file
+    """
+    options = dict(ibov_parser or {})
+    tamanho_lote = options.pop("tamanho_lote", None)
+    if tamanho_lote:
+        # Batches are parsed serially
+        options.pop("num_processos", None)
+        options.pop("tamanho_bloco", None)
+
+    parser = None
+    with zipfile.ZipFile(io.BytesIO(content)) as data:
+        for zipinfo in data.infolist():
+            with data.open(zipinfo) as member:
+                # The same parser reads every member, one after the other
+                if parser is None:
+                    parser = BovesParser(fluxo=member)
+                else:
+                    parser.abrir(fluxo=member)
+                if tamanho_lote:
+                    yield from parser.ler_lotes(tamanho_lote, **options)
+                else:
+                    parser.ler_arquivo(**options)
+                    yield parser.exportar_dataframe()
+
+def clean_extract(file: str, path: str,
+        ibov_parser: Dict[str, Any] = None) -> pd.DataFrame:
     """Extract a zip files containing a IBOV TXT, convert it to DataFranme
     and deletes the temp files
 
     Args:
         file (str): file to extract
         path (str): path of the file
+        ibov_parser (Dict[str, Any]): options passed to BovesParser.ler_arquivo
 
     Returns:
         pd.DataFrame: DataFrame with the data
@@ -151,34 +272,40 @@ def clean_extract(file: str, path: str) -> pd.DataFrame:
             zipinfo.filename = name
             data.extract(zipinfo, path=path)
     strfile = file[:14] + ".TXT"
-    df = data_to_csv(strfile, path)
+    df = data_to_csv(strfile, path, ibov_parser)
     os.remove(os.path.join(path, strfile))
     os.remove(os.path.join(path, file))
     return df
 
-def data_to_csv(file: str, path: str) -> pd.DataFrame:
-    """Converts the data in the IBOV TXT to DataFrame using BovesParser
+def data_to_csv(file: str, path: str,
+        ibov_parser: Dict[str, Any] = None) -> pd.DataFrame:
+    """Converts the data in the IBOV TXT to DataFrame using BovesParser.
+    The columns are typed (see BovesParser.exportar_dataframe): text is
+    category and dates are datetime64[ns], not str as when the data went
+    through a temporary CSV file
 
     Args:
         file (str): file name
         path (str): file path
+        ibov_parser (Dict[str, Any]): options passed to BovesParser.ler_arquivo
 
     Returns:
         pd.DataFrame: data extracted
     """
     parser = BovesParser(os.path.join(path, file))
-    parser.ler_arquivo()
-    parser.exportar_csv(os.path.join(path, "temp.csv"))
-    df = pd.read_csv(os.path.join(path, "temp.csv"), delimiter=";")
-    os.remove(os.path.join(path, "temp.csv"))
-    return df
+    parser.ler_arquivo(**(ibov_parser or {}))
+    return parser.exportar_dataframe()
 
-def agg_ibov_csv(ibov_csv: Dict[str, Callable[[], pd.DataFrame]], 
+def agg_ibov_csv(ibov_csv: Dict[str, Callable[..., pd.DataFrame]],
                  last_updated: str) -> Tuple[pd.DataFrame, str]:
-    """Aggragate all data from the partitions collected in a singe CSV
+    """Aggragate all data from the partitions collected in a singe CSV.
+    Only the rows since the last update and the columns kept are read from
+    each partition (see WatermarkedCSVDataSet), so an update costs in
+    proportion to the new data
 
     Args:
-        ibov_csv (Dict[str, Callable[[], pd.DataFrame]]): input data loader
+        ibov_csv (Dict[str, Callable[..., pd.DataFrame]]): input data loader,
+            taking the first date and the columns to load
         last_updated (str): date of the last update
 
     Returns:
@@ -188,24 +315,29 @@ def agg_ibov_csv(ibov_csv: Dict[str, Callable[[], pd.DataFrame]],
     today = get_todays_date()
     log = logging.getLogger(__name__)
     for partition, load_csv in ibov_csv.items():
-        if int(partition[-4:]) < int(last_updated[:4]):
+        if get_partition_year(partition) < int(last_updated[:4]):
             log.info(f"Partition already extracted: {partition}")
             continue
         elif today > last_updated:
             log.info(f"Getting new data: {partition}")
-            csv = load_csv()
-            csv = csv.loc[:, ["data_pregao", "cod_papel",
-                            "preco_ultimo", "num_negocios"]]
-            csv = csv.loc[csv.data_pregao > last_updated, :]
+            # data_pregao is saved as "%Y-%m-%d", so the day of the last
+            # update is collected again in case it was still incomplete
+            csv = load_csv(since=last_updated, columns=AGG_COLUMNS)
+            if csv.empty:
+                log.info(f"No new data: {partition}")
+                continue
+            # Partitions saved before the parser typed its dates hold them as
+            # "%Y-%m-%d 00:00:00": every date is passed on as "%Y-%m-%d"
+            csv["data_pregao"] = date_text(csv["data_pregao"])
             concattable.append(csv)
         else:
             log.info(f"Partition already extracted today: {partition}")
 
     if concattable:
+        # Rows already in ibov_dataset, such as those of the day of the last
+        # update, replace the old ones when saved (see its keys)
         ret = pd.concat(concattable)
-        ret = ret.drop_duplicates()
         print(f"New data collected: {ret.shape[0]}")
         return ret, get_todays_date()
     else:
         return pd.DataFrame(), today
-    
@@ -1,12 +1,28 @@
 # -*- encoding: utf-8 -*-
 import csv
+import io
 import json
 import locale
-import operator
+import os
 import re
 
 from datetime import datetime
-from .linecount import rawbigcount
+from itertools import islice
+from .colunas import novas_colunas
+from .filtros import aplicar_mascara
+from .filtros import mascara
+from .filtros import operadores
+from .mapeamento import mapear
+from .paralelo import ler_blocos
+from .paralelo import ler_paralelo
+from .paralelo import tamanho_bloco_padrao
+from .posicional import decodificar_linhas
+from .posicional import tamanho_registro
+from .prefiltro import aceitar_linha
+from .prefiltro import compilar_prefiltro
+from .vetorizado import decodificar_buffer
+from .vetorizado import para_dataframe
+from .vetorizado import tamanho_linha
 from .regex import regex_cabecalho
 from .regex import regex_cauda
 from .regex import regex_cotacao
@@ -18,20 +34,54 @@ class BovesParser( object ):
     # Atributos estáticos
     # --------------------------------------------------------------------------
 
-    operadores = {
-        '==': operator.eq,
-        '!=': operator.ne,
-        '>=': operator.ge,
-        '<=': operator.le,
-        '>': operator.gt,
-        '<': operator.le,
-        'in': operator.contains,
-    }
+    # Operadores aceitos nos filtros (ver filtros.py)
+    operadores = operadores
+
+    # Motores de leitura disponíveis em ler_arquivo()
+    motores = (
+        'posicional',
+        'regex',
+        'numpy',
+    )
 
     # --------------------------------------------------------------------------
     # Métodos
     # --------------------------------------------------------------------------
-    def __init__( self, endereco_arquivo = None ):
+    def __init__( self, endereco_arquivo = None, fluxo = None ):
+        '''
+        "endereco_arquivo": Endereço do arquivo COTAHIST descompactado.
+        "fluxo": Alternativamente, um objeto binário já aberto (ex.: o membro
+                 de um arquivo ZIP aberto com zipfile.ZipFile.open()). O
+                 conteúdo é lido sob demanda, sem ser gravado em disco.
+
+        O estado (arquivo, colunas e metadados) pertence a cada instância, e
+        a mesma instância pode ler vários arquivos em sequência (ver abrir()).
+        '''
+        self.arquivo = None
+        self.reiniciar()
+        self.abrir( endereco_arquivo, fluxo )
+
+
+    def __del__( self ):
+        self.fechar()
+
+
+    def abrir( self, endereco_arquivo = None, fluxo = None ):
+        '''
+        Fecha o arquivo atual, descarta os dados lidos e passa a usar o novo
+        arquivo ( "endereco_arquivo" ou "fluxo", como no construtor ).
+        '''
+        self.fechar()
+        self.reiniciar()
+
+        self.endereco_arquivo = None
+        self.num_linhas = None
+
+        if fluxo is not None:
+            self.arquivo = io.TextIOWrapper( fluxo, encoding = 'latin-1' )
+
+            return
+
         if endereco_arquivo is None or endereco_arquivo == '':
             print(
                 'O endereço do arquivo não foi definido corretamente.'
@@ -41,12 +91,39 @@ class BovesParser( object ):
         self.endereco_arquivo = endereco_arquivo
 
         self.abrir_arquivo()
-        self.num_linhas = rawbigcount( endereco_arquivo )
 
+        # Os registros têm tamanho fixo: o número de linhas vem do tamanho do
+        # arquivo e do tamanho da primeira linha, sem percorrer o arquivo
+        with open( endereco_arquivo, mode = 'rb' ) as arquivo:
+            inicio = arquivo.read( tamanho_registro + 2 )
 
-    def __del__( self ):
-        if self.arquivo is not None:
+        self.num_linhas = -(
+            -os.path.getsize( endereco_arquivo ) // tamanho_linha( inicio )
+        )
+
+
+    def fechar( self ):
+        '''
+        Fecha o arquivo atual, se houver.
+        '''
+        if getattr( self, 'arquivo', None ) is not None:
             self.arquivo.close()
+            self.arquivo = None
+
+
+    def reiniciar( self ):
+        '''
+        Descarta as colunas e os metadados lidos, liberando a memória. O
+        arquivo aberto não é alterado. É chamado no início de ler_arquivo().
+        '''
+        self._criar_colunas()
+
+        self.cols_sel = []
+        self.ano_historico = None
+        self.data_criacao = None
+        self.num_registros = None
+        self.registros_ignorados = 0
+        self.registros_lidos = 0
 
 
     def abrir_arquivo( self ):
@@ -62,6 +139,11 @@ class BovesParser( object ):
             exit( 1 )
 
 
+    def _criar_colunas( self ):
+        for col, coluna in novas_colunas( self.colunas() ).items():
+            setattr( self, col, coluna )
+
+
     def colunas( self ):
         return [
             'data_pregao',
@@ -100,6 +182,24 @@ class BovesParser( object ):
 
         return dados
 
+    def exportar_dataframe( self ):
+        '''
+        Exporta os dados interpretados para um pandas.DataFrame com as colunas
+        selecionadas já tipadas, montado diretamente a partir das colunas
+        internas, sem passar por um arquivo CSV:
+            - textos: category (inclusive códigos como cod_bdi e tp_merc);
+            - datas: datetime64[ns], ou objetos datetime se houver datas após
+              2262 (ex.: vencimento em 9999-12-31);
+            - números: float64, ou int64 nos campos inteiros.
+        Quem lia o CSV de exportar_csv() recebia textos e datas como str (e
+        códigos numéricos como int); comparações com datas em texto devem
+        converter a coluna (ex.: pandas.to_datetime) ou a data comparada.
+        '''
+        return para_dataframe(
+            { col: getattr( self, col ) for col in self.cols_sel },
+            self.cols_sel,
+        )
+
     def exportar_csv(
         self,
         endereco_arquivo = None,
@@ -161,7 +261,15 @@ class BovesParser( object ):
         arquivo.close()
         barra_progresso.close()
 
-    def ler_arquivo( self, cols_sel = None, filtros = None ):
+    def ler_arquivo(
+        self,
+        cols_sel = None,
+        filtros = None,
+        motor = 'posicional',
+        num_processos = 1,
+        tamanho_bloco = tamanho_bloco_padrao,
+        prefiltro = None,
+    ):
         '''
         Lê o arquivo configurado no construtor do objeto de acordo com os
         cols_sel selecionados.
@@ -177,6 +285,155 @@ class BovesParser( object ):
                            'cod_bdi': ( 'in', [ '02', '96' ] ),
                            'tp_merc': ( 'in', [ '010' ] ),
                        }
+                   Os filtros são combinados com E. Nos motores 'posicional' e
+                   'numpy' eles são avaliados durante a leitura, e as demais
+                   colunas dos registros rejeitados nem são convertidas.
+        "motor": Forma de interpretação das linhas (ver self.motores):
+                     'posicional': fatia cada registro pelas posições fixas do
+                                   layout (ver posicional.py). É o padrão.
+                     'regex': usa as expressões regulares de regex.py.
+                     'numpy': decodifica o arquivo inteiro de uma vez com
+                              NumPy (ver vetorizado.py). As colunas passam a
+                              ser numpy.ndarray e as datas datetime64[D].
+                              Arquivos em disco são mapeados em memória, sem
+                              cópia nem decodificação das linhas.
+        "num_processos": Número de processos usados na leitura. Com mais de um
+                         processo, o arquivo é dividido em blocos de linhas
+                         lidos em paralelo (ver paralelo.py); o resultado é
+                         idêntico ao da leitura serial. Se None, usa todos os
+                         núcleos. Não se aplica ao motor 'regex'.
+        "tamanho_bloco": Tamanho aproximado, em bytes, de cada bloco da
+                         leitura paralela.
+        "prefiltro": Dicionário com os valores aceitos de campos verificados
+                     nos bytes da linha, antes de qualquer conversão (ver
+                     prefiltro.py). Exemplo:
+                         prefiltro = {
+                             'cod_bdi': [ '02', '96' ],
+                             'tp_merc': [ '010' ],
+                             'cod_papel': [ 'PETR', 'VALE' ],  # prefixos
+                         }
+                     O número de registros descartados fica em
+                     self.registros_ignorados.
+
+        Ao final da leitura, o número de registros lidos é comparado com o da
+        cauda do arquivo (ver verificar_registros()).
+        '''
+        filtros, prefiltro = self._preparar_leitura(
+            cols_sel, filtros, motor, prefiltro
+        )
+
+        print( 'Lendo o arquivo...' )
+
+        if motor != 'regex' and num_processos != 1:
+            self._ler_paralelo(
+                motor, num_processos, tamanho_bloco, filtros, prefiltro
+            )
+
+        elif motor == 'numpy':
+            self._ler_numpy( filtros, prefiltro )
+
+        else:
+            linhas = tqdm(
+                self.arquivo,
+                total = self.num_linhas,
+            )
+
+            if motor == 'posicional':
+                self._ler_posicional( linhas, filtros, prefiltro )
+            else:
+                self._ler_regex( linhas, prefiltro )
+                self._aplicar_filtros( filtros )
+
+        if prefiltro:
+            print(
+                '{0} registros ignorados pelo pré-filtro.'.format(
+                    self.registros_ignorados
+                )
+            )
+
+        self.verificar_registros()
+
+
+    def ler_lotes(
+        self,
+        tamanho_lote = 100000,
+        cols_sel = None,
+        filtros = None,
+        motor = 'posicional',
+        prefiltro = None,
+        dataframe = True,
+    ):
+        '''
+        Lê o arquivo em lotes, devolvendo cada lote assim que ele é
+        interpretado, sem manter o arquivo inteiro em memória.
+
+        "tamanho_lote": Número de linhas do arquivo interpretadas por lote.
+                        Cada lote tem no máximo esse número de registros.
+        "cols_sel", "filtros", "motor" e "prefiltro": Como em ler_arquivo().
+        "dataframe": Se True, cada lote é um pandas.DataFrame (ver
+                     exportar_dataframe()); senão, um dicionário
+                     { nome da coluna: coluna }.
+
+        As colunas do objeto contêm sempre o último lote. Os metadados da
+        cauda (num_registros) só estão disponíveis após o último lote.
+        '''
+        filtros, prefiltro = self._preparar_leitura(
+            cols_sel, filtros, motor, prefiltro
+        )
+
+        if motor == 'numpy':
+            blocos = ler_blocos(
+                self.arquivo.buffer, tamanho_lote * ( tamanho_registro + 1 )
+            )
+        else:
+            blocos = iter(
+                lambda: list( islice( self.arquivo, tamanho_lote ) ), []
+            )
+
+        primeira_linha = 1
+
+        for bloco in blocos:
+            # Os lotes já devolvidos continuam válidos: cada lote tem as suas
+            # próprias colunas
+            self._criar_colunas()
+
+            if motor == 'numpy':
+                colunas, metadados, _ = decodificar_buffer(
+                    bloco, self.cols_sel, primeira_linha, filtros, prefiltro
+                )
+
+                for col in self.cols_sel:
+                    setattr( self, col, colunas[ col ] )
+
+                self._juntar_metadados( metadados )
+                primeira_linha += bloco.count( b'\n' )
+
+            elif motor == 'posicional':
+                self._ler_posicional( bloco, filtros, prefiltro, primeira_linha )
+                primeira_linha += len( bloco )
+
+            else:
+                self._ler_regex( bloco, prefiltro, primeira_linha )
+                self._aplicar_filtros( filtros )
+                primeira_linha += len( bloco )
+
+            # Lotes só com o cabeçalho ou a cauda
+            if not len( getattr( self, self.cols_sel[ 0 ] ) ):
+                continue
+
+            if dataframe:
+                yield self.exportar_dataframe()
+            else:
+                yield { col: getattr( self, col ) for col in self.cols_sel }
+
+        self.verificar_registros()
+
+
+    def _preparar_leitura( self, cols_sel, filtros, motor, prefiltro ):
+        '''
+        Valida as opções de leitura, descarta os dados de uma leitura anterior
+        e determina as colunas selecionadas. Retorna os filtros e o pré-filtro
+        compilados.
         '''
         if self.arquivo is None:
             print(
@@ -184,15 +441,21 @@ class BovesParser( object ):
             )
             exit( 1 )
 
+        if motor not in self.motores:
+            print(
+                'O motor "{0}" não é válido. Os motores disponíveis são: '
+                '{1}.'.format( motor, ', '.join( self.motores ) )
+            )
+            exit( 1 )
+
         # Configuração do padrão de hora local
         # Windows --------------------------------------------------------------
         # https://msdn.microsoft.com/en-us/library/39cwe7zf(vs.71).aspx
         # http://msdn.microsoft.com/en-us/library/cdax410z%28VS.71%29.aspx
         #locale.setlocale( locale.LC_ALL, 'ptb' )
 
-        regex_cab = re.compile( regex_cabecalho )
-        regex_cau = re.compile( regex_cauda )
-        regex_cot = re.compile( regex_cotacao )
+        # Os dados de uma leitura anterior são descartados
+        self.reiniciar()
 
         # Determinando as colunas que serão filtradas
         self.cols_sel = self.colunas()
@@ -204,15 +467,240 @@ class BovesParser( object ):
                 if item not in cols_sel:
                     del self.cols_sel[ self.cols_sel.index( item ) ]
 
-        print( 'Lendo o arquivo...' )
+        filtros = self._compilar_filtros( filtros )
+        prefiltro = compilar_prefiltro( prefiltro )
 
-        # Lendo o arquivo
-        for i, linha in enumerate(
-            tqdm(
-                self.arquivo,
-                total = self.num_linhas,
+        return filtros, prefiltro
+
+
+    def _compilar_filtros( self, filtros ):
+        '''
+        Converte o dicionário de filtros de ler_arquivo() em uma lista de
+        filtros ( coluna, operador, valor ), ignorando os inválidos.
+        '''
+        compilados = []
+
+        if not filtros:
+            return compilados
+
+        print( 'Aplicando os filtros...' )
+
+        for chave, ( operador, valor_filtro ) in filtros.items():
+            # Verifica se a chave está entre as colunas selecionadas e se o
+            # operador do filtro é um dos operadores possíveis (self.operadores)
+            if (
+                chave not in self.cols_sel or
+                operador not in self.operadores
+            ):
+                print(
+                    'A chave "{0}" não foi selecionada no parâmetro '
+                    '"cols_cel" ou o operador "{1}"" não é um operador '
+                    'válido. O filtro será ignorado.'.format(
+                        chave,
+                        operador,
+                    )
+                )
+
+                continue
+
+            print(
+                '\tColuna {0}: Operador "{1}" com valor(es) de filtro '
+                '{2}.'.format(
+                    chave,
+                    operador,
+                    valor_filtro
+                )
+            )
+
+            compilados.append( ( chave, operador, valor_filtro ) )
+
+        return compilados
+
+
+    def _aplicar_filtros( self, filtros ):
+        '''
+        Aplica os filtros às colunas já decodificadas, com uma única máscara
+        booleana para todas as colunas.
+        '''
+        if not filtros:
+            return
+
+        colunas = { col: getattr( self, col ) for col in self.cols_sel }
+        selecao = mascara(
+            colunas, filtros, len( colunas[ self.cols_sel[ 0 ] ] )
+        )
+
+        for col in self.cols_sel:
+            setattr( self, col, aplicar_mascara( colunas[ col ], selecao ) )
+
+
+    def verificar_registros( self ):
+        '''
+        Compara o número de registros lidos (cabeçalho, cotações e cauda,
+        incluindo os rejeitados pelos filtros) com o campo num_registros da
+        cauda. Uma diferença indica um arquivo incompleto ou corrompido.
+
+        Retorna True se os números coincidem.
+        '''
+        if self.num_registros is None:
+            print(
+                'A cauda do arquivo não foi encontrada. O arquivo pode estar '
+                'incompleto.'
             )
-        ):
+
+            return False
+
+        if self.registros_lidos != self.num_registros:
+            print(
+                'Foram lidos {0} registros, mas a cauda do arquivo indica {1}. '
+                'O arquivo pode estar incompleto ou corrompido.'.format(
+                    self.registros_lidos,
+                    self.num_registros,
+                )
+            )
+
+            return False
+
+        return True
+
+
+    def _juntar_metadados( self, metadados ):
+        '''
+        Atualiza os metadados com os de um bloco lido pelos motores numpy e
+        paralelo.
+        '''
+        if self.ano_historico is None:
+            self.ano_historico = metadados[ 'ano_historico' ]
+
+        if self.data_criacao is None:
+            self.data_criacao = metadados[ 'data_criacao' ]
+
+        if metadados[ 'num_registros' ] is not None:
+            self.num_registros = metadados[ 'num_registros' ]
+
+        self.registros_ignorados += metadados[ 'registros_ignorados' ]
+        self.registros_lidos += metadados[ 'registros_lidos' ]
+
+
+    def _ler_posicional(
+        self, linhas, filtros = (), prefiltro = (), primeira_linha = 1
+    ):
+        '''
+        Lê as linhas pelas posições fixas dos campos, convertendo apenas as
+        colunas selecionadas dos registros aceitos pelos filtros.
+        '''
+        metadados = {
+            'ano_historico': self.ano_historico,
+            'data_criacao': self.data_criacao,
+            'num_registros': self.num_registros,
+            'registros_ignorados': self.registros_ignorados,
+            'registros_lidos': self.registros_lidos,
+        }
+
+        decodificar_linhas(
+            linhas,
+            { col: getattr( self, col ) for col in self.cols_sel },
+            metadados,
+            primeira_linha,
+            filtros,
+            prefiltro,
+        )
+
+        self.ano_historico = metadados[ 'ano_historico' ]
+        self.data_criacao = metadados[ 'data_criacao' ]
+        self.num_registros = metadados[ 'num_registros' ]
+        self.registros_ignorados = metadados[ 'registros_ignorados' ]
+        self.registros_lidos = metadados[ 'registros_lidos' ]
+
+
+    def _ler_paralelo(
+        self, motor, num_processos, tamanho_bloco, filtros = (), prefiltro = ()
+    ):
+        '''
+        Lê o arquivo em blocos de linhas decodificados em paralelo.
+        '''
+        if self.endereco_arquivo is None:
+            colunas, metadados = ler_paralelo(
+                self.arquivo.buffer,
+                self.cols_sel,
+                motor,
+                num_processos,
+                tamanho_bloco,
+                filtros,
+                prefiltro,
+            )
+
+        else:
+            with open( self.endereco_arquivo, mode = 'rb' ) as arquivo:
+                colunas, metadados = ler_paralelo(
+                    arquivo,
+                    self.cols_sel,
+                    motor,
+                    num_processos,
+                    tamanho_bloco,
+                    filtros,
+                    prefiltro,
+                )
+
+        for col in self.cols_sel:
+            if motor == 'numpy':
+                setattr( self, col, colunas[ col ] )
+            else:
+                getattr( self, col ).extend( colunas[ col ] )
+
+        self._juntar_metadados( metadados )
+
+
+    def _ler_numpy( self, filtros = (), prefiltro = () ):
+        '''
+        Lê o arquivo inteiro como um vetor estruturado de registros e converte
+        as colunas selecionadas de forma vetorizada. Arquivos em disco são
+        mapeados em memória (ver mapeamento.py) e decodificados sem cópia.
+        '''
+        if self.endereco_arquivo is None:
+            colunas, metadados, _ = decodificar_buffer(
+                self.arquivo.buffer.read(),
+                self.cols_sel,
+                filtros = filtros,
+                prefiltro = prefiltro,
+            )
+
+        else:
+            with mapear( self.endereco_arquivo ) as mapa:
+                colunas, metadados, _ = decodificar_buffer(
+                    mapa,
+                    self.cols_sel,
+                    filtros = filtros,
+                    prefiltro = prefiltro,
+                )
+
+        for col in self.cols_sel:
+            setattr( self, col, colunas[ col ] )
+
+        self._juntar_metadados( metadados )
+
+
+    def _ler_regex( self, linhas, prefiltro = (), primeira_linha = 1 ):
+        '''
+        Lê as linhas usando as expressões regulares de regex.py. Os registros
+        de cotação rejeitados pelo pré-filtro não são interpretados.
+        '''
+        regex_cab = re.compile( regex_cabecalho )
+        regex_cau = re.compile( regex_cauda )
+        regex_cot = re.compile( regex_cotacao )
+
+        # Lendo o arquivo
+        for i, linha in enumerate( linhas, primeira_linha ):
+            if (
+                prefiltro and
+                linha.startswith( '01' ) and
+                not aceitar_linha( linha, prefiltro )
+            ):
+                self.registros_ignorados += 1
+                self.registros_lidos += 1
+
+                continue
+
             # Cabeçalho
             match = regex_cab.match( linha )
 
@@ -229,11 +717,13 @@ class BovesParser( object ):
                     'Linha {0} não corresponde a nenhum tipo de informação '
                     'relevante para o arquivo. A linha será dispensada e a '
                     'análise do arquivo prosseguirá a partir da linha '
-                    'seguinte.'.format( i + 1 )
+                    'seguinte.'.format( i )
                 )
 
                 continue
 
+            self.registros_lidos += 1
+
             # Dicionário de informações
             dicionario = match.groupdict()
 
@@ -438,127 +928,3 @@ class BovesParser( object ):
                     'distribuicao_papel' in self.cols_sel
                 ):
                     self.distribuicao_papel.append( valor.strip() )
-
-        # Aplicando os filtros
-        print( 'Aplicando os filtros...' )
-
-        linhas_remover = []
-        
-        if filtros:
-            for chave, ( operador, valor_filtro ) in filtros.items():
-                # Verifica se a chave está entre as colunas selecionadas e se o
-                # operador do filtro é um dos operadores possíveis (self.operadores)
-                if (
-                    chave not in self.cols_sel or
-                    operador not in self.operadores
-                ):
-                    print(
-                        'A chave "{0}" não foi selecionada no parâmetro '
-                        '"cols_cel" ou o operador "{1}"" não é um operador '
-                        'válido. O filtro será ignorado.'.format(
-                            chave,
-                            operador,
-                        )
-                    )
-
-                    continue
-
-                print(
-                    '\tColuna {0}: Operador "{1}" com valor(es) de filtro '
-                    '{2}.'.format(
-                        chave,
-                        operador,
-                        valor_filtro
-                    )
-                )
-
-                barra_progresso = tqdm(
-                    total = len( getattr( self, chave ) )
-                )
-
-                # Percorre os itens da coluna selecionada pela chave
-                for i, item in enumerate( getattr( self, chave ) ):
-                    resultado = None
-
-                    if operador == 'in':
-                        resultado = self.operadores[ operador ](
-                            valor_filtro, item
-                        )
-                    else:
-                        resultado = self.operadores[ operador ](
-                            item, valor_filtro
-                        )
-
-                    if not resultado:
-                        linhas_remover.append( i )
-
-                    barra_progresso.update()
-
-                barra_progresso.close()
-
-        print( 'Removendo as linhas não desejadas...' )
-        barra_progresso = tqdm(
-            total = (
-                len( self.cols_sel ) *
-                len( getattr( self, self.cols_sel[ 0 ] ) )
-            )
-        )
-
-        # Removendo a referencia das linhas duplicadas na lista de linhas à
-        # remover
-        linhas_remover = set( linhas_remover )
-
-        for col in self.cols_sel:
-            coluna = getattr( self, col )
-
-            nova_coluna = []
-
-            for i in range( len( coluna ) ):
-                if i not in linhas_remover:
-                    nova_coluna.append( coluna[ i ] )
-
-                barra_progresso.update()
-
-            setattr( self, col, nova_coluna )
-
-        barra_progresso.close()
-
-
-    # --------------------------------------------------------------------------
-    # Atributos
-    # --------------------------------------------------------------------------
-    arquivo = None
-    endereco_arquivo = None
-    num_linhas = None
-
-    ano_historico = None
-    data_criacao = None
-    num_registros = None
-
-    data_pregao = []
-    cod_bdi = []
-    cod_papel = []
-    tp_merc = []
-    nome_resum = []
-    espec_papel = []
-    prazo_dias_termo = []
-    moeda = []
-    preco_abertura = []
-    preco_maximo = []
-    preco_minimo = []
-    preco_medio = []
-    preco_ultimo = []
-    preco_melhor_compra = []
-    preco_melhor_venda = []
-    num_negocios = []
-    qtde_titulos = []
-    vol_titulos = []
-    preco_exerc = []
-    indicador_correcao = []
-    data_vencimento = []
-    fator_cotacao = []
-    preco_exerc_pontos = []
-    cod_isi = []
-    distribuicao_papel = []
-
-    cols_sel = []
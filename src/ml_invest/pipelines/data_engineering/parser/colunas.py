@@ -0,0 +1,259 @@
+# -*- encoding: utf-8 -*-
+# ##############################################################################
+# Colunas tipadas usadas pelo BovesParser para guardar os registros lidos.
+#
+# Em vez de listas de objetos Python (datetime, float e str), cada coluna é um
+# array.array expansível:
+#     - datas: número de dias desde 1970-01-01 (int64);
+#     - números: float64 ou int64;
+#     - textos: códigos int32 de um dicionário de valores (cada texto distinto
+#       é guardado uma única vez).
+# As colunas podem ser usadas como listas (append, extend, len, iteração e
+# índices devolvem os valores originais) e são convertidas para NumPy sem
+# cópia (ver para_numpy()). No pandas, apenas as colunas numéricas seguem sem
+# cópia; datas e textos são copiados (ver vetorizado.para_pandas()).
+#
+# Enquanto existir um vetor NumPy ou uma coluna pandas criada a partir de uma
+# coluna, ela não pode mais crescer (o array.array está exportando o buffer).
+# ##############################################################################
+from array import array
+from datetime import datetime
+from itertools import compress
+
+import numpy as np
+import pandas as pd
+
+from .posicional import campos_cotacao
+from .posicional import converter_data
+from .posicional import converter_prazo
+from .posicional import converter_texto
+
+
+# Dia 0 das colunas de datas (1970-01-01), no calendário de date.toordinal()
+dia_zero = datetime( 1970, 1, 1 ).toordinal()
+
+
+class Memoria( dict ):
+    '''
+    Dicionário que calcula e guarda o valor de uma chave ausente. Como a
+    busca de uma chave presente não executa código Python, serve para
+    converter campos que se repetem muito (datas e textos).
+    '''
+    def __init__( self, funcao ):
+        self.funcao = funcao
+
+    def __missing__( self, chave ):
+        valor = self[ chave ] = self.funcao( chave )
+
+        return valor
+
+
+class Coluna( object ):
+    '''
+    Coluna tipada e expansível. As subclasses definem o tipo do array e a
+    codificação dos valores.
+    '''
+    codigo_tipo = 'd'
+    dtype = np.float64
+
+    def __init__( self, valores = () ):
+        self.dados = array( self.codigo_tipo )
+
+        # Sem conversão, o append do próprio array é usado diretamente
+        if type( self ).codificar is Coluna.codificar:
+            self.append = self.dados.append
+
+        self.extend( valores )
+
+    def codificar( self, valor ):
+        return valor
+
+    def decodificar( self, codigo ):
+        return codigo
+
+    def append( self, valor ):
+        self.dados.append( self.codificar( valor ) )
+
+    def extend( self, valores ):
+        if type( valores ) is type( self ):
+            self.dados.extend( valores.dados )
+
+        elif type( self ).codificar is Coluna.codificar:
+            self.dados.extend( valores )
+
+        else:
+            self.dados.extend( map( self.codificar, valores ) )
+
+    def decodificador( self, conversor ):
+        '''
+        Retorna o par ( adicionar, conversor ) usado pelo motor posicional
+        para acrescentar o valor de um trecho da linha à coluna.
+        '''
+        if type( self ).codificar is Coluna.codificar:
+            return self.append, conversor
+
+        # O código de cada trecho distinto é calculado uma única vez
+        memoria = Memoria( lambda trecho: self.codificar( conversor( trecho ) ) )
+
+        return self.dados.append, memoria.__getitem__
+
+    def truncar( self, tamanho ):
+        '''
+        Mantém apenas os "tamanho" primeiros valores da coluna.
+        '''
+        del self.dados[ tamanho: ]
+
+    def filtrar( self, selecao ):
+        '''
+        Retorna uma nova coluna apenas com os valores em que "selecao" é
+        verdadeira.
+        '''
+        nova = type( self )()
+        nova.dados.extend( compress( self.dados, selecao ) )
+
+        return nova
+
+    def para_numpy( self ):
+        '''
+        Retorna os valores codificados como numpy.ndarray, sem cópia.
+        '''
+        return np.frombuffer( self.dados, dtype = self.dtype )
+
+    def para_pandas( self ):
+        return self.para_numpy()
+
+    def __array__( self, dtype = None, copy = None ):
+        valores = self.para_numpy()
+
+        return valores if dtype is None else valores.astype( dtype )
+
+    def __len__( self ):
+        return len( self.dados )
+
+    def __iter__( self ):
+        return map( self.decodificar, self.dados )
+
+    def __getitem__( self, indice ):
+        if isinstance( indice, slice ):
+            return [ self.decodificar( codigo ) for codigo in self.dados[ indice ] ]
+
+        return self.decodificar( self.dados[ indice ] )
+
+    def __eq__( self, outra ):
+        return list( self ) == list( outra )
+
+    __hash__ = None
+
+    def __repr__( self ):
+        return '{0}({1})'.format( type( self ).__name__, list( self ) )
+
+
+class ColunaReal( Coluna ):
+    codigo_tipo = 'd'
+    dtype = np.float64
+
+
+class ColunaInteira( Coluna ):
+    codigo_tipo = 'q'
+    dtype = np.int64
+
+
+class ColunaData( Coluna ):
+    '''
+    Datas guardadas como número de dias desde 1970-01-01.
+    '''
+    codigo_tipo = 'q'
+    dtype = np.int64
+
+    def codificar( self, valor ):
+        return valor.toordinal() - dia_zero
+
+    def decodificar( self, codigo ):
+        return datetime.fromordinal( codigo + dia_zero )
+
+    def para_numpy( self ):
+        return super().para_numpy().view( 'datetime64[D]' )
+
+
+class ColunaTexto( Coluna ):
+    '''
+    Textos codificados por dicionário: cada valor distinto é guardado uma vez
+    em self.categorias e a coluna guarda apenas os códigos (int32).
+    '''
+    codigo_tipo = 'i'
+    dtype = np.intc
+
+    def __init__( self, valores = () ):
+        self.categorias = []
+        self.codigos = {}
+
+        super().__init__( valores )
+
+    def codificar( self, valor ):
+        codigo = self.codigos.get( valor )
+
+        if codigo is None:
+            codigo = self.codigos[ valor ] = len( self.categorias )
+            self.categorias.append( valor )
+
+        return codigo
+
+    def decodificar( self, codigo ):
+        return self.categorias[ codigo ]
+
+    def extend( self, valores ):
+        if type( valores ) is not type( self ):
+            super().extend( valores )
+
+            return
+
+        # Apenas os códigos do dicionário da outra coluna são convertidos
+        mapa = [ self.codificar( valor ) for valor in valores.categorias ]
+        self.dados.extend( mapa[ codigo ] for codigo in valores.dados )
+
+    def filtrar( self, selecao ):
+        nova = super().filtrar( selecao )
+        nova.categorias = list( self.categorias )
+        nova.codigos = dict( self.codigos )
+
+        return nova
+
+    def __array__( self, dtype = None, copy = None ):
+        valores = np.array( self.categorias, dtype = str )[ self.para_numpy() ]
+
+        return valores if dtype is None else valores.astype( dtype )
+
+    def para_pandas( self ):
+        return pd.Categorical.from_codes(
+            self.para_numpy(), categories = self.categorias
+        )
+
+
+def nova_coluna( nome ):
+    '''
+    Retorna uma coluna vazia do tipo adequado ao campo "nome" do registro de
+    cotação.
+    '''
+    for campo, inicio, fim, conversor in campos_cotacao:
+        if campo != nome:
+            continue
+
+        if conversor is converter_data:
+            return ColunaData()
+
+        if conversor is converter_texto:
+            return ColunaTexto()
+
+        if conversor in ( int, converter_prazo ):
+            return ColunaInteira()
+
+        return ColunaReal()
+
+    raise KeyError( nome )
+
+
+def novas_colunas( nomes ):
+    '''
+    Retorna um dicionário { nome: coluna vazia } para os campos "nomes".
+    '''
+    return { nome: nova_coluna( nome ) for nome in nomes }
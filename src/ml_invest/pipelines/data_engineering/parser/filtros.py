@@ -0,0 +1,84 @@
+# -*- encoding: utf-8 -*-
+# ##############################################################################
+# Filtros dos registros de cotação.
+#
+# Um filtro é uma tupla ( coluna, operador, valor ), ex.:
+#     ( 'cod_bdi', 'in', [ '02', '96' ] )
+#
+# Os filtros são avaliados durante a decodificação: cada registro (motor
+# posicional) ou cada bloco de registros (motor numpy) tem primeiro apenas os
+# campos filtrados convertidos, e só os registros aceitos por todos os filtros
+# têm as demais colunas convertidas. Para colunas já decodificadas (motor
+# regex), os filtros viram máscaras booleanas combinadas com E e aplicadas de
+# uma vez a todas as colunas.
+# ##############################################################################
+import operator
+
+from itertools import compress
+
+import numpy as np
+
+
+operadores = {
+    '==': operator.eq,
+    '!=': operator.ne,
+    '>=': operator.ge,
+    '<=': operator.le,
+    '>': operator.gt,
+    '<': operator.lt,
+    'in': None,
+}
+
+
+def testar( valor, operador, alvo ):
+    '''
+    Avalia o filtro sobre um único valor.
+    '''
+    if operador == 'in':
+        return valor in alvo
+
+    return operadores[ operador ]( valor, alvo )
+
+
+def mascarar( valores, operador, alvo ):
+    '''
+    Avalia o filtro sobre uma coluna inteira (lista ou numpy.ndarray) e
+    retorna um vetor booleano.
+    '''
+    valores = np.asarray( valores )
+
+    # Datas do motor numpy (datetime64) comparadas com datetime ou str
+    if valores.dtype.kind == 'M':
+        alvo = np.asarray( alvo, dtype = 'datetime64[us]' )
+
+    if operador == 'in':
+        return np.isin( valores, alvo )
+
+    return np.asarray( operadores[ operador ]( valores, alvo ), dtype = bool )
+
+
+def mascara( colunas, filtros, num_linhas ):
+    '''
+    Combina com E as máscaras de todos os "filtros" sobre as "colunas"
+    (dicionário { nome da coluna: valores }).
+    '''
+    resultado = np.ones( num_linhas, dtype = bool )
+
+    for coluna, operador, alvo in filtros:
+        resultado &= mascarar( colunas[ coluna ], operador, alvo )
+
+    return resultado
+
+
+def aplicar_mascara( valores, selecao ):
+    '''
+    Retorna apenas os valores em que "selecao" é verdadeira, mantendo o tipo
+    da coluna (lista, coluna tipada ou numpy.ndarray).
+    '''
+    if isinstance( valores, np.ndarray ):
+        return valores[ selecao ]
+
+    if hasattr( valores, 'filtrar' ):
+        return valores.filtrar( selecao )
+
+    return list( compress( valores, selecao ) )
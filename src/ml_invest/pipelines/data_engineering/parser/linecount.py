@@ -17,11 +17,11 @@ from itertools import repeat
 
 
 def rawbigcount(filename):
-    f = open(filename, 'rb')
-    bufgen = takewhile(
-        lambda x: x, (f.raw.read(1024*1024) for _ in repeat(None))
-    )
-    return sum( buf.count(b'\n') for buf in bufgen if buf )
+    with open(filename, 'rb') as f:
+        bufgen = takewhile(
+            lambda x: x, (f.raw.read(1024*1024) for _ in repeat(None))
+        )
+        return sum( buf.count(b'\n') for buf in bufgen if buf )
 
 
 def _make_gen(reader):
@@ -32,41 +32,44 @@ def _make_gen(reader):
 
 
 def rawpycount(filename):
-    f = open(filename, 'rb')
-    f_gen = _make_gen(f.raw.read)
-    return sum( buf.count(b'\n') for buf in f_gen )
+    with open(filename, 'rb') as f:
+        f_gen = _make_gen(f.raw.read)
+        return sum( buf.count(b'\n') for buf in f_gen )
 
 
 # ------------------------------------------------------------------------------
 # [1] https://gist.github.com/zed/0ac760859e614cd03652
 
 def mapcount(filename):
-    f = open(filename, "r+")
-    buf = mmap.mmap(f.fileno(), 0)
-    lines = 0
-    readline = buf.readline
-    while readline():
-        lines += 1
-    return lines
+    with open(filename, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return 0
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+            lines = 0
+            readline = buf.readline
+            while readline():
+                lines += 1
+            return lines
 
 
 def simplecount(filename):
     lines = 0
-    for line in open(filename):
-        lines += 1
+    with open(filename) as f:
+        for line in f:
+            lines += 1
     return lines
 
 
 def bufcount(filename):
-    f = open(filename)
     lines = 0
     buf_size = 1024 * 1024
-    read_f = f.read  # loop optimization
+    with open(filename) as f:
+        read_f = f.read  # loop optimization
 
-    buf = read_f(buf_size)
-    while buf:
-        lines += buf.count('\n')
         buf = read_f(buf_size)
+        while buf:
+            lines += buf.count('\n')
+            buf = read_f(buf_size)
 
     return lines
 
@@ -81,10 +84,12 @@ def wccount(filename):
 
 
 def itercount(filename):
-    return sum(1 for _ in open(filename, 'rbU'))
+    with open(filename, 'rb') as f:
+        return sum(1 for _ in f)
 
 
 def opcount(fname):
+    line_number = 0
     with open(fname) as f:
         for line_number, _ in enumerate(f, 1):
             pass
@@ -92,25 +97,17 @@ def opcount(fname):
 
 
 def kylecount(fname):
-    return sum(1 for line in open(fname))
-
-
-# try:
-#     # http://chris-lamb.co.uk/projects/python-fadvise/
-#     from fadvise import sequential, normal
+    with open(fname) as f:
+        return sum(1 for line in f)
 
-#     def fadvcount(fname):
-#         sequential(fname)
-#         c = bufcount(fname)
-#         normal(fname)
-#         return c
 
-# except ImportError:
-#     import warnings
-#     warnings.warn(
-#         'Can\'t import fadvise: fadvcount() will be unavailable',
-#         UserWarning
-#     )
+# Same hint as the python-fadvise package, now in the standard library:
+# http://chris-lamb.co.uk/projects/python-fadvise/
+if hasattr(os, 'posix_fadvise'):
+    def fadvcount(filename):
+        with open(filename, 'rb') as f:
+            os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+            return sum(buf.count(b'\n') for buf in _make_gen(f.raw.read))
 
 
 def clear_cache():
@@ -118,45 +115,6 @@ def clear_cache():
     os.system("sync ; sudo /bin/sh -c 'echo 3 > /proc/sys/vm/drop_caches'")
 
 
-# def main():
-#     counts = defaultdict(list)
-
-#     if '--clear-cache' in sys.argv:
-#         sys.argv.remove('--clear-cache')
-#         do_clear_cache = True
-#     else:
-#         do_clear_cache = False
-
-#     filename = sys.argv[1] if len(sys.argv) > 1 else "big.txt"
-#     for i in range(3):
-#         for func in (f
-#                      for n, f in globals().items()
-#                      if n.endswith('count') and hasattr(f, '__call__')):
-#             if do_clear_cache:
-#                 clear_cache()
-#             start_time = timer()
-#             # http://norvig.com/big.txt
-#             if filename == 'big.txt':
-#                 # 128457 1095695 6488666 big.txt
-#                 assert func(filename) == 128457
-#             else:
-#                 func(filename)
-#             counts[func].append(timer() - start_time)
-
-#     timings = {}
-#     for key, vals in counts.items():
-#         timings[key.__name__] = sum(vals) / float(len(vals)), min(vals)
-#     width = max(len(n) for n in timings) + 1
-#     print("%s %s %s %s" % (
-#         "function".ljust(width),
-#         "average, s".rjust(11),
-#         "min, s".rjust(7),
-#         "ratio".rjust(6)))
-#     absmin_ = min(x[1] for x in timings.values())
-#     for name, ( av, min_) in sorted(timings.items(), key=lambda x: x[1][1]):
-#         print("%s %11.2g %7.2g %6.2f" % (
-#             name.ljust(width), av, min_, min_/absmin_))
-
-
-# if __name__ == '__main__':
-#     main()
+# The timing harness that used to live here is now a runnable benchmark:
+#     python -m benchmarks.bench_linecount --help
+# (from the src directory, see src/benchmarks/bench_linecount.py).
@@ -0,0 +1,44 @@
+# -*- encoding: utf-8 -*-
+# ##############################################################################
+# Leitura do arquivo COTAHIST.AAAA.TXT descompactado por mapeamento em memória.
+#
+# Em vez de copiar o arquivo para um objeto bytes (ou decodificar cada linha
+# para str), o arquivo é mapeado com mmap e o motor numpy vê as páginas
+# mapeadas diretamente como um vetor estruturado de registros (ver
+# vetorizado.py). Apenas os campos selecionados dos registros aceitos são
+# copiados. Como as páginas mapeadas são as do cache de arquivos do sistema
+# operacional, uma nova leitura de um arquivo recente não acessa o disco.
+# ##############################################################################
+import mmap
+import os
+
+from contextlib import contextmanager
+
+
+@contextmanager
+def mapear( endereco_arquivo ):
+    '''
+    Mapeia o arquivo "endereco_arquivo" somente para leitura. O mapa é
+    fechado ao fim do bloco with, e os vetores criados a partir dele
+    (numpy.frombuffer) não podem ser usados depois disso.
+
+    Arquivos vazios, que não podem ser mapeados, resultam em b''.
+    '''
+    with open( endereco_arquivo, mode = 'rb' ) as arquivo:
+        if os.fstat( arquivo.fileno() ).st_size == 0:
+            yield b''
+
+            return
+
+        mapa = mmap.mmap( arquivo.fileno(), 0, access = mmap.ACCESS_READ )
+
+        # O arquivo é percorrido uma única vez, do início ao fim
+        if hasattr( mapa, 'madvise' ) and hasattr( mmap, 'MADV_SEQUENTIAL' ):
+            mapa.madvise( mmap.MADV_SEQUENTIAL )
+
+        try:
+            yield mapa
+
+        finally:
+            mapa.close()
+
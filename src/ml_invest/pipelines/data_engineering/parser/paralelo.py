@@ -0,0 +1,170 @@
+# -*- encoding: utf-8 -*-
+# ##############################################################################
+# Leitura paralela do arquivo COTAHIST.AAAA.TXT.
+#
+# Os registros têm tamanho fixo e terminam em quebra de linha, então o arquivo
+# pode ser dividido em blocos de bytes alinhados ao fim das linhas. Cada bloco
+# é decodificado em um processo separado (motor posicional ou numpy) e os
+# resultados são concatenados na ordem original, produzindo exatamente as
+# mesmas colunas da leitura serial.
+# ##############################################################################
+import os
+
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from .colunas import novas_colunas
+from .posicional import decodificar_linhas
+from .vetorizado import decodificar_buffer
+
+
+# Tamanho padrão dos blocos enviados aos processos (64 MB)
+tamanho_bloco_padrao = 64 * 1024 * 1024
+
+
+def ler_blocos( fluxo, tamanho_bloco = tamanho_bloco_padrao ):
+    '''
+    Divide um fluxo binário em blocos de aproximadamente "tamanho_bloco"
+    bytes, sempre terminados no fim de uma linha.
+    '''
+    while True:
+        bloco = fluxo.read( tamanho_bloco )
+
+        if not bloco:
+            return
+
+        if not bloco.endswith( b'\n' ):
+            bloco += fluxo.readline()
+
+        yield bloco
+
+
+def decodificar_bloco(
+    bloco, cols_sel, motor, primeira_linha, filtros = (), prefiltro = ()
+):
+    '''
+    Decodifica um bloco de linhas com o "motor" indicado ('posicional' ou
+    'numpy'), aplicando o "prefiltro" e os "filtros". Retorna uma tupla
+    ( colunas, metadados ).
+    '''
+    if motor == 'numpy':
+        colunas, metadados, _ = decodificar_buffer(
+            bloco, cols_sel, primeira_linha, filtros, prefiltro
+        )
+
+        return colunas, metadados
+
+    colunas = novas_colunas( cols_sel )
+    metadados = {
+        'ano_historico': None,
+        'data_criacao': None,
+        'num_registros': None,
+    }
+
+    linhas = bloco.decode( 'latin-1' ).split( '\n' )
+
+    # O bloco termina em quebra de linha
+    if linhas[ -1 ] == '':
+        linhas.pop()
+
+    decodificar_linhas(
+        linhas, colunas, metadados, primeira_linha, filtros, prefiltro
+    )
+
+    return colunas, metadados
+
+
+def ler_paralelo(
+    fluxo,
+    cols_sel,
+    motor = 'posicional',
+    num_processos = None,
+    tamanho_bloco = tamanho_bloco_padrao,
+    filtros = (),
+    prefiltro = (),
+):
+    '''
+    Lê um fluxo binário do arquivo COTAHIST em paralelo.
+
+    "fluxo": Objeto binário aberto (arquivo ou membro de um ZIP).
+    "cols_sel": Lista com os nomes das colunas que devem ser convertidas.
+    "motor": 'posicional' (colunas tipadas, ver colunas.py) ou 'numpy'
+             (numpy.ndarray).
+    "num_processos": Número de processos. Se None, usa todos os núcleos.
+    "tamanho_bloco": Tamanho aproximado, em bytes, de cada bloco.
+    "filtros": Lista de filtros ( coluna, operador, valor ) (ver filtros.py),
+               aplicados em cada bloco durante a decodificação.
+    "prefiltro": Regras ( início, valores ) do pré-filtro (ver prefiltro.py).
+
+    Retorna uma tupla ( colunas, metadados ) equivalente à leitura serial.
+    Apenas 2 * num_processos blocos ficam em memória ao mesmo tempo.
+    '''
+    if num_processos is None:
+        num_processos = os.cpu_count() or 1
+
+    partes = { col: [] for col in cols_sel }
+    metadados = {
+        'ano_historico': None,
+        'data_criacao': None,
+        'num_registros': None,
+        'registros_ignorados': 0,
+        'registros_lidos': 0,
+    }
+
+    def juntar( futuro ):
+        colunas_bloco, metadados_bloco = futuro.result()
+
+        for col in cols_sel:
+            partes[ col ].append( colunas_bloco[ col ] )
+
+        for chave, valor in metadados_bloco.items():
+            if valor is None:
+                continue
+
+            if chave in ( 'registros_ignorados', 'registros_lidos' ):
+                metadados[ chave ] += valor
+
+            elif chave == 'num_registros' or metadados[ chave ] is None:
+                metadados[ chave ] = valor
+
+    with ProcessPoolExecutor( max_workers = num_processos ) as executor:
+        pendentes = deque()
+        primeira_linha = 1
+
+        for bloco in ler_blocos( fluxo, tamanho_bloco ):
+            pendentes.append(
+                executor.submit(
+                    decodificar_bloco,
+                    bloco,
+                    cols_sel,
+                    motor,
+                    primeira_linha,
+                    filtros,
+                    prefiltro,
+                )
+            )
+            primeira_linha += bloco.count( b'\n' )
+
+            if len( pendentes ) >= 2 * num_processos:
+                juntar( pendentes.popleft() )
+
+        while pendentes:
+            juntar( pendentes.popleft() )
+
+    colunas = {}
+
+    for col in cols_sel:
+        if motor == 'numpy':
+            colunas[ col ] = (
+                np.concatenate( partes[ col ] ) if partes[ col ]
+                else np.array( [] )
+            )
+        else:
+            colunas[ col ] = novas_colunas( [ col ] )[ col ]
+
+            for parte in partes[ col ]:
+                colunas[ col ].extend( parte )
+
+    return colunas, metadados
@@ -0,0 +1,254 @@
+# -*- encoding: utf-8 -*-
+# ##############################################################################
+# Decodificação posicional (largura fixa) do arquivo COTAHIST.AAAA.TXT.
+#
+# Os registros do arquivo têm tamanho fixo de 245 caracteres e as posições dos
+# campos são as mesmas descritas pelas expressões regulares de 'regex.py'. Aqui
+# elas estão indexadas a partir de zero e com o fim exclusivo, de modo que cada
+# campo é obtido diretamente por uma fatia da linha ( linha[ inicio:fim ] ).
+#
+# O tipo do registro é identificado pelos dois primeiros caracteres:
+#     00 - Cabeçalho
+#     01 - Cotação
+#     99 - Cauda
+# ##############################################################################
+from datetime import datetime
+
+from .filtros import testar
+
+
+tamanho_registro = 245
+
+
+# ------------------------------------------------------------------------------
+# Conversores
+# ------------------------------------------------------------------------------
+def converter_data( valor ):
+    # Equivalente a datetime.strptime( valor, '%Y%m%d' ), porém mais rápido
+    return datetime(
+        int( valor[ 0:4 ] ), int( valor[ 4:6 ] ), int( valor[ 6:8 ] )
+    )
+
+
+def converter_texto( valor ):
+    return valor.strip()
+
+
+def converter_prazo( valor ):
+    if valor.strip() == '':
+        return 0
+
+    return int( valor )
+
+
+def converter_preco( valor ):
+    # N(11)V99 e N(16)V99
+    return float( valor ) / 1e2
+
+
+def converter_preco_pontos( valor ):
+    return float( valor ) / 100e6
+
+
+# ------------------------------------------------------------------------------
+# Layout dos registros: ( nome, início, fim, conversor )
+# ------------------------------------------------------------------------------
+campos_cabecalho = (
+    ( 'ano_historico', 11, 15, int ),
+    ( 'data_criacao', 23, 31, converter_data ),
+)
+
+campos_cauda = campos_cabecalho + (
+    ( 'num_registros', 31, 42, int ),
+)
+
+campos_cotacao = (
+    ( 'data_pregao', 2, 10, converter_data ),
+    ( 'cod_bdi', 10, 12, converter_texto ),
+    ( 'cod_papel', 12, 24, converter_texto ),
+    ( 'tp_merc', 24, 27, converter_texto ),
+    ( 'nome_resum', 27, 39, converter_texto ),
+    ( 'espec_papel', 39, 49, converter_texto ),
+    ( 'prazo_dias_termo', 49, 52, converter_prazo ),
+    ( 'moeda', 52, 56, converter_texto ),
+    ( 'preco_abertura', 56, 69, converter_preco ),
+    ( 'preco_maximo', 69, 82, converter_preco ),
+    ( 'preco_minimo', 82, 95, converter_preco ),
+    ( 'preco_medio', 95, 108, converter_preco ),
+    ( 'preco_ultimo', 108, 121, converter_preco ),
+    ( 'preco_melhor_compra', 121, 134, converter_preco ),
+    ( 'preco_melhor_venda', 134, 147, converter_preco ),
+    ( 'num_negocios', 147, 152, float ),
+    ( 'qtde_titulos', 152, 170, float ),
+    ( 'vol_titulos', 170, 188, converter_preco ),
+    ( 'preco_exerc', 188, 201, converter_preco ),
+    ( 'indicador_correcao', 201, 202, converter_texto ),
+    ( 'data_vencimento', 202, 210, converter_data ),
+    ( 'fator_cotacao', 210, 217, int ),
+    ( 'preco_exerc_pontos', 217, 230, converter_preco_pontos ),
+    ( 'cod_isi', 230, 242, converter_texto ),
+    ( 'distribuicao_papel', 242, 245, converter_texto ),
+)
+
+
+# ------------------------------------------------------------------------------
+# Decodificação
+# ------------------------------------------------------------------------------
+def descartar_registro( colunas ):
+    '''
+    Remove das colunas os valores já acrescentados de um registro cuja
+    decodificação falhou no meio. Antes dele, todas as colunas tinham o mesmo
+    tamanho.
+    '''
+    if not colunas:
+        return
+
+    tamanho = min( len( coluna ) for coluna in colunas.values() )
+
+    for coluna in colunas.values():
+        if len( coluna ) == tamanho:
+            continue
+
+        if isinstance( coluna, list ):
+            del coluna[ tamanho: ]
+        else:
+            coluna.truncar( tamanho )
+
+
+def dispensar_linha( i ):
+    print(
+        'Linha {0} contém um campo inválido. A linha será dispensada e a '
+        'análise do arquivo prosseguirá a partir da linha seguinte.'.format( i )
+    )
+
+
+def decodificar_linhas(
+    linhas, colunas, metadados, primeira_linha = 1, filtros = (), prefiltro = ()
+):
+    '''
+    Decodifica as linhas do arquivo pelas posições fixas dos campos.
+
+    "linhas": Iterável com as linhas (str) do arquivo.
+    "colunas": Dicionário { nome da coluna: lista } com as colunas
+               selecionadas (listas ou colunas tipadas, ver colunas.py). Os
+               valores decodificados dos registros de cotação são acrescentados
+               ao final de cada coluna.
+    "metadados": Dicionário com as chaves 'ano_historico', 'data_criacao' e
+                 'num_registros', preenchido a partir do cabeçalho e da cauda.
+                 'ano_historico' e 'data_criacao' só são preenchidos se ainda
+                 forem None. A chave 'registros_ignorados' é somada ao número
+                 de registros rejeitados pelo pré-filtro e a chave
+                 'registros_lidos' ao número de registros (cabeçalho, cotações
+                 e cauda) encontrados nas linhas.
+    "primeira_linha": Número da primeira linha, usado nas mensagens.
+    "filtros": Lista de filtros ( coluna, operador, valor ) (ver filtros.py).
+               Os registros rejeitados não têm as colunas convertidas.
+    "prefiltro": Regras ( início, valores ) do pré-filtro (ver prefiltro.py),
+                 verificadas na linha antes de qualquer conversão.
+
+    Retorna o número de linhas dispensadas.
+    '''
+    # Os campos filtrados são convertidos antes dos demais
+    testes = [
+        ( inicio, fim, conversor, operador, alvo )
+        for coluna, operador, alvo in filtros
+        for nome, inicio, fim, conversor in campos_cotacao
+        if nome == coluna
+    ]
+
+    # Apenas os campos selecionados são convertidos
+    decodificadores = []
+
+    for nome, inicio, fim, conversor in campos_cotacao:
+        if nome not in colunas:
+            continue
+
+        # Colunas tipadas (ver colunas.py) definem como acrescentar o valor
+        if hasattr( colunas[ nome ], 'decodificador' ):
+            adicionar, conversor = colunas[ nome ].decodificador( conversor )
+        else:
+            adicionar = colunas[ nome ].append
+
+        decodificadores.append( ( adicionar, inicio, fim, conversor ) )
+
+    dispensadas = 0
+    ignorados = 0
+    i = primeira_linha - 1
+
+    for i, linha in enumerate( linhas, primeira_linha ):
+        tipo = linha[ 0:2 ]
+
+        # Cotação
+        if (
+            tipo == '01' and
+            len( linha.rstrip( '\r\n' ) ) == tamanho_registro
+        ):
+            if prefiltro and not all(
+                linha.startswith( valores, inicio )
+                for inicio, valores in prefiltro
+            ):
+                ignorados += 1
+
+                continue
+
+            # Campos numéricos com outros caracteres e datas impossíveis
+            # invalidam o registro, como no motor 'regex'
+            try:
+                if testes and not all(
+                    testar( conversor( linha[ inicio:fim ] ), operador, alvo )
+                    for inicio, fim, conversor, operador, alvo in testes
+                ):
+                    continue
+
+                for adicionar, inicio, fim, conversor in decodificadores:
+                    adicionar( conversor( linha[ inicio:fim ] ) )
+
+            except ValueError:
+                descartar_registro( colunas )
+                dispensar_linha( i )
+                dispensadas += 1
+
+            continue
+
+        # Cabeçalho e cauda
+        if tipo == '00' and linha[ 2:11 ] == 'COTAHIST.':
+            campos = campos_cabecalho
+
+        elif tipo == '99' and linha[ 2:11 ] == 'COTAHIST.':
+            campos = campos_cauda
+
+        else:
+            print(
+                'Linha {0} não corresponde a nenhum tipo de informação '
+                'relevante para o arquivo. A linha será dispensada e a '
+                'análise do arquivo prosseguirá a partir da linha '
+                'seguinte.'.format( i )
+            )
+            dispensadas += 1
+
+            continue
+
+        try:
+            valores = {
+                nome: conversor( linha[ inicio:fim ] )
+                for nome, inicio, fim, conversor in campos
+            }
+
+        except ValueError:
+            dispensar_linha( i )
+            dispensadas += 1
+
+            continue
+
+        for nome, valor in valores.items():
+            if nome == 'num_registros' or metadados.get( nome ) is None:
+                metadados[ nome ] = valor
+
+    metadados[ 'registros_ignorados' ] = (
+        metadados.get( 'registros_ignorados' ) or 0
+    ) + ignorados
+    metadados[ 'registros_lidos' ] = (
+        metadados.get( 'registros_lidos' ) or 0
+    ) + i - primeira_linha + 1 - dispensadas
+
+    return dispensadas
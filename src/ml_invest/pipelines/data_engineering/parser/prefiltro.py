@@ -0,0 +1,96 @@
+# -*- encoding: utf-8 -*-
+# ##############################################################################
+# Pré-filtro dos registros de cotação pelos bytes da linha.
+#
+# O pré-filtro é verificado antes de qualquer conversão de campo e compara
+# diretamente as posições fixas da linha com os valores aceitos, ex.:
+#     prefiltro = {
+#         'cod_bdi': [ '02', '96' ],
+#         'tp_merc': [ '010' ],
+#         'cod_papel': [ 'PETR', 'VALE' ],  # prefixos do código do papel
+#     }
+#
+# Apenas os registros de cotação (tipo 01) são pré-filtrados; o cabeçalho e a
+# cauda são sempre lidos. Os valores de 'cod_bdi' e 'tp_merc' precisam ser
+# iguais ao campo, os de 'cod_papel' são prefixos.
+# ##############################################################################
+import numpy as np
+
+from .posicional import campos_cotacao
+
+
+# Campos aceitos no pré-filtro: nome x se os valores são prefixos
+campos_prefiltro = {
+    'cod_bdi': False,
+    'tp_merc': False,
+    'cod_papel': True,
+}
+
+
+def compilar_prefiltro( prefiltro ):
+    '''
+    Converte o dicionário do pré-filtro em uma lista de regras
+    ( início, valores ), onde "valores" é uma tupla de prefixos que a linha
+    deve ter a partir de "início". Campos desconhecidos são ignorados.
+    '''
+    regras = []
+
+    if not prefiltro:
+        return regras
+
+    posicoes = {
+        nome: ( inicio, fim )
+        for nome, inicio, fim, conversor in campos_cotacao
+    }
+
+    for campo, valores in prefiltro.items():
+        if campo not in campos_prefiltro:
+            print(
+                'O campo "{0}" não pode ser usado no pré-filtro. Os campos '
+                'disponíveis são: {1}. O pré-filtro do campo será '
+                'ignorado.'.format( campo, ', '.join( campos_prefiltro ) )
+            )
+
+            continue
+
+        inicio, fim = posicoes[ campo ]
+
+        # Valores exatos ocupam o campo inteiro, completado com espaços
+        if not campos_prefiltro[ campo ]:
+            valores = [ valor.ljust( fim - inicio ) for valor in valores ]
+
+        regras.append( ( inicio, tuple( valores ) ) )
+
+    return regras
+
+
+def aceitar_linha( linha, regras ):
+    '''
+    Retorna se a linha (str) atende a todas as regras do pré-filtro.
+    '''
+    for inicio, valores in regras:
+        if not linha.startswith( valores, inicio ):
+            return False
+
+    return True
+
+
+def mascara_prefiltro( linhas, indices, regras ):
+    '''
+    Avalia as regras do pré-filtro sobre as linhas "indices" de uma matriz
+    ( linhas, bytes ) de uint8 e retorna um vetor booleano. Apenas os bytes
+    dos campos pré-filtrados são copiados.
+    '''
+    resultado = np.ones( len( indices ), dtype = bool )
+
+    for inicio, valores in regras:
+        aceitos = np.zeros( len( indices ), dtype = bool )
+
+        for valor in valores:
+            valor = np.frombuffer( valor.encode( 'latin-1' ), dtype = np.uint8 )
+            trecho = linhas[ indices, inicio:inicio + len( valor ) ]
+            aceitos |= ( trecho == valor ).all( axis = 1 )
+
+        resultado &= aceitos
+
+    return resultado
@@ -0,0 +1,248 @@
+# -*- encoding: utf-8 -*-
+# ##############################################################################
+# Geração de arquivos COTAHIST.AAAA.TXT sintéticos.
+#
+# Os arquivos seguem o layout de 'posicional.py' (cabeçalho, cotações e cauda
+# com o número correto de registros) e têm valores pseudoaleatórios, porém
+# reprodutíveis a partir da semente. Servem para medir o desempenho da leitura
+# com arquivos do tamanho desejado, sem depender do site da B3.
+# ##############################################################################
+import random
+
+from datetime import date
+from datetime import timedelta
+from itertools import accumulate
+
+from .posicional import tamanho_registro
+
+
+# Papéis mais negociados: ( código, nome resumido, especificação )
+papeis = (
+    ( 'PETR4', 'PETROBRAS', 'PN' ),
+    ( 'VALE3', 'VALE', 'ON NM' ),
+    ( 'ITUB4', 'ITAUUNIBANCO', 'PN N1' ),
+    ( 'BBDC4', 'BRADESCO', 'PN N1' ),
+    ( 'ABEV3', 'AMBEV S/A', 'ON' ),
+    ( 'B3SA3', 'B3', 'ON NM' ),
+    ( 'WEGE3', 'WEG', 'ON NM' ),
+    ( 'MGLU3', 'MAGAZ LUIZA', 'ON NM' ),
+)
+
+# Mercados das cotações: ( cod_bdi, tp_merc, peso )
+mercados = (
+    ( '02', '010', 45 ),  # Lote padrão, mercado à vista
+    ( '96', '020', 35 ),  # Mercado fracionário (código + 'F')
+    ( '78', '070', 12 ),  # Opções de compra
+    ( '82', '080', 8 ),   # Opções de venda
+)
+
+# Letras do mês de vencimento das opções de compra (A-L) e de venda (M-X)
+letras_opcoes = {
+    '070': 'ABCDEFGHIJKL',
+    '080': 'MNOPQRSTUVWX',
+}
+
+
+def linha_cabecalho( ano, data_criacao ):
+    return '00COTAHIST.{0:04d}BOVESPA {1:%Y%m%d}'.format(
+        ano, data_criacao
+    ).ljust( tamanho_registro )
+
+
+def linha_cauda( ano, data_criacao, num_registros ):
+    return '99COTAHIST.{0:04d}BOVESPA {1:%Y%m%d}{2:011d}'.format(
+        ano, data_criacao, num_registros
+    ).ljust( tamanho_registro )
+
+
+def linha_cotacao(
+    data_pregao,
+    cod_papel,
+    nome_resum,
+    espec_papel,
+    precos,
+    num_negocios,
+    qtde_titulos,
+    cod_bdi = '02',
+    tp_merc = '010',
+    preco_exerc = 0,
+    data_vencimento = date( 9999, 12, 31 ),
+):
+    '''
+    Monta um registro de cotação. "precos" são os 7 preços do registro e
+    "preco_exerc" o preço de exercício das opções, em centavos.
+    '''
+    volume = qtde_titulos * precos[ 3 ]
+
+    return (
+        '01{0:%Y%m%d}{1}{2:<12}{3}{4:<12}{5:<10}   R$  '.format(
+            data_pregao, cod_bdi, cod_papel, tp_merc, nome_resum, espec_papel
+        ) +
+        ''.join( '{0:013d}'.format( preco ) for preco in precos ) +
+        '{0:05d}{1:018d}{2:018d}{3:013d}0{4:%Y%m%d}{5:07d}{6:013d}'
+        '{7:<12}{8}'.format(
+            num_negocios,
+            qtde_titulos,
+            volume,
+            preco_exerc,
+            data_vencimento,
+            1,
+            preco_exerc * 10 ** 6,
+            'BR' + cod_papel[ :4 ] + 'ACNOR0',
+            '100',
+        )
+    )
+
+
+def gerar_papeis( num_papeis, aleatorio ):
+    '''
+    Retorna "num_papeis" papéis: os de "papeis" seguidos de papéis com
+    códigos aleatórios (4 letras e classe 3, 4 ou 11).
+    '''
+    lista = list( papeis[ :num_papeis ] )
+    codigos = { cod_papel for cod_papel, nome_resum, espec_papel in lista }
+
+    while len( lista ) < num_papeis:
+        raiz = ''.join( aleatorio.choices( 'ABCDEFGHIJKLMNOPQRSTUVWXYZ', k = 4 ) )
+        classe, espec_papel = aleatorio.choice(
+            ( ( '3', 'ON NM' ), ( '4', 'PN' ), ( '11', 'UNT N2' ) )
+        )
+
+        if raiz + classe in codigos:
+            continue
+
+        codigos.add( raiz + classe )
+        lista.append( ( raiz + classe, raiz + ' S.A.', espec_papel ) )
+
+    return lista
+
+
+def dias_uteis( ano ):
+    '''
+    Retorna os dias de semana de "ano" (os feriados não são considerados).
+    '''
+    dia = date( ano, 1, 1 )
+    dias = []
+
+    while dia.year == ano:
+        if dia.weekday() < 5:
+            dias.append( dia )
+
+        dia += timedelta( days = 1 )
+
+    return dias
+
+
+def gerar_linhas( num_cotacoes, ano = 2020, semente = 0, num_papeis = 400 ):
+    '''
+    Gera as linhas (sem a quebra de linha) de um arquivo com "num_cotacoes"
+    registros de cotação de "num_papeis" papéis, distribuídos pelos dias
+    úteis de "ano". Como no arquivo real, os papéis mais líquidos aparecem
+    com mais frequência e as cotações misturam os mercados à vista,
+    fracionário e de opções (ver "mercados").
+    '''
+    aleatorio = random.Random( semente )
+    data_criacao = date( ano + 1, 1, 2 )
+    dias = dias_uteis( ano )
+
+    lista = gerar_papeis( num_papeis, aleatorio )
+    # Pesos acumulados, calculados uma única vez
+    pesos_papeis = list(
+        accumulate( 1 / ( i + 1 ) for i in range( len( lista ) ) )
+    )
+    pesos_mercados = list(
+        accumulate( peso for cod_bdi, tp_merc, peso in mercados )
+    )
+
+    yield linha_cabecalho( ano, data_criacao )
+
+    for i in range( num_cotacoes ):
+        data_pregao = dias[ i * len( dias ) // num_cotacoes ]
+        cod_papel, nome_resum, espec_papel = aleatorio.choices(
+            lista, cum_weights = pesos_papeis
+        )[ 0 ]
+        cod_bdi, tp_merc, peso = aleatorio.choices(
+            mercados, cum_weights = pesos_mercados
+        )[ 0 ]
+
+        abertura = aleatorio.randint( 500, 20000 )
+        preco_exerc = 0
+        data_vencimento = date( 9999, 12, 31 )
+
+        if tp_merc == '020':
+            cod_papel = cod_papel + 'F'
+
+        elif tp_merc in letras_opcoes:
+            # Vencimento no mês seguinte, dia 15
+            mes = data_pregao.month % 12
+            data_vencimento = date( data_pregao.year + ( mes == 0 ), mes + 1, 15 )
+            preco_exerc = abertura // 100 * 100
+            cod_papel = '{0}{1}{2}'.format(
+                cod_papel[ :4 ],
+                letras_opcoes[ tp_merc ][ mes ],
+                preco_exerc // 100,
+            )[ :12 ]
+            abertura = aleatorio.randint( 1, 500 )
+
+        minimo = abertura - aleatorio.randint( 0, abertura // 10 )
+        maximo = abertura + aleatorio.randint( 0, abertura // 10 )
+        ultimo = aleatorio.randint( minimo, maximo )
+        medio = ( minimo + maximo ) // 2
+
+        yield linha_cotacao(
+            data_pregao,
+            cod_papel,
+            nome_resum[ :12 ],
+            espec_papel,
+            ( abertura, maximo, minimo, medio, ultimo, ultimo - 1, ultimo + 1 ),
+            aleatorio.randint( 1, 99999 ),
+            aleatorio.randint( 100, 10 ** 7 ),
+            cod_bdi,
+            tp_merc,
+            preco_exerc,
+            data_vencimento,
+        )
+
+    yield linha_cauda( ano, data_criacao, num_cotacoes + 2 )
+
+
+def gerar_arquivo(
+    endereco_arquivo,
+    num_cotacoes = None,
+    tamanho_mb = None,
+    ano = 2020,
+    semente = 0,
+    quebra_linha = '\n',
+    num_papeis = 400,
+):
+    '''
+    Grava um arquivo COTAHIST sintético em "endereco_arquivo".
+
+    "num_cotacoes": Número de registros de cotação.
+    "tamanho_mb": Alternativamente, o tamanho aproximado do arquivo em MB
+                  (10 ** 6 bytes).
+    "quebra_linha": '\\n' ou '\\r\\n' (como nos arquivos originais).
+    "ano", "semente" e "num_papeis": Como em gerar_linhas().
+
+    Retorna o número de linhas do arquivo.
+    '''
+    if num_cotacoes is None:
+        tamanho_linha = tamanho_registro + len( quebra_linha )
+        num_cotacoes = max( int( tamanho_mb * 1e6 ) // tamanho_linha - 2, 0 )
+
+    with open(
+        endereco_arquivo, mode = 'w', encoding = 'latin-1', newline = ''
+    ) as arquivo:
+        lote = []
+
+        for linha in gerar_linhas( num_cotacoes, ano, semente, num_papeis ):
+            lote.append( linha )
+
+            if len( lote ) == 10000:
+                arquivo.write( quebra_linha.join( lote ) + quebra_linha )
+                lote = []
+
+        if lote:
+            arquivo.write( quebra_linha.join( lote ) + quebra_linha )
+
+    return num_cotacoes + 2
@@ -0,0 +1,363 @@
+# -*- encoding: utf-8 -*-
+# ##############################################################################
+# Decodificação vetorizada (NumPy) do arquivo COTAHIST.AAAA.TXT.
+#
+# O conteúdo do arquivo (bytes, mmap ou qualquer objeto que exponha o protocolo
+# de buffer) é visto como um vetor estruturado de registros de tamanho fixo,
+# cujos campos seguem as posições de 'posicional.py' (as mesmas de 'regex.py').
+# Os campos numéricos são convertidos com aritmética sobre os dígitos ASCII e
+# as datas são montadas em bloco como datetime64[D], sem criar objetos Python
+# por linha.
+# ##############################################################################
+import numpy as np
+import pandas as pd
+
+from .colunas import novas_colunas
+from .filtros import mascarar
+from .prefiltro import mascara_prefiltro
+from .posicional import campos_cabecalho
+from .posicional import campos_cauda
+from .posicional import campos_cotacao
+from .posicional import converter_data
+from .posicional import converter_prazo
+from .posicional import converter_preco
+from .posicional import converter_preco_pontos
+from .posicional import converter_texto
+from .posicional import decodificar_linhas
+from .posicional import tamanho_registro
+
+
+# Maior data representável pelo pandas em datetime64[ns]
+limite_datas_pandas = np.datetime64( '2262-04-11' )
+
+
+# ------------------------------------------------------------------------------
+# Layout
+# ------------------------------------------------------------------------------
+def dtype_registro( tamanho_linha ):
+    '''
+    Retorna o dtype estruturado de uma linha do arquivo com "tamanho_linha"
+    bytes (registro + quebra de linha). Os campos de texto são 'S' e os campos
+    numéricos são vetores de bytes ( 'u1', largura ), prontos para a conversão
+    dos dígitos.
+    '''
+    nomes = [ 'tipo_registro' ]
+    formatos = [ 'S2' ]
+    posicoes = [ 0 ]
+
+    for nome, inicio, fim, conversor in campos_cotacao:
+        nomes.append( nome )
+        posicoes.append( inicio )
+
+        if conversor is converter_texto:
+            formatos.append( 'S{0}'.format( fim - inicio ) )
+        else:
+            formatos.append( ( np.uint8, ( fim - inicio, ) ) )
+
+    return np.dtype( {
+        'names': nomes,
+        'formats': formatos,
+        'offsets': posicoes,
+        'itemsize': tamanho_linha,
+    } )
+
+
+# ------------------------------------------------------------------------------
+# Conversores vetorizados
+# ------------------------------------------------------------------------------
+def converter_inteiros( digitos ):
+    '''
+    Converte uma matriz ( linhas, largura ) de dígitos ASCII em int64.
+    Espaços em branco são tratados como zero.
+    '''
+    largura = digitos.shape[ 1 ]
+    potencias = 10 ** np.arange( largura - 1, -1, -1, dtype = np.int64 )
+    valores = digitos.astype( np.int64 ) - ord( '0' )
+    valores[ digitos == ord( ' ' ) ] = 0
+
+    return valores @ potencias
+
+
+def converter_datas( digitos ):
+    '''
+    Converte uma matriz ( linhas, 8 ) de dígitos AAAAMMDD em datetime64[D].
+    Datas inválidas (ex.: 00000000 ou 20200230) viram NaT.
+    '''
+    anos = converter_inteiros( digitos[ :, 0:4 ] )
+    meses = converter_inteiros( digitos[ :, 4:6 ] )
+    dias = converter_inteiros( digitos[ :, 6:8 ] )
+
+    datas = (
+        ( anos - 1970 ).astype( 'datetime64[Y]' ).astype( 'datetime64[M]' ) +
+        ( meses - 1 ).astype( 'timedelta64[M]' )
+    ).astype( 'datetime64[D]' ) + ( dias - 1 ).astype( 'timedelta64[D]' )
+
+    # Meses e dias fora do calendário "transbordam" para outra data, que não
+    # volta aos mesmos mês e dia
+    inicio_mes = datas.astype( 'datetime64[M]' )
+    validas = (
+        ( ( inicio_mes - datas.astype( 'datetime64[Y]' ) ).astype( np.int64 )
+          == meses - 1 ) &
+        ( ( datas - inicio_mes ).astype( np.int64 ) == dias - 1 ) &
+        ( meses >= 1 ) & ( meses <= 12 )
+    )
+
+    return np.where( validas, datas, np.datetime64( 'NaT', 'D' ) )
+
+
+def converter_textos( textos ):
+    textos = np.char.strip( textos )
+
+    try:
+        # Conversão direta (ASCII), bem mais rápida que a decodificação
+        return textos.astype( 'U' )
+
+    except UnicodeDecodeError:
+        return np.char.decode( textos, 'latin-1' )
+
+
+conversores = {
+    converter_data: converter_datas,
+    converter_texto: converter_textos,
+    converter_prazo: converter_inteiros,
+    converter_preco: lambda digitos: converter_inteiros( digitos ) / 1e2,
+    converter_preco_pontos: (
+        lambda digitos: converter_inteiros( digitos ) / 100e6
+    ),
+    float: lambda digitos: converter_inteiros( digitos ).astype( np.float64 ),
+    int: converter_inteiros,
+}
+
+
+# ------------------------------------------------------------------------------
+# Decodificação
+# ------------------------------------------------------------------------------
+def tamanho_linha( buffer ):
+    '''
+    Retorna o tamanho de cada linha do buffer em bytes, incluindo a quebra de
+    linha ('\\n' ou '\\r\\n').
+    '''
+    inicio = bytes( buffer[ 0:tamanho_registro + 2 ] )
+    fim_linha = inicio.find( b'\n' )
+
+    if fim_linha == -1:
+        return tamanho_registro
+
+    return fim_linha + 1
+
+
+def linhas_uniformes( buffer, tamanho, num_linhas, resto ):
+    '''
+    Verifica se todas as linhas do buffer têm "tamanho" bytes, isto é, se a
+    quebra de linha está no fim de cada uma. Bytes em branco após a última
+    linha são aceitos.
+    '''
+    if resto and resto < tamanho_registro:
+        if bytes( buffer[ len( buffer ) - resto: ] ).strip( b' \r\n\x1a' ):
+            return False
+
+    if tamanho <= tamanho_registro or not num_linhas:
+        return True
+
+    finais = np.frombuffer(
+        buffer, dtype = np.uint8, count = num_linhas * tamanho
+    ).reshape( num_linhas, tamanho )[ :, tamanho - 1 ]
+
+    return bool( ( finais == ord( '\n' ) ).all() )
+
+
+def decodificar_irregular(
+    buffer, cols_sel, primeira_linha = 1, filtros = (), prefiltro = ()
+):
+    '''
+    Decodifica, linha a linha, um buffer cujas linhas não têm todas o mesmo
+    tamanho, com o motor posicional. Retorna o mesmo que decodificar_buffer().
+    '''
+    colunas = novas_colunas( cols_sel )
+    metadados = {
+        'ano_historico': None,
+        'data_criacao': None,
+        'num_registros': None,
+        'registros_ignorados': 0,
+        'registros_lidos': 0,
+    }
+
+    linhas = bytes( buffer ).decode( 'latin-1' ).split( '\n' )
+
+    # O buffer termina em quebra de linha
+    if linhas[ -1 ].strip( ' \r\x1a' ) == '':
+        linhas.pop()
+
+    dispensadas = decodificar_linhas(
+        linhas, colunas, metadados, primeira_linha, filtros, prefiltro
+    )
+
+    colunas = { col: np.asarray( colunas[ col ] ) for col in cols_sel }
+
+    return colunas, metadados, dispensadas
+
+
+def decodificar_buffer(
+    buffer, cols_sel, primeira_linha = 1, filtros = (), prefiltro = ()
+):
+    '''
+    Decodifica todos os registros contidos em "buffer".
+
+    "buffer": Conteúdo do arquivo descompactado (bytes, mmap, memoryview...).
+    "cols_sel": Lista com os nomes das colunas que devem ser convertidas.
+    "primeira_linha": Número da primeira linha do buffer, usado nas mensagens.
+    "filtros": Lista de filtros ( coluna, operador, valor ) (ver filtros.py).
+               Cada filtro converte apenas o seu campo dos registros ainda
+               aceitos, e as colunas selecionadas são convertidas só para os
+               registros aceitos por todos os filtros.
+    "prefiltro": Regras ( início, valores ) do pré-filtro (ver prefiltro.py),
+                 comparadas diretamente com os bytes dos registros.
+
+    Retorna uma tupla ( colunas, metadados, dispensadas ), onde "colunas" é um
+    dicionário { nome da coluna: numpy.ndarray }, "metadados" contém as chaves
+    'ano_historico', 'data_criacao', 'num_registros', 'registros_ignorados'
+    (rejeitados pelo pré-filtro) e 'registros_lidos' (cabeçalho, cotações e
+    cauda encontrados no buffer) e "dispensadas" é o número de linhas que não
+    correspondem a nenhum tipo de registro.
+    '''
+    tamanho = tamanho_linha( buffer )
+    num_linhas, resto = divmod( len( buffer ), tamanho )
+
+    # Última linha sem a quebra de linha
+    if resto >= tamanho_registro:
+        buffer = bytes( buffer ) + b'\n' * ( tamanho - resto )
+        num_linhas += 1
+
+    # Uma linha curta ou longa deslocaria todos os registros seguintes
+    if not linhas_uniformes( buffer, tamanho, num_linhas, resto ):
+        print(
+            'As linhas do arquivo não têm todas o mesmo tamanho. O arquivo '
+            'será lido linha a linha pelo motor posicional.'
+        )
+
+        return decodificar_irregular(
+            buffer, cols_sel, primeira_linha, filtros, prefiltro
+        )
+
+    registros = np.frombuffer(
+        buffer, dtype = dtype_registro( tamanho ), count = num_linhas
+    )
+    tipos = registros[ 'tipo_registro' ]
+
+    metadados = {
+        'ano_historico': None,
+        'data_criacao': None,
+        'num_registros': None,
+        'registros_ignorados': 0,
+        'registros_lidos': 0,
+    }
+
+    dispensadas = 0
+
+    for i in np.flatnonzero( tipos != b'01' ):
+        linha = bytes( buffer[ i * tamanho : ( i + 1 ) * tamanho ] )
+        linha = linha.decode( 'latin-1' )
+
+        if linha[ 0:11 ] == '00COTAHIST.':
+            campos = campos_cabecalho
+
+        elif linha[ 0:11 ] == '99COTAHIST.':
+            campos = campos_cauda
+
+        else:
+            print(
+                'Linha {0} não corresponde a nenhum tipo de informação '
+                'relevante para o arquivo. A linha será dispensada e a '
+                'análise do arquivo prosseguirá a partir da linha '
+                'seguinte.'.format( i + primeira_linha )
+            )
+            dispensadas += 1
+
+            continue
+
+        for nome, inicio, fim, conversor in campos:
+            if nome == 'num_registros' or metadados[ nome ] is None:
+                metadados[ nome ] = conversor( linha[ inicio:fim ] )
+
+    metadados[ 'registros_lidos' ] = num_linhas - dispensadas
+
+    cotacoes = np.flatnonzero( tipos == b'01' )
+
+    if prefiltro:
+        linhas = np.frombuffer(
+            buffer, dtype = np.uint8, count = num_linhas * tamanho
+        ).reshape( num_linhas, tamanho )
+        aceitos = mascara_prefiltro( linhas, cotacoes, prefiltro )
+
+        metadados[ 'registros_ignorados' ] = int( ( ~aceitos ).sum() )
+        cotacoes = cotacoes[ aceitos ]
+
+    conversores_campos = {
+        nome: conversores[ conversor ]
+        for nome, inicio, fim, conversor in campos_cotacao
+    }
+
+    for coluna, operador, alvo in filtros:
+        valores = conversores_campos[ coluna ]( registros[ coluna ][ cotacoes ] )
+        cotacoes = cotacoes[ mascarar( valores, operador, alvo ) ]
+
+    colunas = {}
+
+    for nome, inicio, fim, conversor in campos_cotacao:
+        if nome in cols_sel:
+            colunas[ nome ] = conversores[ conversor ](
+                registros[ nome ][ cotacoes ]
+            )
+
+    return colunas, metadados, dispensadas
+
+
+# ------------------------------------------------------------------------------
+# Pandas
+# ------------------------------------------------------------------------------
+def para_pandas( coluna ):
+    '''
+    Prepara uma coluna decodificada para o pandas. Apenas as colunas
+    numéricas são passadas sem cópia; as demais são copiadas:
+        - datas: os dias (datetime64[D]) são convertidos para um novo vetor
+          datetime64[ns], a única resolução do pandas. Colunas com valores
+          fora do intervalo suportado por ela (ex.: vencimento em 9999-12-31)
+          são convertidas para objetos datetime;
+        - textos: viram categorias, com os códigos copiados para o menor tipo
+          inteiro que os comporta.
+    Mesmo as colunas numéricas podem ser copiadas pelo próprio pandas ao
+    montar o DataFrame (versões anteriores à 2.0 juntam as colunas de mesmo
+    tipo em um único bloco).
+    '''
+    if hasattr( coluna, 'para_pandas' ):
+        coluna = coluna.para_pandas()
+
+    if not isinstance( coluna, np.ndarray ):
+        return coluna
+
+    if coluna.dtype.kind == 'U':
+        return pd.Categorical( coluna )
+
+    if coluna.dtype.kind != 'M':
+        return coluna
+
+    if ( coluna[ ~np.isnat( coluna ) ] >= limite_datas_pandas ).any():
+        return coluna.astype( 'datetime64[us]' ).astype( object )
+
+    return coluna.astype( 'datetime64[ns]' )
+
+
+def para_dataframe( colunas, cols_sel = None ):
+    '''
+    Monta um pandas.DataFrame a partir das colunas retornadas por
+    decodificar_buffer() (ou das colunas tipadas dos motores posicional e
+    regex), na ordem de "cols_sel".
+    '''
+    if cols_sel is None:
+        cols_sel = list( colunas )
+
+    return pd.DataFrame(
+        { col: para_pandas( colunas[ col ] ) for col in cols_sel },
+        columns = cols_sel,
+        copy = False,
+    )
@@ -20,7 +20,8 @@ def create_pipeline(**kwargs):
             ),
             node(
                 func=get_ibov_data,
-                inputs=["ibov_urls", "last_updated",  "params:ibov_link"],
+                inputs=["ibov_urls", "last_updated",  "params:ibov_link",
+                        "params:ibov_parser", "params:ibov_download"],
                 outputs="ibov_csv",
                 name="get_ibov_data",
                 confirms="ibov_urls"
@@ -6,6 +6,7 @@ from typing import Dict
 from kedro.framework.context import KedroContext, load_package_context
 from kedro.pipeline import Pipeline
 
+from ml_invest.hooks import InstrumentationHooks
 from ml_invest.pipeline import create_pipelines
 
 class ProjectContext(KedroContext):
@@ -18,6 +19,9 @@ class ProjectContext(KedroContext):
     project_version = "0.16.3"
     package_name = "ml_invest"
 
+    # Times every node and dataset operation, see ml_invest/hooks.py
+    hooks = (InstrumentationHooks(),)
+
     def _get_pipelines(self) -> Dict[str, Pipeline]:
         return create_pipelines()
 
@@ -0,0 +1,19 @@
+from benchmarks import bench_ingest
+
+
+def test_stages_parse_every_generated_row(tmp_path):
+    results = bench_ingest.run(
+        [2019, 2020],
+        records_per_year=300,
+        num_tickers=20,
+        engines=["numpy", "posicional"],
+        stages=["get_ibov_data", "data_to_csv"],
+        directory=str(tmp_path),
+    )
+
+    assert [r["case"] for r in results] == [
+        "get_ibov_data", "data_to_csv/numpy", "data_to_csv/posicional"]
+    assert all(r["rows"] == 600 for r in results)
+    assert all(r["rows_per_s"] > 0 and r["best_s"] > 0 for r in results)
+    assert all(r["peak_rss_mb"] is None or r["peak_rss_mb"] > 0 for r in results)
+    assert "data_to_csv/numpy" in bench_ingest.report(results)
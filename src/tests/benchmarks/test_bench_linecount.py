@@ -0,0 +1,57 @@
+import gc
+import json
+import sys
+
+import pytest
+
+from benchmarks import bench_linecount
+from benchmarks.harness import find_regressions
+from ml_invest.pipelines.data_engineering.parser.sintetico import gerar_arquivo
+
+
+def test_every_strategy_counts_the_synthetic_file(tmp_path):
+    output = tmp_path / "results.json"
+
+    status = bench_linecount.main([
+        "--sizes-mb", "0.05",
+        "--repeat", "1",
+        "--directory", str(tmp_path / "files"),
+        "--output", str(output),
+    ])
+
+    results = json.loads(output.read_text())["results"]
+    assert status == 0
+    assert {r["cache"] for r in results} == {"cold", "warm"}
+    assert {r["case"] for r in results} <= set(bench_linecount.strategies())
+    assert all(r["correct"] and r["lines"] == 203 for r in results)
+    assert all(r["mb_per_s"] > 0 for r in results)
+
+
+def test_regressions_are_reported():
+    def result(best_s):
+        return dict(benchmark="linecount", case="mapcount", size_bytes=100,
+                    cache="warm", best_s=best_s)
+
+    assert find_regressions([result(1.1)], [result(1.0)], 0.2) == []
+    assert len(find_regressions([result(1.5)], [result(1.0)], 0.2)) == 1
+    assert find_regressions([result(1.5)], [], 0.2) == []
+
+
+@pytest.mark.filterwarnings("error::ResourceWarning")
+@pytest.mark.parametrize("name", sorted(bench_linecount.strategies()))
+def test_strategies_close_their_files(tmp_path, monkeypatch, name):
+    # A file left open raises the ResourceWarning when it is collected, where
+    # it cannot propagate, so it is caught by the unraisable hook
+    unraisable = []
+    monkeypatch.setattr(sys, "unraisablehook", unraisable.append)
+    path = tmp_path / "COTAHIST.TXT"
+    gerar_arquivo(str(path), tamanho_mb=0.01)
+    empty = tmp_path / "empty.TXT"
+    empty.touch()
+
+    func = bench_linecount.strategies()[name]
+    func(str(path))
+    func(str(empty))
+    gc.collect()
+
+    assert [hook.exc_value for hook in unraisable] == []
@@ -0,0 +1,217 @@
+import pandas as pd
+import pytest
+
+from kedro.io.core import DataSetError
+
+from ml_invest.io import AppendableCSVDataSet
+
+
+@pytest.fixture
+def quotes():
+    return pd.DataFrame({
+        "data_pregao": ["2019-12-30", "2020-01-02", "2020-01-02", "2020-01-03"],
+        "cod_papel": ["PETR4", "PETR4", "VALE3", "VALE3"],
+        "preco_ultimo": [30.5, 30.9, 54.3, 54.0],
+    })
+
+
+@pytest.fixture
+def data_set(tmp_path, quotes):
+    data_set = AppendableCSVDataSet(filepath=str(tmp_path / "ibov_dataset.csv"),
+                                    chunksize=2)
+    data_set.save(quotes.iloc[:2])
+    data_set.save(quotes.iloc[2:])
+    return data_set
+
+
+class TestAppendableCSVDataSet:
+    def test_appends_without_header(self, data_set, quotes):
+        pd.testing.assert_frame_equal(data_set.load(), quotes)
+
+    def test_query_columns(self, data_set, quotes):
+        reloaded = data_set.query(columns=["cod_papel", "preco_ultimo"])
+        pd.testing.assert_frame_equal(reloaded,
+                                      quotes[["cod_papel", "preco_ultimo"]])
+
+    def test_query_dates_and_tickers(self, data_set):
+        reloaded = data_set.query(columns=["preco_ultimo"], start="2020-01-01",
+                                  end="2020-01-02", tickers=["VALE3"])
+
+        assert list(reloaded.columns) == ["preco_ultimo"]
+        assert reloaded["preco_ultimo"].tolist() == [54.3]
+
+    def test_query_parsed_dates(self, tmp_path, data_set):
+        parsed = AppendableCSVDataSet(
+            filepath=str(tmp_path / "ibov_dataset.csv"),
+            load_args={"parse_dates": ["data_pregao"]},
+            query_args={"start": "2020-01-03"},
+        )
+        assert parsed.load()["preco_ultimo"].tolist() == [54.0]
+
+    def test_query_without_matches(self, data_set):
+        assert data_set.query(tickers=["ITUB4"]).empty
+
+
+class TestAppendableCSVDataSetKeys:
+    @pytest.fixture
+    def keyed(self, tmp_path):
+        def keyed(**kwargs):
+            return AppendableCSVDataSet(
+                filepath=str(tmp_path / "ibov_dataset.csv"),
+                keys=["data_pregao", "cod_papel"], **kwargs)
+        return keyed
+
+    def test_skips_rows_already_appended(self, keyed, quotes):
+        data_set = keyed()
+        data_set.save(quotes.iloc[:3])
+        data_set.save(quotes.iloc[1:])
+
+        pd.testing.assert_frame_equal(data_set.load(), quotes)
+
+    def test_keeps_the_last_repeated_row(self, keyed, quotes):
+        data_set = keyed()
+        repeated = quotes.iloc[[0, 1]].assign(data_pregao="2020-01-02",
+                                              cod_papel="PETR4")
+        data_set.save(repeated)
+
+        assert data_set.load()["preco_ultimo"].tolist() == [30.9]
+
+    def test_keys_match_parsed_dates(self, keyed, quotes):
+        data_set = keyed()
+        data_set.save(quotes)
+        parsed = quotes.assign(data_pregao=pd.to_datetime(quotes.data_pregao))
+        data_set.save(parsed)
+
+        assert len(data_set.load()) == len(quotes)
+
+    def test_keys_match_dates_written_with_time(self, tmp_path, keyed, quotes):
+        quotes.iloc[:2].assign(
+            data_pregao=pd.to_datetime(quotes.data_pregao.iloc[:2])
+        ).to_csv(tmp_path / "ibov_dataset.csv", index=False,
+                 date_format="%Y-%m-%d 00:00:00")
+        data_set = keyed()
+        data_set.save(quotes)
+
+        assert data_set.load()["cod_papel"].tolist() == ["PETR4", "PETR4",
+                                                        "VALE3", "VALE3"]
+
+    def test_rebuilds_keys_of_files_written_by_others(self, tmp_path, keyed,
+                                                      quotes):
+        quotes.iloc[:2].to_csv(tmp_path / "ibov_dataset.csv", index=False)
+        data_set = keyed()
+        data_set.save(quotes)
+
+        pd.testing.assert_frame_equal(data_set.load(), quotes)
+
+    def test_rebuilds_keys_with_the_csv_dialect(self, tmp_path, keyed, quotes):
+        dialect = {"sep": ";", "encoding": "latin-1"}
+        quotes = quotes.assign(nome_resum="ITAÚ;UNIBANCO")
+        quotes.iloc[:2].to_csv(tmp_path / "ibov_dataset.csv", index=False,
+                               **dialect)
+        data_set = keyed(load_args=dict(dialect), save_args=dict(dialect))
+        data_set.save(quotes)
+
+        pd.testing.assert_frame_equal(data_set.load(), quotes)
+
+    def test_rejects_duplicates(self, keyed, quotes):
+        data_set = keyed(on_duplicate="error")
+        data_set.save(quotes.iloc[:2])
+
+        with pytest.raises(DataSetError, match="1 rows have keys"):
+            data_set.save(quotes.iloc[1:])
+        pd.testing.assert_frame_equal(data_set.load(), quotes.iloc[:2])
+
+    def test_keys_with_index(self, keyed, quotes):
+        data_set = keyed(index=True)
+        data_set.save(quotes.iloc[:3])
+        data_set.save(quotes)
+
+        assert data_set.lookup(tickers=["VALE3"])["preco_ultimo"].tolist() == [
+            54.3, 54.0]
+
+    def test_invalid_on_duplicate(self, keyed):
+        with pytest.raises(DataSetError, match="on_duplicate"):
+            keyed(on_duplicate="replace")
+
+
+class TestAppendableCSVDataSetUpsert:
+    @pytest.fixture
+    def upserting(self, tmp_path):
+        def upserting(**kwargs):
+            return AppendableCSVDataSet(
+                filepath=str(tmp_path / "ibov_dataset.csv"),
+                keys=["data_pregao", "cod_papel"], on_duplicate="upsert",
+                **kwargs)
+        return upserting
+
+    @pytest.fixture
+    def corrected(self, quotes):
+        # A correction of VALE3 on 2020-01-02 and a new quote
+        return pd.DataFrame({
+            "data_pregao": ["2020-01-02", "2020-01-06"],
+            "cod_papel": ["VALE3", "PETR4"],
+            "preco_ultimo": [54.4, 31.0],
+        })
+
+    def test_reads_see_the_latest_values(self, tmp_path, upserting, quotes,
+                                         corrected):
+        data_set = upserting()
+        data_set.save(quotes)
+        data_set.save(corrected)
+
+        reloaded = data_set.load().set_index(["data_pregao", "cod_papel"])
+        assert len(reloaded) == 5
+        assert reloaded.loc[("2020-01-02", "VALE3"), "preco_ultimo"] == 54.4
+        assert reloaded.loc[("2020-01-06", "PETR4"), "preco_ultimo"] == 31.0
+        assert len(list((tmp_path / "ibov_dataset.csv.deltas").iterdir())) == 1
+
+    def test_queries_see_the_latest_values(self, upserting, quotes, corrected):
+        for index in (False, True):
+            data_set = upserting(index=index)
+            data_set.save(quotes)
+            data_set.save(corrected)
+
+            vale3 = data_set.query(columns=["preco_ultimo"], start="2020-01-02",
+                                   tickers=["VALE3"])
+            assert sorted(vale3["preco_ultimo"].tolist()) == [54.0, 54.4]
+            assert list(vale3.columns) == ["preco_ultimo"]
+
+    @pytest.mark.parametrize("index", [False, True])
+    def test_unchanged_rows_write_no_delta(self, tmp_path, upserting, quotes,
+                                           corrected, index):
+        data_set = upserting(index=index)
+        data_set.save(quotes)
+        data_set.save(quotes)
+        assert not (tmp_path / "ibov_dataset.csv.deltas").exists()
+
+        # Only the changed row of a save repeating the last days
+        data_set.save(pd.concat([quotes.iloc[2:], corrected]))
+        deltas = list((tmp_path / "ibov_dataset.csv.deltas").iterdir())
+        assert len(deltas) == 1
+        assert pd.read_csv(deltas[0])["preco_ultimo"].tolist() == [54.4]
+
+    def test_compact_merges_deltas_sorted(self, tmp_path, upserting, quotes,
+                                          corrected):
+        data_set = upserting()
+        data_set.save(quotes)
+        data_set.save(corrected)
+        data_set.save(corrected.assign(preco_ultimo=[54.5, 31.1]))
+        before = data_set.load()
+
+        data_set.compact()
+
+        after = data_set.load()
+        assert not list((tmp_path / "ibov_dataset.csv.deltas").iterdir())
+        assert after["preco_ultimo"].tolist() == [30.5, 30.9, 54.5, 54.0, 31.1]
+        pd.testing.assert_frame_equal(
+            before.sort_values(["data_pregao", "cod_papel"]).reset_index(drop=True),
+            after)
+
+    def test_compacts_after_max_deltas(self, tmp_path, upserting, quotes):
+        data_set = upserting(max_deltas=1)
+        data_set.save(quotes)
+        data_set.save(quotes.assign(preco_ultimo=1.0))
+        data_set.save(quotes.assign(preco_ultimo=2.0))
+
+        assert not list((tmp_path / "ibov_dataset.csv.deltas").iterdir())
+        assert data_set.load()["preco_ultimo"].tolist() == [2.0] * 4
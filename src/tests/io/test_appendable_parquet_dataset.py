@@ -0,0 +1,190 @@
+import json
+
+import pandas as pd
+import pyarrow.parquet as pq
+import pytest
+
+from kedro.io.core import DataSetError
+
+from ml_invest.io import AppendableParquetDataSet
+
+
+@pytest.fixture
+def quotes():
+    return pd.DataFrame({
+        "data_pregao": ["2019-12-30", "2020-01-02", "2020-01-02"],
+        "cod_papel": ["PETR4", "PETR4", "VALE3"],
+        "preco_ultimo": [30.5, 30.9, 54.3],
+    })
+
+
+@pytest.fixture
+def data_set(tmp_path):
+    return AppendableParquetDataSet(filepath=str(tmp_path / "ibov_dataset"),
+                                    date_columns=["data_pregao"])
+
+
+class TestAppendableParquetDataSet:
+    def test_appends_fragments(self, data_set, quotes, tmp_path):
+        data_set.save(quotes.iloc[:1])
+        data_set.save(quotes.iloc[1:])
+
+        fragments = sorted(p.name for p in
+                           (tmp_path / "ibov_dataset").glob("*.parquet"))
+        assert fragments == ["part-00000.parquet", "part-00001.parquet"]
+
+        reloaded = data_set.load()
+        assert reloaded["cod_papel"].tolist() == ["PETR4", "PETR4", "VALE3"]
+        assert pd.api.types.is_datetime64_any_dtype(reloaded["data_pregao"])
+
+    def test_skips_empty_frames(self, data_set, quotes):
+        data_set.save(quotes.iloc[:0])
+        assert not data_set.exists()
+
+    def test_load_missing_raises(self, data_set):
+        with pytest.raises(DataSetError):
+            data_set.load()
+
+    def test_loads_columns_and_dates(self, tmp_path, quotes):
+        path = str(tmp_path / "ibov_dataset")
+        AppendableParquetDataSet(path, date_columns=["data_pregao"]).save(quotes)
+
+        data_set = AppendableParquetDataSet(path, load_args={
+            "columns": ["cod_papel", "preco_ultimo"],
+            "filters": [["data_pregao", ">=", "2020-01-01"]],
+        }, date_columns=["data_pregao"])
+        reloaded = data_set.load()
+
+        assert list(reloaded.columns) == ["cod_papel", "preco_ultimo"]
+        assert reloaded["preco_ultimo"].tolist() == [30.9, 54.3]
+
+    def test_query_dates_and_tickers(self, data_set, quotes):
+        data_set.save(quotes)
+
+        reloaded = data_set.query(columns=["preco_ultimo"], start="2020-01-01",
+                                  tickers=["VALE3"])
+
+        assert list(reloaded.columns) == ["preco_ultimo"]
+        assert reloaded["preco_ultimo"].tolist() == [54.3]
+
+    def test_skips_row_groups_by_statistics(self, tmp_path, quotes, monkeypatch):
+        data_set = AppendableParquetDataSet(str(tmp_path / "ibov_dataset"),
+                                            date_columns=["data_pregao"],
+                                            save_args={"row_group_size": 1})
+        data_set.save(quotes)
+        read = []
+        read_row_group = pq.ParquetFile.read_row_group
+
+        def spy(self, group, **kwargs):
+            read.append(group)
+            return read_row_group(self, group, **kwargs)
+
+        monkeypatch.setattr(pq.ParquetFile, "read_row_group", spy)
+        vale3 = data_set.query(start="2020-01-01", tickers=["VALE3"])
+
+        assert vale3["preco_ultimo"].tolist() == [54.3]
+        assert read == [2]
+
+    def test_disjunction_of_filters(self, tmp_path, quotes):
+        path = str(tmp_path / "ibov_dataset")
+        AppendableParquetDataSet(path, date_columns=["data_pregao"]).save(quotes)
+
+        data_set = AppendableParquetDataSet(path, load_args={"filters": [
+            [("cod_papel", "==", "VALE3")],
+            [("data_pregao", "<", "2020-01-01")],
+        ]}, date_columns=["data_pregao"])
+
+        assert data_set.query(columns=["preco_ultimo"])[
+            "preco_ultimo"].tolist() == [30.5, 54.3]
+
+    def test_query_args_applied_on_load(self, tmp_path, quotes):
+        path = str(tmp_path / "ibov_dataset")
+        AppendableParquetDataSet(path, date_columns=["data_pregao"]).save(quotes)
+
+        data_set = AppendableParquetDataSet(path, date_columns=["data_pregao"],
+                                            query_args={"end": "2019-12-31"})
+        assert data_set.load()["preco_ultimo"].tolist() == [30.5]
+
+
+class TestPartitionedParquetDataSet:
+    @pytest.fixture
+    def partitioned(self, tmp_path):
+        return AppendableParquetDataSet(
+            filepath=str(tmp_path / "ibov_dataset"),
+            date_columns=["data_pregao"],
+            partition_by_year=True,
+            ticker_buckets=4,
+        )
+
+    def test_writes_only_affected_partitions(self, partitioned, quotes, tmp_path):
+        partitioned.save(quotes)
+        partitioned.save(quotes.iloc[2:])
+
+        root = tmp_path / "ibov_dataset"
+        files = sorted(p.relative_to(root).as_posix()
+                       for p in root.rglob("*.parquet"))
+        buckets = {ticker: AppendableParquetDataSet._bucket(ticker, 4)
+                   for ticker in ("PETR4", "VALE3")}
+        assert files == sorted([
+            f"year=2019/bucket={buckets['PETR4']}/part-00000.parquet",
+            f"year=2020/bucket={buckets['PETR4']}/part-00000.parquet",
+            f"year=2020/bucket={buckets['VALE3']}/part-00000.parquet",
+            f"year=2020/bucket={buckets['VALE3']}/part-00001.parquet",
+        ])
+
+        reloaded = partitioned.load()
+        assert list(reloaded.columns) == ["data_pregao", "cod_papel",
+                                          "preco_ultimo"]
+        assert len(reloaded) == 4
+
+    def test_prunes_partitions(self, partitioned, quotes, monkeypatch):
+        partitioned.save(quotes)
+        read = []
+        parquet_file = pq.ParquetFile
+
+        def spy(path, **kwargs):
+            read.append(path)
+            return parquet_file(path, **kwargs)
+
+        monkeypatch.setattr(pq, "ParquetFile", spy)
+        petr4 = partitioned.query(columns=["preco_ultimo"], start="2020-01-01",
+                                  tickers=iter(["PETR4"]))
+
+        assert petr4["preco_ultimo"].tolist() == [30.9]
+        assert len(read) == 1 and "year=2020" in read[0]
+
+    def test_query_without_partitions(self, partitioned, quotes):
+        partitioned.save(quotes)
+
+        empty = partitioned.query(columns=["preco_ultimo"], start="2021-01-01")
+        assert empty.empty and list(empty.columns) == ["preco_ultimo"]
+
+    def test_compact_merges_fragments(self, partitioned, quotes, tmp_path):
+        for _, row in quotes.iterrows():
+            partitioned.save(row.to_frame().T)
+        partitioned.save(quotes.iloc[:1])
+
+        partitioned.compact()
+
+        assert all(len(list(directory.glob("*.parquet"))) == 1
+                   for directory in (tmp_path / "ibov_dataset").rglob("bucket=*"))
+        assert len(partitioned.load()) == 4
+
+    def test_layout_cannot_change(self, partitioned, quotes, tmp_path):
+        partitioned.save(quotes)
+        other = AppendableParquetDataSet(filepath=str(tmp_path / "ibov_dataset"),
+                                         date_columns=["data_pregao"],
+                                         partition_by_year=True)
+
+        with pytest.raises(DataSetError, match="is partitioned as"):
+            other.save(quotes)
+
+    def test_unpartitioned_layout_is_recorded(self, partitioned, quotes,
+                                              tmp_path):
+        path = str(tmp_path / "ibov_dataset")
+        AppendableParquetDataSet(path, date_columns=["data_pregao"]).save(quotes)
+
+        assert json.loads((tmp_path / "ibov_dataset" / "_layout.json")
+                          .read_text()) == {}
+        with pytest.raises(DataSetError, match="is partitioned as {}"):
+            partitioned.save(quotes)
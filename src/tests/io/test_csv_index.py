@@ -0,0 +1,102 @@
+import os
+
+import pandas as pd
+import pytest
+
+from ml_invest.io import AppendableCSVDataSet
+from ml_invest.io.csv_index import CSVIndex
+
+
+@pytest.fixture
+def quotes():
+    return pd.DataFrame({
+        "data_pregao": ["2019-12-30", "2019-12-30", "2020-01-02", "2020-01-02",
+                        "2020-01-03", "2020-01-03"],
+        "cod_papel": ["PETR4", "ITUB4", "PETR4", "VALE3", "ITUB4", "PETR4"],
+        "preco_ultimo": [30.5, 37.1, 30.9, 54.3, 36.8, 30.2],
+    })
+
+
+@pytest.fixture
+def data_set(tmp_path, quotes):
+    data_set = AppendableCSVDataSet(filepath=str(tmp_path / "ibov_dataset.csv"),
+                                    index=True)
+    data_set.save(quotes.iloc[:3])
+    data_set.save(quotes.iloc[3:])
+    return data_set
+
+
+class TestCSVIndex:
+    def test_updated_on_save(self, data_set, tmp_path):
+        index = CSVIndex(str(tmp_path / "ibov_dataset.csv"))
+
+        assert (tmp_path / "ibov_dataset.csv.idx.npz").is_file()
+        assert index.is_fresh()
+        assert index.rows(tickers=["PETR4"]).tolist() == [0, 2, 5]
+        assert index.rows(start="2020-01-02").tolist() == [2, 3, 4, 5]
+
+    def test_lookup(self, data_set, quotes):
+        itub4 = data_set.lookup(tickers=["ITUB4"])
+        pd.testing.assert_frame_equal(itub4, quotes.iloc[[1, 4]].reset_index(drop=True))
+
+        window = data_set.query(columns=["cod_papel"], start="2020-01-01",
+                                end="2020-01-02", tickers=["PETR4", "VALE3", "BBAS3"])
+        assert window["cod_papel"].tolist() == ["PETR4", "VALE3"]
+
+    def test_lookup_without_matches(self, data_set):
+        assert data_set.lookup(tickers=["BBAS3"]).empty
+        assert data_set.lookup(start="2021-01-01").empty
+
+    def test_incremental_matches_rebuild(self, data_set, tmp_path):
+        path = str(tmp_path / "ibov_dataset.csv")
+        incremental = CSVIndex(path)
+        incremental.ensure()
+        appended = dict(incremental._arrays)
+
+        os.remove(f"{path}.idx.npz")
+        rebuilt = CSVIndex(path)
+        rebuilt.ensure()
+
+        for name, array in rebuilt._arrays.items():
+            assert appended[name].tolist() == array.tolist(), name
+
+    def test_rebuilt_when_stale(self, data_set, tmp_path, quotes):
+        # Rows appended without going through the dataset
+        path = tmp_path / "ibov_dataset.csv"
+        quotes.iloc[:1].assign(data_pregao="2020-01-06").to_csv(
+            path, mode="a", header=False, index=False)
+
+        assert not CSVIndex(str(path)).is_fresh()
+        assert data_set.lookup(tickers=["PETR4"])["data_pregao"].tolist() == [
+            "2019-12-30", "2020-01-02", "2020-01-03", "2020-01-06"]
+
+    def test_dates_written_with_time(self, tmp_path, quotes):
+        # Files written before dates were kept as days hold a time as well
+        path = tmp_path / "ibov_dataset.csv"
+        quotes.iloc[:3].assign(
+            data_pregao=pd.to_datetime(quotes.data_pregao.iloc[:3])
+        ).to_csv(path, index=False, date_format="%Y-%m-%d 00:00:00")
+        data_set = AppendableCSVDataSet(filepath=str(path), index=True)
+        data_set.save(quotes.iloc[3:])
+
+        index = CSVIndex(str(path))
+        assert index.rows(start="2020-01-02", end="2020-01-02").tolist() == [2, 3]
+        window = data_set.lookup(start="2019-12-30", end="2019-12-30")
+        assert window["cod_papel"].tolist() == ["PETR4", "ITUB4"]
+        unindexed = AppendableCSVDataSet(filepath=str(path))
+        assert unindexed.query(end="2019-12-30")["cod_papel"].tolist() == [
+            "PETR4", "ITUB4"]
+
+    def test_csv_dialect(self, tmp_path, quotes):
+        dialect = {"sep": ";", "encoding": "latin-1"}
+        quotes = quotes.assign(nome_resum="ITAÚ;UNIBANCO")
+        data_set = AppendableCSVDataSet(
+            filepath=str(tmp_path / "ibov_dataset.csv"), index=True,
+            load_args=dict(dialect), save_args=dict(dialect))
+        data_set.save(quotes.iloc[:3])
+        data_set.save(quotes.iloc[3:])
+
+        itub4 = data_set.lookup(tickers=["ITUB4"], start="2020-01-01")
+        pd.testing.assert_frame_equal(itub4, quotes.iloc[[4]].reset_index(drop=True))
+        assert CSVIndex(str(tmp_path / "ibov_dataset.csv"),
+                        load_args=dialect).rows(end="2019-12-30").tolist() == [0, 1]
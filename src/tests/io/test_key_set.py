@@ -0,0 +1,57 @@
+import os
+
+import pandas as pd
+import pytest
+
+from ml_invest.io.key_set import KeySet
+
+
+@pytest.fixture
+def quotes():
+    return pd.DataFrame({
+        "data_pregao": ["2019-12-30", "2020-01-02", "2020-01-02"],
+        "cod_papel": ["PETR4", "PETR4", "VALE3"],
+        "preco_ultimo": [30.5, 30.9, 54.3],
+    })
+
+
+@pytest.fixture
+def csv_file(tmp_path, quotes):
+    path = tmp_path / "ibov_dataset.csv"
+    quotes.to_csv(path, index=False)
+    return path
+
+
+class TestKeySet:
+    def test_contains_the_keys_of_the_file(self, csv_file, quotes):
+        keys = KeySet(str(csv_file), ["data_pregao", "cod_papel"])
+        other = quotes.assign(cod_papel="ITUB4", preco_ultimo=0.0)
+
+        assert keys.contains(keys.hash(quotes)).all()
+        assert not keys.contains(keys.hash(other)).any()
+        assert os.path.isfile(f"{csv_file}.keys.npz")
+
+    def test_only_key_columns_are_hashed(self, csv_file, quotes):
+        keys = KeySet(str(csv_file), ["data_pregao", "cod_papel"])
+
+        assert (keys.hash(quotes) == keys.hash(quotes.assign(preco_ultimo=1.0))).all()
+
+    def test_add_follows_appends(self, csv_file, quotes):
+        keys = KeySet(str(csv_file), ["data_pregao", "cod_papel"])
+        keys.ensure()
+        previous = keys.stat()
+        new = quotes.assign(data_pregao="2020-01-03")
+        new.to_csv(csv_file, mode="a", header=False, index=False)
+        keys.add(keys.hash(new), previous)
+
+        assert keys.is_fresh()
+        assert keys.contains(keys.hash(new)).all()
+
+    def test_rebuilds_when_stale(self, csv_file, quotes):
+        keys = KeySet(str(csv_file), ["data_pregao", "cod_papel"])
+        keys.ensure()
+        quotes.iloc[:1].to_csv(csv_file, index=False)
+        os.utime(csv_file, ns=(0, 0))
+
+        assert not keys.is_fresh()
+        assert keys.contains(keys.hash(quotes)).tolist() == [True, False, False]
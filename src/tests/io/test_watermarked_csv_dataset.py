@@ -0,0 +1,138 @@
+import pandas as pd
+import pytest
+
+from kedro.io.core import DataSetError
+
+from ml_invest.io import WatermarkedCSVDataSet
+
+
+@pytest.fixture
+def quotes():
+    return pd.DataFrame({
+        "data_pregao": ["2020-01-03", "2020-01-02", "2020-01-02", "2020-01-06"],
+        "cod_papel": ["VALE3", "PETR4", "VALE3", "PETR4"],
+        "preco_ultimo": [54.0, 30.9, 54.3, 30.2],
+    })
+
+
+@pytest.fixture
+def data_set(tmp_path, quotes):
+    data_set = WatermarkedCSVDataSet(path=str(tmp_path / "ibov_csv"))
+    data_set.save({"year=2019": quotes.iloc[:0], "year=2020": quotes})
+    return data_set
+
+
+class TestWatermarkedCSVDataSet:
+    def test_saves_partitions_sorted_by_date(self, data_set, quotes):
+        loaders = data_set.load()
+
+        assert sorted(loaders) == ["year=2019", "year=2020"]
+        pd.testing.assert_frame_equal(
+            loaders["year=2020"](),
+            quotes.sort_values("data_pregao", kind="stable").reset_index(drop=True))
+
+    def test_manifest_holds_the_watermarks(self, data_set):
+        manifest = data_set.read_manifest()
+
+        assert manifest["year=2019"]["rows"] == 0
+        assert manifest["year=2020"]["first"] == "2020-01-02"
+        assert manifest["year=2020"]["last"] == "2020-01-06"
+        assert manifest["year=2020"]["dates"] == [
+            "2020-01-02", "2020-01-03", "2020-01-06"]
+
+    def test_loads_only_new_rows_and_columns(self, data_set):
+        loaders = data_set.load()
+
+        new = loaders["year=2020"](since="2020-01-03",
+                                   columns=["cod_papel", "preco_ultimo"])
+        assert list(new.columns) == ["cod_papel", "preco_ultimo"]
+        assert new["cod_papel"].tolist() == ["VALE3", "PETR4"]
+
+        assert loaders["year=2020"](since="2020-01-07").empty
+        assert loaders["year=2019"](since="2020-01-01").empty
+
+    def test_measures_partitions_written_by_others(self, tmp_path, quotes):
+        # Not in order: the new rows are found by reading the whole file
+        (tmp_path / "ibov_csv").mkdir()
+        quotes.to_csv(tmp_path / "ibov_csv" / "year=2020.csv", index=False)
+        data_set = WatermarkedCSVDataSet(path=str(tmp_path / "ibov_csv"))
+
+        new = data_set.load()["year=2020"](since="2020-01-03",
+                                            columns=["preco_ultimo"])
+
+        assert new["preco_ultimo"].tolist() == [54.0, 30.2]
+        assert "offsets" not in data_set.read_manifest()["year=2020"]
+
+    def test_csv_dialect_and_quoted_newlines(self, tmp_path, quotes):
+        dialect = {"sep": ";", "encoding": "latin-1"}
+        data_set = WatermarkedCSVDataSet(path=str(tmp_path / "ibov_csv"),
+                                         load_args=dict(dialect),
+                                         save_args=dict(dialect))
+        quotes = quotes.assign(nome_resum=["VALE", "PETROBRAS\nPN", "VALE",
+                                           "PETROBRAS"])
+        data_set.save({"year=2020": quotes})
+
+        new = data_set.load()["year=2020"](since="2020-01-03",
+                                            columns=["preco_ultimo"])
+
+        assert new["preco_ultimo"].tolist() == [54.0, 30.2]
+        assert len(data_set.read_manifest()["year=2020"]["offsets"]) == 3
+
+    def test_manifest_follows_changed_partitions(self, data_set, tmp_path, quotes):
+        quotes.iloc[:2].to_csv(tmp_path / "ibov_csv" / "year=2020.csv",
+                               index=False)
+
+        assert data_set.watermark("year=2020")["last"] == "2020-01-03"
+
+    def test_saves_lazy_partitions_batch_by_batch(self, tmp_path, quotes,
+                                                  monkeypatch):
+        data_set = WatermarkedCSVDataSet(path=str(tmp_path / "ibov_csv"))
+        written = []
+        to_csv = pd.DataFrame.to_csv
+
+        def spy(self, *args, **kwargs):
+            written.append(len(self))
+            return to_csv(self, *args, **kwargs)
+
+        def batches():
+            for start in (0, 2):
+                # The batches before this one were already written
+                assert len(written) == start // 2
+                yield quotes.iloc[start:start + 2]
+
+        monkeypatch.setattr(pd.DataFrame, "to_csv", spy)
+        data_set.save({"year=2020": batches, "year=2021": lambda: iter(())})
+
+        assert written == [2, 2]
+        loaders = data_set.load()
+        assert list(loaders) == ["year=2020"]
+        assert loaders["year=2020"]()["cod_papel"].tolist() == [
+            "PETR4", "VALE3", "VALE3", "PETR4"]
+        # Each batch is sorted, but not the partition: it is read whole
+        assert "offsets" not in data_set.read_manifest()["year=2020"]
+        assert loaders["year=2020"](since="2020-01-03")[
+            "preco_ultimo"].tolist() == [54.0, 30.2]
+
+    def test_failed_lazy_partition_is_not_saved(self, tmp_path, quotes):
+        data_set = WatermarkedCSVDataSet(path=str(tmp_path / "ibov_csv"))
+
+        def batches():
+            yield quotes
+            raise ValueError("corrupt archive")
+
+        with pytest.raises(DataSetError, match="corrupt archive"):
+            data_set.save({"year=2020": batches})
+        assert list((tmp_path / "ibov_csv").iterdir()) == []
+
+    def test_day_partitions(self, tmp_path, quotes):
+        data_set = WatermarkedCSVDataSet(path=str(tmp_path / "ibov_csv"))
+        data_set.save({"year=2020/day=2020-01-06": quotes.iloc[3:]})
+
+        assert list(data_set.load()) == ["year=2020/day=2020-01-06"]
+
+    def test_no_partitions(self, tmp_path):
+        data_set = WatermarkedCSVDataSet(path=str(tmp_path / "ibov_csv"))
+
+        assert not data_set.exists()
+        with pytest.raises(DataSetError, match="No partitions found"):
+            data_set.load()
@@ -0,0 +1,103 @@
+import io
+import zipfile
+
+import pytest
+
+from benchmarks.b3_stand_in import serving
+from ml_invest.pipelines.data_engineering.parser.bovesparser import BovesParser
+
+
+def cotahist_header(year="2020", created="20200703"):
+    return f"00COTAHIST.{year}BOVESPA {created}".ljust(245)
+
+
+def cotahist_trailer(num_records, year="2020", created="20200703"):
+    return f"99COTAHIST.{year}BOVESPA {created}{num_records:011d}".ljust(245)
+
+
+def cotahist_quote(
+    date="20200102",
+    cod_bdi="02",
+    cod_papel="PETR4",
+    tp_merc="010",
+    nome_resum="PETROBRAS",
+    espec_papel="PN",
+    prazo="",
+    moeda="R$",
+    prices=(3050, 3100, 3000, 3075, 3080, 3079, 3081),
+    num_negocios=100,
+    qtde_titulos=123400,
+    vol_titulos=3794550,
+    preco_exerc=0,
+    indicador_correcao="0",
+    data_vencimento="99991231",
+    fator_cotacao=1,
+    preco_exerc_pontos=0,
+    cod_isi="BRPETRACNPR6",
+    distribuicao_papel="141",
+):
+    return (
+        f"01{date}{cod_bdi}{cod_papel:<12}{tp_merc}{nome_resum:<12}"
+        f"{espec_papel:<10}{prazo:>3}{moeda:<4}"
+        + "".join(f"{price:013d}" for price in prices)
+        + f"{num_negocios:05d}{qtde_titulos:018d}{vol_titulos:018d}"
+        f"{preco_exerc:013d}{indicador_correcao}{data_vencimento}"
+        f"{fator_cotacao:07d}{preco_exerc_pontos:013d}{cod_isi:<12}"
+        f"{distribuicao_papel}"
+    )
+
+
+def cotahist_lines(quotes):
+    return [cotahist_header()] + quotes + [cotahist_trailer(len(quotes) + 2)]
+
+
+@pytest.fixture
+def quotes():
+    return [
+        cotahist_quote(),
+        cotahist_quote(cod_papel="VALE3", nome_resum="VALE", espec_papel="ON NM"),
+        cotahist_quote(
+            date="20200103",
+            cod_bdi="78",
+            cod_papel="PETRA30",
+            tp_merc="070",
+            prazo="030",
+            preco_exerc=2950,
+            data_vencimento="20200120",
+            preco_exerc_pontos=123456789,
+        ),
+        cotahist_quote(date="20200103", fator_cotacao=1000, moeda="US$"),
+    ]
+
+
+@pytest.fixture
+def cotahist_file(tmp_path, quotes):
+    path = tmp_path / "COTAHIST_A2020.TXT"
+    path.write_text("\n".join(cotahist_lines(quotes)) + "\n", encoding="latin-1")
+    return path
+
+
+@pytest.fixture
+def zipped_cotahist(cotahist_file):
+    content = io.BytesIO()
+    with zipfile.ZipFile(content, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        archive.write(cotahist_file, arcname="COTAHIST.A2020")
+    return content.getvalue()
+
+
+@pytest.fixture
+def parse():
+    """Parses a file with a fresh ``BovesParser`` and returns it."""
+
+    def _parse(path, **kwargs):
+        parser = BovesParser(str(path))
+        parser.ler_arquivo(**kwargs)
+        return parser
+
+    return _parse
+
+
+@pytest.fixture
+def b3_stand_in():
+    with serving() as server:
+        yield server
@@ -0,0 +1,380 @@
+import mmap
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from ml_invest.pipelines.data_engineering.parser.bovesparser import BovesParser
+from ml_invest.pipelines.data_engineering.parser.sintetico import gerar_arquivo
+from ml_invest.pipelines.data_engineering.parser.vetorizado import converter_datas
+
+from .conftest import (
+    cotahist_header,
+    cotahist_lines,
+    cotahist_quote,
+    cotahist_trailer,
+)
+
+
+class TestBovesParser:
+    def test_positional_matches_regex(self, cotahist_file, parse):
+        regex = parse(cotahist_file, motor="regex")
+        regex_data = {col: getattr(regex, col) for col in regex.cols_sel}
+        regex_meta = (regex.ano_historico, regex.data_criacao, regex.num_registros)
+
+        positional = parse(cotahist_file, motor="posicional")
+
+        assert positional.cols_sel == regex.cols_sel
+        for col in positional.cols_sel:
+            assert getattr(positional, col) == regex_data[col], col
+        assert (
+            positional.ano_historico,
+            positional.data_criacao,
+            positional.num_registros,
+        ) == regex_meta
+
+    @pytest.mark.parametrize("num_processos", [1, 2])
+    def test_positional_matches_regex_on_malformed_records(
+            self, tmp_path, quotes, parse, num_processos):
+        # Non-digit bytes in a price, in num_negocios and in a date
+        malformed = [
+            cotahist_quote()[:108] + "00000000030A0" + cotahist_quote()[121:],
+            cotahist_quote()[:147] + "1O0  " + cotahist_quote()[152:],
+            cotahist_quote(date="2020O103"),
+        ]
+        path = tmp_path / "COTAHIST_A2020.TXT"
+        path.write_text("\n".join(cotahist_lines(quotes[:2] + malformed
+                                                 + quotes[2:])) + "\n")
+
+        regex = parse(path, motor="regex")
+        positional = parse(path, motor="posicional",
+                           num_processos=num_processos, tamanho_bloco=300)
+
+        for col in positional.cols_sel:
+            assert list(getattr(positional, col)) == getattr(regex, col), col
+        assert positional.cod_papel == ["PETR4", "VALE3", "PETRA30", "PETR4"]
+        assert positional.registros_lidos == regex.registros_lidos == 6
+
+    def test_malformed_records_are_reported(self, tmp_path, quotes, parse,
+                                            capsys):
+        path = tmp_path / "COTAHIST_A2020.TXT"
+        lines = cotahist_lines(quotes)
+        lines[2] = lines[2][:56] + "ABC" + lines[2][59:]
+        path.write_text("\n".join(lines) + "\n")
+
+        parser = parse(path, cols_sel=["cod_papel", "preco_abertura"])
+
+        assert parser.cod_papel == ["PETR4", "PETRA30", "PETR4"]
+        out = capsys.readouterr().out
+        assert "Linha 3 contém um campo inválido" in out
+        assert "a cauda do arquivo indica 6" in out
+
+    def test_positional_is_default(self, cotahist_file, parse):
+        parser = parse(cotahist_file, cols_sel=["data_pregao", "cod_papel"])
+        assert parser.cols_sel == ["data_pregao", "cod_papel"]
+        assert parser.cod_papel == ["PETR4", "VALE3", "PETRA30", "PETR4"]
+        assert parser.data_pregao[-1] == datetime(2020, 1, 3)
+        assert parser.num_registros == 6
+
+    def test_fields_are_typed(self, cotahist_file, parse):
+        parser = parse(cotahist_file)
+        assert parser.prazo_dias_termo == [0, 0, 30, 0]
+        assert parser.preco_ultimo[0] == 30.8
+        assert parser.vol_titulos[0] == 37945.5
+        assert parser.preco_exerc_pontos[2] == 123456789 / 100e6
+        assert parser.fator_cotacao[3] == 1000
+        assert parser.moeda[3] == "US$"
+        assert parser.data_vencimento[2] == datetime(2020, 1, 20)
+
+    def test_filters(self, cotahist_file, parse):
+        parser = parse(
+            cotahist_file,
+            cols_sel=["cod_papel", "tp_merc", "preco_ultimo"],
+            filtros={"tp_merc": ("in", ["010"])},
+        )
+        assert parser.cod_papel == ["PETR4", "VALE3", "PETR4"]
+
+    @pytest.mark.parametrize(
+        "motor, num_processos",
+        [("posicional", 1), ("regex", 1), ("numpy", 1), ("numpy", 2)],
+    )
+    def test_filters_every_engine(self, cotahist_file, parse, motor, num_processos):
+        parser = parse(
+            cotahist_file,
+            cols_sel=["data_pregao", "cod_bdi", "cod_papel", "preco_ultimo"],
+            filtros={
+                "cod_bdi": ("in", ["02", "96"]),
+                "data_pregao": (">", datetime(2020, 1, 2)),
+                "preco_ultimo": ("<", 31),
+            },
+            motor=motor,
+            num_processos=num_processos,
+            tamanho_bloco=300,
+        )
+        assert list(parser.cod_papel) == ["PETR4"]
+        assert list(parser.cod_bdi) == ["02"]
+
+    @pytest.mark.parametrize(
+        "motor, num_processos",
+        [("posicional", 1), ("regex", 1), ("numpy", 1), ("numpy", 2)],
+    )
+    def test_prefilter_every_engine(self, cotahist_file, parse, motor, num_processos):
+        parser = parse(
+            cotahist_file,
+            cols_sel=["cod_papel", "tp_merc"],
+            prefiltro={"tp_merc": ["010"], "cod_bdi": ["02"], "cod_papel": ["PETR"]},
+            motor=motor,
+            num_processos=num_processos,
+            tamanho_bloco=300,
+        )
+        assert list(parser.cod_papel) == ["PETR4", "PETR4"]
+        assert parser.registros_ignorados == 2
+        assert parser.num_registros == 6
+
+    def test_malformed_lines_are_skipped(self, tmp_path, parse):
+        path = tmp_path / "COTAHIST_A2020.TXT"
+        lines = [
+            cotahist_header(),
+            cotahist_quote(),
+            "01 truncated record",
+            cotahist_trailer(4),
+        ]
+        path.write_text("\n".join(lines) + "\n")
+
+        parser = parse(path, cols_sel=["cod_papel"])
+        assert parser.cod_papel == ["PETR4"]
+
+    def test_numpy_falls_back_on_uneven_lines(self, tmp_path, quotes, parse,
+                                               capsys):
+        # A short line would shift every later record of the vectorized read
+        path = tmp_path / "COTAHIST_A2020.TXT"
+        lines = cotahist_lines(quotes)
+        path.write_text("\n".join(lines[:2] + ["01 truncated record"]
+                                  + lines[2:]) + "\n")
+
+        positional = parse(path, cols_sel=["cod_papel", "data_pregao"])
+        vectorized = parse(path, cols_sel=["cod_papel", "data_pregao"],
+                           motor="numpy")
+
+        assert "motor posicional" in capsys.readouterr().out
+        assert list(vectorized.cod_papel) == positional.cod_papel
+        assert list(vectorized.data_pregao.astype("datetime64[us]")
+                    .astype(object)) == positional.data_pregao
+        assert vectorized.num_registros == 6
+
+    def test_numpy_rejects_impossible_dates(self):
+        digitos = np.frombuffer(b"2020022920200230202013012020010020210229",
+                                dtype=np.uint8).reshape(5, 8)
+
+        datas = converter_datas(digitos)
+
+        assert datas[0] == np.datetime64("2020-02-29")
+        assert np.isnat(datas[1:]).all()
+
+    def test_numpy_matches_positional(self, cotahist_file, parse):
+        positional = parse(cotahist_file)
+        expected = {col: getattr(positional, col) for col in positional.cols_sel}
+
+        vectorized = parse(cotahist_file, motor="numpy")
+
+        for col in vectorized.cols_sel:
+            values = getattr(vectorized, col)
+            if values.dtype.kind == "M":
+                values = values.astype("datetime64[us]").astype(object)
+            assert list(values) == expected[col], col
+        assert vectorized.num_registros == positional.num_registros
+        assert vectorized.data_criacao == positional.data_criacao
+
+    def test_numpy_handles_crlf(self, tmp_path, quotes, parse):
+        path = tmp_path / "COTAHIST_A2020.TXT"
+        path.write_bytes(
+            "\r\n".join(cotahist_lines(quotes)).encode("latin-1")
+        )
+
+        parser = parse(path, cols_sel=["cod_papel", "preco_ultimo"], motor="numpy")
+        assert list(parser.cod_papel) == ["PETR4", "VALE3", "PETRA30", "PETR4"]
+        assert list(parser.preco_ultimo) == [30.8] * 4
+        assert parser.num_registros == 6
+
+    def test_numpy_maps_the_file(self, cotahist_file, tmp_path, parse):
+        parser = parse(cotahist_file, motor="numpy")
+
+        # The columns own their data, the mapping is already closed
+        for col in parser.cols_sel:
+            base = getattr(parser, col)
+            while base is not None:
+                assert not isinstance(base, (mmap.mmap, memoryview)), col
+                base = getattr(base, "base", None)
+        assert list(parser.cod_papel) == ["PETR4", "VALE3", "PETRA30", "PETR4"]
+
+        empty = tmp_path / "COTAHIST_A2021.TXT"
+        empty.write_bytes(b"")
+        parser = parse(empty, cols_sel=["cod_papel"], motor="numpy")
+        assert len(parser.cod_papel) == 0
+        assert parser.num_registros is None
+
+    def test_exportar_dataframe(self, cotahist_file, parse):
+        positional = parse(cotahist_file).exportar_dataframe()
+        vectorized = parse(cotahist_file, motor="numpy").exportar_dataframe()
+
+        assert list(positional.columns) == BovesParser.colunas(None)
+        assert positional.data_pregao.dtype.kind == "M"
+        assert positional.cod_bdi.tolist() == ["02", "02", "78", "02"]
+        assert positional.cod_papel.dtype == "category"
+        pd.testing.assert_frame_equal(
+            positional, vectorized, check_dtype=False, check_categorical=False
+        )
+
+    def test_columns_are_typed_buffers(self, cotahist_file, parse):
+        parser = parse(cotahist_file)
+
+        assert parser.data_pregao.para_numpy().dtype == "datetime64[D]"
+        assert parser.cod_papel.categorias == ["PETR4", "VALE3", "PETRA30"]
+        assert parser.cod_papel.para_numpy().tolist() == [0, 1, 2, 0]
+
+        frame = parser.exportar_dataframe()
+        assert frame.preco_ultimo.tolist() == [30.8] * 4
+        assert np.shares_memory(
+            frame.preco_ultimo.to_numpy(), parser.preco_ultimo.para_numpy()
+        )
+
+    def test_instances_do_not_share_columns(self, cotahist_file, parse):
+        first = parse(cotahist_file, cols_sel=["cod_papel"])
+        second = parse(cotahist_file, cols_sel=["cod_papel"])
+
+        assert first.cod_papel == ["PETR4", "VALE3", "PETRA30", "PETR4"]
+        assert second.cod_papel == first.cod_papel
+        assert second.cod_papel is not first.cod_papel
+
+    def test_parser_is_reusable(self, cotahist_file, tmp_path):
+        other = tmp_path / "COTAHIST_A2019.TXT"
+        other.write_text("\n".join(cotahist_lines([cotahist_quote()])) + "\n")
+
+        parser = BovesParser(str(cotahist_file))
+        parser.ler_arquivo(cols_sel=["cod_papel"])
+        assert len(parser.cod_papel) == 4
+
+        parser.abrir(str(other))
+        parser.ler_arquivo(cols_sel=["cod_papel"])
+        assert parser.cod_papel == ["PETR4"]
+        assert parser.num_registros == 3
+
+        parser.reiniciar()
+        assert len(parser.cod_papel) == 0
+        assert parser.num_registros is None
+
+    @pytest.mark.parametrize("motor", ["posicional", "numpy"])
+    def test_parallel_matches_serial(self, cotahist_file, parse, motor):
+        serial = parse(cotahist_file, motor=motor).exportar_dataframe()
+        parallel = parse(
+            cotahist_file, motor=motor, num_processos=2, tamanho_bloco=300
+        )
+
+        pd.testing.assert_frame_equal(parallel.exportar_dataframe(), serial)
+        assert parallel.num_registros == 6
+        assert parallel.ano_historico == 2020
+
+    @pytest.mark.parametrize("motor", ["posicional", "numpy", "regex"])
+    def test_batches_match_full_read(self, cotahist_file, parse, motor):
+        full = parse(cotahist_file, motor=motor).exportar_dataframe()
+
+        parser = BovesParser(str(cotahist_file))
+        batches = list(parser.ler_lotes(tamanho_lote=2, motor=motor))
+
+        assert all(len(batch) <= 2 for batch in batches)
+        pd.testing.assert_frame_equal(
+            pd.concat(batches, ignore_index=True),
+            full,
+            check_categorical=False,
+            check_dtype=False,
+        )
+        assert parser.num_registros == 6
+        assert parser.ano_historico == 2020
+
+    def test_batches_are_filtered(self, cotahist_file):
+        parser = BovesParser(str(cotahist_file))
+        batches = parser.ler_lotes(
+            tamanho_lote=3,
+            cols_sel=["cod_bdi", "cod_papel"],
+            filtros={"cod_bdi": ("==", "02")},
+            dataframe=False,
+        )
+
+        assert [list(batch["cod_papel"]) for batch in batches] == [
+            ["PETR4", "VALE3"],
+            ["PETR4"],
+        ]
+
+    def test_line_count_comes_from_file_size(self, cotahist_file):
+        parser = BovesParser(str(cotahist_file))
+        assert parser.num_linhas == 6
+
+    @pytest.mark.parametrize(
+        "motor, num_processos",
+        [("posicional", 1), ("regex", 1), ("numpy", 1), ("numpy", 2)],
+    )
+    def test_records_are_checked_against_trailer(
+        self, tmp_path, quotes, parse, motor, num_processos
+    ):
+        path = tmp_path / "COTAHIST_A2020.TXT"
+        path.write_text("\n".join(cotahist_lines(quotes)) + "\n")
+
+        parser = parse(
+            path,
+            motor=motor,
+            num_processos=num_processos,
+            filtros={"cod_bdi": ("==", "02")},
+            prefiltro={"cod_papel": ["PETR"]},
+        )
+        assert parser.registros_lidos == 6
+        assert parser.verificar_registros()
+
+        # A quote lost in the middle of the file
+        lines = cotahist_lines(quotes)
+        path.write_text("\n".join(lines[:2] + lines[3:]) + "\n")
+        parser = parse(path, motor=motor, num_processos=num_processos)
+        assert parser.registros_lidos == 5
+        assert not parser.verificar_registros()
+
+        # No trailer at all
+        path.write_text("\n".join(lines[:-1]) + "\n")
+        parser = parse(path, motor=motor, num_processos=num_processos)
+        assert parser.num_registros is None
+        assert not parser.verificar_registros()
+
+    @pytest.mark.parametrize(
+        "motor, num_processos",
+        [("posicional", 1), ("regex", 1), ("numpy", 1), ("numpy", 2)],
+    )
+    def test_reads_warn_once_about_the_trailer(
+        self, tmp_path, quotes, parse, capsys, motor, num_processos
+    ):
+        path = tmp_path / "COTAHIST_A2020.TXT"
+        lines = cotahist_lines(quotes)
+        path.write_text("\n".join(lines[:-1]) + "\n")
+
+        parse(path, motor=motor, num_processos=num_processos,
+              filtros={"cod_bdi": ("==", "02")})
+        assert capsys.readouterr().out.count("pode estar incompleto") == 1
+
+        # A valid file read in filtered batches is not reported
+        path.write_text("\n".join(lines) + "\n")
+        parser = BovesParser(str(path))
+        list(parser.ler_lotes(tamanho_lote=2, motor="regex",
+                              filtros={"cod_bdi": ("==", "02")}))
+        assert "pode estar incompleto" not in capsys.readouterr().out
+
+    @pytest.mark.parametrize("quebra_linha", ["\n", "\r\n"])
+    def test_synthetic_file_is_valid(self, tmp_path, parse, quebra_linha):
+        path = tmp_path / "COTAHIST_A2020.TXT"
+        num_linhas = gerar_arquivo(
+            str(path), tamanho_mb=0.1, quebra_linha=quebra_linha
+        )
+
+        for motor in ["posicional", "numpy"]:
+            parser = parse(path, motor=motor)
+            assert parser.verificar_registros()
+            assert parser.num_registros == num_linhas
+            assert len(parser.cod_papel) == num_linhas - 2
+            assert set(parser.tp_merc) == {"010", "020", "070", "080"}
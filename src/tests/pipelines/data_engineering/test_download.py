@@ -0,0 +1,121 @@
+import hashlib
+import json
+from urllib.error import HTTPError
+
+import pytest
+
+from ml_invest.pipelines.data_engineering.download import (
+    ConnectionPool, DownloadCache, fetch_all)
+
+
+class TestFetchAll:
+    def test_downloads_every_url(self, b3_stand_in):
+        b3_stand_in.files = {f"/COTAHIST_A{year}.ZIP": bytes([year % 256]) * 1000
+                             for year in range(2000, 2010)}
+        urls = {f"year={year}": f"{b3_stand_in.url}COTAHIST_A{year}.ZIP"
+                for year in range(2000, 2010)}
+
+        downloaded = dict(fetch_all(urls, max_connections=3))
+
+        assert downloaded == {f"year={year}": bytes([year % 256]) * 1000
+                              for year in range(2000, 2010)}
+
+    def test_reuses_connections(self, b3_stand_in):
+        b3_stand_in.files = {"/a.ZIP": b"a", "/b.ZIP": b"b", "/c.ZIP": b"c"}
+        urls = {name: f"{b3_stand_in.url}{name}.ZIP" for name in "abc"}
+
+        assert dict(fetch_all(urls, max_connections=1)) == {
+            "a": b"a", "b": b"b", "c": b"c"
+        }
+        assert b3_stand_in.connections == 1
+
+    def test_raises_on_missing_file(self, b3_stand_in):
+        with pytest.raises(HTTPError):
+            dict(fetch_all({"year=1900": f"{b3_stand_in.url}missing.ZIP"}))
+
+
+class TestDownloadCache:
+    def test_unchanged_file_is_not_downloaded_again(self, b3_stand_in, tmp_path):
+        b3_stand_in.files = {"/COTAHIST_A2020.ZIP": b"x" * 5000}
+        url = f"{b3_stand_in.url}COTAHIST_A2020.ZIP"
+        cache = DownloadCache(str(tmp_path / "cache"))
+
+        assert dict(fetch_all({"year=2020": url}, cache=cache)) == {
+            "year=2020": b"x" * 5000
+        }
+        assert dict(fetch_all({"year=2020": url}, cache=cache)) == {
+            "year=2020": b"x" * 5000
+        }
+
+        assert "If-None-Match" in b3_stand_in.requests[-1][2]
+        assert cache.metadata(url)["content_length"] == 5000
+        assert cache.load(url) == b"x" * 5000
+
+    def test_changed_file_replaces_cached_copy(self, b3_stand_in, tmp_path):
+        b3_stand_in.files = {"/COTAHIST_A2020.ZIP": b"old"}
+        url = f"{b3_stand_in.url}COTAHIST_A2020.ZIP"
+        cache = DownloadCache(str(tmp_path / "cache"))
+        dict(fetch_all({"year=2020": url}, cache=cache))
+
+        b3_stand_in.files = {"/COTAHIST_A2020.ZIP": b"new"}
+        assert dict(fetch_all({"year=2020": url}, cache=cache)) == {
+            "year=2020": b"new"
+        }
+        assert len(list((tmp_path / "cache" / "objects").iterdir())) == 1
+
+    def test_interrupted_transfer_is_resumed(self, b3_stand_in, tmp_path):
+        body = bytes(range(256)) * 100
+        b3_stand_in.files = {"/COTAHIST_A2020.ZIP": body}
+        b3_stand_in.truncate = {"/COTAHIST_A2020.ZIP": 10000}
+        url = f"{b3_stand_in.url}COTAHIST_A2020.ZIP"
+        cache = DownloadCache(str(tmp_path / "cache"))
+
+        assert dict(fetch_all({"year=2020": url}, cache=cache)) == {
+            "year=2020": body
+        }
+        assert b3_stand_in.requests[-1][2]["Range"] == "bytes=10000-"
+
+    def test_timed_out_transfer_is_resumed(self, b3_stand_in, tmp_path):
+        body = bytes(range(256)) * 100
+        b3_stand_in.files = {"/COTAHIST_A2020.ZIP": body}
+        b3_stand_in.stall = {"/COTAHIST_A2020.ZIP": 10000}
+        url = f"{b3_stand_in.url}COTAHIST_A2020.ZIP"
+        cache = DownloadCache(str(tmp_path / "cache"))
+
+        assert cache.fetch(ConnectionPool(timeout=0.2), url) == body
+        assert b3_stand_in.requests[-1][2]["Range"] == "bytes=10000-"
+
+    def test_missing_file_is_not_retried(self, b3_stand_in, tmp_path):
+        cache = DownloadCache(str(tmp_path / "cache"))
+
+        with pytest.raises(HTTPError):
+            cache.fetch(ConnectionPool(), f"{b3_stand_in.url}missing.ZIP")
+        assert len(b3_stand_in.requests) == 1
+
+    @pytest.mark.parametrize("partial", [
+        pytest.param(b"", id="complete"),
+        pytest.param(b"garbage", id="too-long"),
+    ])
+    def test_range_not_satisfiable(self, b3_stand_in, tmp_path, partial):
+        body = bytes(range(256)) * 100
+        b3_stand_in.files = {"/COTAHIST_A2020.ZIP": body}
+        url = f"{b3_stand_in.url}COTAHIST_A2020.ZIP"
+        cache = DownloadCache(str(tmp_path / "cache"))
+        # A transfer interrupted after the last byte arrived
+        etag = '"%s"' % hashlib.sha256(body).hexdigest()
+        partial_path = tmp_path / "cache" / "partial" / cache._url_key(url)
+        partial_path.write_bytes(body + partial)
+        partial_path.with_suffix(".json").write_text(json.dumps(
+            {"etag": etag, "last_modified": None, "content_length": len(body)}))
+
+        assert cache.fetch(ConnectionPool(), url) == body
+        assert cache.load(url) == body
+        assert list((tmp_path / "cache" / "partial").iterdir()) == []
+        assert b3_stand_in.requests[0][2]["Range"] == \
+            f"bytes={len(body + partial)}-"
+        if partial:
+            # Downloaded again, without Range
+            assert len(b3_stand_in.requests) == 2
+            assert "Range" not in b3_stand_in.requests[1][2]
+        else:
+            assert len(b3_stand_in.requests) == 1
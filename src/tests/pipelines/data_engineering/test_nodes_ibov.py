@@ -0,0 +1,160 @@
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+from ml_invest.io import WatermarkedCSVDataSet
+from ml_invest.pipelines.data_engineering.nodes_ibov import (
+    agg_ibov_csv,
+    data_to_csv,
+    get_ibov_data,
+    get_ibov_url,
+    get_missing_days,
+    get_partition_year,
+    get_todays_date,
+    parse_zip,
+    update_if_outdated,
+)
+
+
+class TestParseZip:
+    def test_parses_members_without_extracting(self, tmp_path, zipped_cotahist):
+        frames = list(parse_zip(zipped_cotahist))
+
+        assert len(frames) == 1
+        df = frames[0]
+        assert list(df.cod_papel) == ["PETR4", "VALE3", "PETRA30", "PETR4"]
+        assert df.data_pregao.iloc[-1] == pd.Timestamp("2020-01-03")
+        assert df.preco_ultimo.tolist() == [30.8] * 4
+        assert list(tmp_path.glob("*.csv")) == []
+
+    def test_parses_members_in_batches(self, zipped_cotahist):
+        batches = list(parse_zip(zipped_cotahist, {"tamanho_lote": 2}))
+
+        assert [len(batch) for batch in batches] == [1, 2, 1]
+        assert pd.concat(batches).cod_papel.tolist() == [
+            "PETR4", "VALE3", "PETRA30", "PETR4"]
+
+
+class TestDataToCsv:
+    def test_builds_dataframe_without_temp_csv(self, cotahist_file):
+        df = data_to_csv(cotahist_file.name, str(cotahist_file.parent))
+
+        assert df.shape == (4, 25)
+        assert df.fator_cotacao.tolist() == [1, 1, 1, 1000]
+        assert not (cotahist_file.parent / "temp.csv").exists()
+
+
+class TestGetIbovData:
+    def test_downloads_and_parses_partitions(self, b3_stand_in, zipped_cotahist):
+        b3_stand_in.files = {"/COTAHIST_A2020.ZIP": zipped_cotahist}
+        ibov_link = {"file": "COTAHIST_A", "url": b3_stand_in.url}
+        ibov_urls = {"year=2020": get_ibov_url("2020", ibov_link)}
+
+        data = get_ibov_data(ibov_urls, get_todays_date(), ibov_link,
+                             {"motor": "numpy"}, {"max_connections": 2})
+
+        assert list(data) == ["year=2020"]
+        assert pd.concat(data["year=2020"]()).shape == (4, 25)
+
+    def test_years_do_not_share_rows(self, b3_stand_in, zipped_cotahist):
+        b3_stand_in.files = {f"/COTAHIST_A{year}.ZIP": zipped_cotahist
+                             for year in (2019, 2020)}
+        ibov_link = {"file": "COTAHIST_A", "url": b3_stand_in.url}
+        ibov_urls = {f"year={year}": get_ibov_url(str(year), ibov_link)
+                     for year in (2019, 2020)}
+
+        data = get_ibov_data(ibov_urls, get_todays_date(), ibov_link)
+
+        assert pd.concat(data["year=2019"]()).shape == (4, 25)
+        assert pd.concat(data["year=2020"]()).shape == (4, 25)
+
+    def test_partitions_are_streamed_to_the_writer(self, b3_stand_in,
+                                                   zipped_cotahist, tmp_path):
+        b3_stand_in.files = {"/COTAHIST_A2020.ZIP": zipped_cotahist}
+        ibov_link = {"file": "COTAHIST_A", "url": b3_stand_in.url}
+        ibov_urls = {"year=2020": get_ibov_url("2020", ibov_link)}
+
+        data = get_ibov_data(ibov_urls, get_todays_date(), ibov_link,
+                             {"tamanho_lote": 2, "num_processos": 2})
+        ibov_csv = WatermarkedCSVDataSet(path=str(tmp_path / "ibov_csv"))
+        ibov_csv.save(data)
+
+        saved = ibov_csv.load()["year=2020"]()
+        assert saved.cod_papel.tolist() == ["PETR4", "VALE3", "PETRA30",
+                                            "PETR4"]
+
+    def test_small_gap_uses_daily_files(self, b3_stand_in, zipped_cotahist):
+        ibov_link = {"file": "COTAHIST_A", "daily_file": "COTAHIST_D",
+                     "url": b3_stand_in.url}
+        last_updated = (datetime.now() - timedelta(days=6)).strftime("%Y-%m-%d")
+        days = get_missing_days(last_updated, datetime.now())
+        # Only the first day was published, the others are "holidays"
+        published = days[0]
+        b3_stand_in.files = {
+            f"/COTAHIST_D{published.strftime('%d%m%Y')}.ZIP": zipped_cotahist
+        }
+
+        data = get_ibov_data({}, last_updated, ibov_link, {},
+                             {"max_daily_files": 10})
+
+        partition = f"year={published.year}/day={published.strftime('%Y-%m-%d')}"
+        assert list(data) == [partition]
+        assert len(b3_stand_in.requests) == len(days)
+        assert get_partition_year(partition) == published.year
+
+
+class TestUpdateIfOutdated:
+    ibov_link = {"file": "COTAHIST_A", "daily_file": "COTAHIST_D",
+                 "url": "http://b3/"}
+
+    def test_large_gap_uses_annual_file(self):
+        last_updated = (datetime.now() - timedelta(days=60)).strftime("%Y-%m-%d")
+        year = datetime.now().strftime("%Y")
+
+        urls = update_if_outdated(last_updated, {}, self.ibov_link, 20)
+
+        assert urls == {f"year={year}": f"http://b3/COTAHIST_A{year}.ZIP"}
+
+    def test_up_to_date(self):
+        assert update_if_outdated(get_todays_date(), {}, self.ibov_link, 20) == {}
+
+    def test_missing_days_are_weekdays(self):
+        days = get_missing_days("2020-07-10", datetime(2020, 7, 14))
+        assert days == [datetime(2020, 7, 10), datetime(2020, 7, 13),
+                        datetime(2020, 7, 14)]
+
+
+class TestAggIbovCsv:
+    def test_reads_only_rows_since_last_update(self, tmp_path, cotahist_file):
+        ibov_csv = WatermarkedCSVDataSet(path=str(tmp_path / "ibov_csv"))
+        ibov_csv.save({
+            "year=2019": pd.DataFrame({"data_pregao": ["2019-12-30"],
+                                       "cod_papel": ["PETR4"],
+                                       "preco_ultimo": [30.5],
+                                       "num_negocios": [10]}),
+            "year=2020": data_to_csv(cotahist_file.name,
+                                     str(cotahist_file.parent)),
+        })
+
+        data, updated = agg_ibov_csv(ibov_csv.load(), "2020-01-03")
+
+        assert list(data.columns) == ["data_pregao", "cod_papel",
+                                      "preco_ultimo", "num_negocios"]
+        assert (data.data_pregao >= "2020-01-03").all() and len(data)
+        assert updated == get_todays_date()
+
+    def test_dates_are_passed_on_as_text(self, tmp_path, cotahist_file):
+        ibov_csv = WatermarkedCSVDataSet(path=str(tmp_path / "ibov_csv"))
+        typed = data_to_csv(cotahist_file.name, str(cotahist_file.parent))
+        assert typed.data_pregao.dtype == "datetime64[ns]"
+        ibov_csv.save({"year=2020": typed})
+        # Written before the parser typed its dates
+        pd.DataFrame({"data_pregao": ["2021-01-04 00:00:00"],
+                      "cod_papel": ["PETR4"], "preco_ultimo": [28.9],
+                      "num_negocios": [12]}).to_csv(
+            tmp_path / "ibov_csv" / "year=2021.csv", index=False)
+
+        data, _ = agg_ibov_csv(ibov_csv.load(), "2020-01-03")
+
+        assert data.data_pregao.tolist() == ["2020-01-03", "2020-01-03",
+                                             "2021-01-04"]
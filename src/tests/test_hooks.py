@@ -0,0 +1,117 @@
+import json
+import logging
+
+import pandas as pd
+import pytest
+from kedro.io import DataCatalog, MemoryDataSet
+from kedro.pipeline import Pipeline, node
+
+from ml_invest.hooks import (
+    DatasetLatencyTransformer,
+    InstrumentationHooks,
+    count_rows,
+    memory_bytes,
+)
+
+
+def identity(data):
+    return data
+
+
+@pytest.fixture
+def hooks():
+    hooks = InstrumentationHooks(interval=0.01)
+    hooks.before_pipeline_run({"run_id": "run-1"})
+    return hooks
+
+
+@pytest.fixture
+def data():
+    return pd.DataFrame({"cod_papel": ["PETR4", "VALE3"], "preco_ultimo": [30.8, 50.1]})
+
+
+class TestInstrumentationHooks:
+    def test_measures_nodes(self, hooks, data):
+        parse = node(identity, "ibov_csv", "ibov_dataset", name="parse")
+
+        hooks.before_node_run(parse, {"ibov_csv": {"year=2020": data},
+                                      "params:ibov_parser": {"motor": "numpy"}})
+        hooks.after_node_run(parse, {"ibov_dataset": pd.concat([data, data])})
+
+        record = hooks.nodes[0]
+        assert record["node"] == "parse"
+        assert record["wall_s"] >= 0 and record["cpu_s"] >= 0
+        assert record["peak_rss_bytes"] > 0
+        assert (record["rows_in"], record["rows_out"]) == (2, 4)
+        assert record["memory_bytes_in"] > 0 and record["memory_bytes_out"] > 0
+
+    def test_measures_dataset_latency(self, hooks, data):
+        # As the runner calls the dataset hooks
+        hooks.before_dataset_saved("ibov_dataset")
+        hooks.after_dataset_saved("ibov_dataset", data)
+        hooks.before_dataset_loaded("ibov_dataset")
+        hooks.after_dataset_loaded("ibov_dataset", data)
+        hooks.before_dataset_loaded("params:ibov_parser")
+        hooks.after_dataset_loaded("params:ibov_parser", {})
+
+        assert [(r["dataset"], r["operation"], r["rows"])
+                for r in hooks.datasets] == [("ibov_dataset", "save", 2),
+                                             ("ibov_dataset", "load", 2)]
+        assert all(r["seconds"] >= 0 for r in hooks.datasets)
+
+    def test_transformer_measures_dataset_latency(self, hooks, data):
+        transformer = DatasetLatencyTransformer(hooks._dataset_done)
+        catalog = DataCatalog({"ibov_dataset": MemoryDataSet()})
+
+        transformer.save("ibov_dataset",
+                         lambda d: catalog.save("ibov_dataset", d), data)
+        transformer.load("ibov_dataset", lambda: catalog.load("ibov_dataset"))
+
+        assert [(r["dataset"], r["operation"], r["rows"])
+                for r in hooks.datasets] == [("ibov_dataset", "save", 2),
+                                             ("ibov_dataset", "load", 2)]
+
+    def test_hooks_match_the_kedro_specs(self):
+        try:
+            from kedro.framework.hooks.manager import _create_hook_manager
+            hook_manager = _create_hook_manager()
+        except ImportError:  # kedro < 0.18
+            from kedro.framework.hooks import get_hook_manager
+            hook_manager = get_hook_manager()
+
+        instrumentation = InstrumentationHooks()
+        # Raises PluginValidationError on arguments kedro does not pass
+        hook_manager.register(instrumentation)
+        hook_manager.unregister(instrumentation)
+
+    def test_writes_the_journal_and_a_summary(self, hooks, data, caplog):
+        parse = node(identity, "ibov_csv", "ibov_dataset", name="parse")
+        caplog.set_level(logging.INFO)
+
+        hooks.before_node_run(parse, {"ibov_csv": data})
+        hooks.after_node_run(parse, {"ibov_dataset": data})
+        hooks.after_pipeline_run(Pipeline([parse]))
+
+        journal = [json.loads(r.getMessage()) for r in caplog.records
+                   if r.name == "kedro.journal"]
+        assert [r["type"] for r in journal] == ["NodeMetricsRecord",
+                                                "PipelineMetricsRecord"]
+        assert all(r["run_id"] == "run-1" for r in journal)
+        assert "parse" in hooks.summary()
+
+    def test_failed_nodes_are_not_recorded(self, hooks, data):
+        parse = node(identity, "ibov_csv", "ibov_dataset", name="parse")
+
+        hooks.before_node_run(parse, {"ibov_csv": data})
+        hooks.on_node_error(parse)
+        hooks.after_node_run(parse, {"ibov_dataset": data})
+
+        assert hooks.nodes == []
+
+
+def test_counts_partitions():
+    data = pd.DataFrame({"x": [1, 2, 3]})
+
+    assert count_rows({"year=2019": data, "year=2020": data}) == 6
+    assert count_rows({"year=2020": data.copy}) is None
+    assert memory_bytes([data, b"1234"]) == data.memory_usage().sum() + 4